@@ -0,0 +1,226 @@
+import argparse
+import os
+import sys
+
+from sorveteria_backend import SorveteriaBackend
+from sorveteria_backup import arquivos_do_snapshot, fazer_snapshot, listar_snapshots, verificar
+from sorveteria_exportacao import FORMATOS, exportar, exportar_incremental
+from sorveteria_importacao import ImportadorLote, ler_linhas
+
+
+def comando_consultas(backend: SorveteriaBackend, args) -> int:
+    """Mostra o plano de cada consulta e falha se alguma voltou a varrer a tabela inteira"""
+    for nome, plano in backend.explicar_consultas().items():
+        print(nome)
+        for detalhe in plano:
+            print(f"    {detalhe}")
+
+    suspeitas = backend.consultas_com_varredura()
+    if suspeitas:
+        print(f"\nConsultas com varredura completa: {', '.join(suspeitas)}")
+        return 1
+    return 0
+
+
+def comando_reconstruir_resumo(backend: SorveteriaBackend, args) -> int:
+    """Recalcula os totais diários do painel a partir do histórico"""
+    if not backend.reconstruir_resumo_diario():
+        return 1
+    dias = backend.conn.execute("SELECT COUNT(*) FROM ResumoDiario").fetchone()[0]
+    print(f"Resumo diário reconstruído: {dias} dias")
+    return 0
+
+
+def comando_importar(backend: SorveteriaBackend, args) -> int:
+    """Importa produtos ou vendas históricas de um arquivo CSV/JSONL"""
+    importador = ImportadorLote(backend, tamanho_lote=args.lote, adiar_indices=args.adiar_indices)
+    linhas = ler_linhas(args.arquivo, args.formato, args.separador)
+    if args.tipo == "produtos":
+        resultado = importador.importar_produtos(linhas)
+    else:
+        resultado = importador.importar_vendas(linhas)
+
+    for numero, motivo in importador.rejeitadas[:args.mostrar_rejeitadas]:
+        print(f"Linha {numero} rejeitada: {motivo}")
+    if len(importador.rejeitadas) > args.mostrar_rejeitadas:
+        print(f"... e mais {len(importador.rejeitadas) - args.mostrar_rejeitadas} linhas rejeitadas")
+    print(f"{resultado['importadas']} de {resultado['lidas']} linhas importadas em {resultado['segundos']} s "
+          f"({resultado['linhas_por_segundo']} linhas/s), {resultado['rejeitadas']} rejeitadas")
+    return 1 if importador.rejeitadas else 0
+
+
+def comando_exportar(backend: SorveteriaBackend, args) -> int:
+    """Exporta vendas ou despesas em fluxo, sem carregar o histórico em memória"""
+    tabela = {"vendas": "Venda", "despesas": "Despesa"}[args.tipo]
+    opcoes = dict(formato=args.formato, data_inicio=args.inicio, data_fim=args.fim, status=args.status,
+                  compactar=args.gzip, tamanho_lote=args.lote)
+    try:
+        if args.estado:
+            resultado, _ = exportar_incremental(backend, tabela, args.destino, args.estado, **opcoes)
+        else:
+            resultado = exportar(backend, tabela, args.destino, **opcoes)
+    except (RuntimeError, ValueError) as e:
+        print(f"Erro ao exportar: {e}")
+        return 1
+    print(f"{resultado['linhas']} linhas de {tabela} exportadas para {resultado['destino']} "
+          f"(último código: {resultado['ultimo_codigo']})")
+    return 0
+
+
+def comando_snapshot_estoque(backend: SorveteriaBackend, args) -> int:
+    """Fotografa o estoque atual; rodar periodicamente (ex.: todo dia, pelo cron) encurta o replay do livro"""
+    print(f"Estoque de {backend.criar_snapshot_estoque()} produtos fotografado")
+    return 0
+
+
+def comando_estoque_em(backend: SorveteriaBackend, args) -> int:
+    """Mostra o estoque de cada produto num momento passado, a partir das fotografias e do livro"""
+    for codigo, quantidade in sorted(backend.estoque_em(args.momento).items()):
+        print(f"{codigo}: {quantidade}")
+    return 0
+
+
+def comando_reconciliar_estoque(backend: SorveteriaBackend, args) -> int:
+    """Confere se Estoque bate com a última fotografia mais os movimentos do livro"""
+    divergencias = backend.reconciliar_estoque()
+    for divergencia in divergencias:
+        print(f"Produto {divergencia['codigo_produto']}: estoque {divergencia['estoque']}, "
+              f"livro {divergencia['livro']} (diferença {divergencia['diferenca']:+})")
+    if divergencias:
+        return 1
+    print("Estoque conferido com o livro de movimentos")
+    return 0
+
+
+def comando_previsao_estoque(backend: SorveteriaBackend, args) -> int:
+    """Mostra em quantos dias o estoque de cada produto acaba no ritmo de venda recente"""
+    if args.alertas:
+        previsoes = backend.alertas_estoque(args.dias_reposicao)
+    else:
+        previsoes = backend.prever_ruptura(args.janela)
+    for previsao in previsoes:
+        dias = (f"{previsao['media_diaria']:g}/dia, acaba em {previsao['dias_ate_acabar']:g} dias "
+                f"({previsao['data_ruptura']})" if previsao['dias_ate_acabar'] is not None else "sem vendas na janela")
+        print(f"{previsao['codigo']} - {previsao['nome']}: estoque {previsao['quantidade']} "
+              f"(mínimo {previsao['estoque_minimo']}), {dias}")
+    if args.alertas and previsoes:
+        return 1  # Para o cron avisar quando há o que repor
+    return 0
+
+
+def comando_arquivar_vendas(backend: SorveteriaBackend, args) -> int:
+    """Move as vendas finalizadas antigas para os arquivos anuais, ao lado do banco, e apaga os dias
+    que a previsão de ruptura não usa mais; rodar fora do expediente (ex.: toda noite, pelo cron)"""
+    movidas = backend.arquivar_vendas(dias=args.dias, antes_de=args.antes_de)
+    for ano, quantidade in movidas.items():
+        print(f"{ano}: {quantidade} vendas arquivadas")
+    if not movidas:
+        print("Nenhuma venda a arquivar")
+    print(f"{backend.podar_vendas_diarias()} linhas antigas de vendas diárias por produto apagadas")
+    return 0
+
+
+def comando_backup(backend: SorveteriaBackend, args) -> int:
+    """Fotografa o banco em uso (o caixa pode continuar vendendo), confere, compacta e faz a rotação"""
+    resultado = fazer_snapshot(args.db, args.pasta, compactar=not args.sem_compactar,
+                               horarios=args.horarios, diarios=args.diarios)
+    if not resultado["ok"]:
+        return 1
+    print(f"Backup em {resultado['destino']}: {resultado['paginas']} páginas em {resultado['duracao_s']} s, "
+          f"{resultado['bytes_banco']} -> {resultado['bytes_arquivo']} bytes")
+    for nome in resultado["arquivos"]:
+        print(f"Arquivo de vendas copiado: {nome}")
+    for nome in resultado["removidos"]:
+        print(f"Removido pela rotação: {nome}")
+    return 0
+
+
+def comando_verificar_backups(backend: SorveteriaBackend, args) -> int:
+    """Roda o integrity_check em cada fotografia da pasta e nas cópias dos arquivos de vendas dela"""
+    falhas = 0
+    for momento, caminho in listar_snapshots(args.pasta):
+        for copia in [caminho] + arquivos_do_snapshot(caminho):
+            erros = verificar(copia)
+            falhas += bool(erros)
+            print(f"{os.path.basename(copia)}: {'; '.join(erros[:5]) if erros else 'ok'}")
+    return 1 if falhas else 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Ferramentas de manutenção da Sorveteria")
+    parser.add_argument("--db", default="sorveteria.db", help="arquivo do banco de dados")
+    subparsers = parser.add_subparsers(dest="comando", required=True)
+
+    subparsers.add_parser("consultas", help="mostra o EXPLAIN QUERY PLAN das consultas do backend")
+    subparsers.add_parser("reconstruir-resumo", help="recalcula a tabela ResumoDiario a partir do histórico")
+
+    importar = subparsers.add_parser("importar", help="importa produtos ou vendas históricas de CSV/JSONL")
+    importar.add_argument("tipo", choices=["produtos", "vendas"])
+    importar.add_argument("arquivo")
+    importar.add_argument("--formato", choices=["csv", "jsonl"], help="padrão: pela extensão do arquivo")
+    importar.add_argument("--separador", default=",", help="separador de campos do CSV")
+    importar.add_argument("--lote", type=int, default=5000, help="linhas por transação")
+    importar.add_argument("--adiar-indices", action="store_true",
+                          help="remove os índices de Venda durante a importação e os recria no fim "
+                               "(carga inicial, com o banco fora de uso)")
+    importar.add_argument("--mostrar-rejeitadas", type=int, default=20)
+
+    exportar_parser = subparsers.add_parser("exportar", help="exporta vendas ou despesas para CSV/JSONL/colunar")
+    exportar_parser.add_argument("tipo", choices=["vendas", "despesas"])
+    exportar_parser.add_argument("destino")
+    exportar_parser.add_argument("--formato", choices=FORMATOS, default="csv")
+    exportar_parser.add_argument("--inicio", help="data inicial (AAAA-MM-DD)")
+    exportar_parser.add_argument("--fim", help="data final (AAAA-MM-DD)")
+    exportar_parser.add_argument("--status", choices=["aberta", "finalizada"], help="só vendas com este status")
+    exportar_parser.add_argument("--gzip", action="store_true", help="compacta a saída")
+    exportar_parser.add_argument("--lote", type=int, default=1000, help="linhas lidas por fetchmany")
+    exportar_parser.add_argument("--estado", help="arquivo JSON com o último código exportado (modo incremental; "
+                                                  "vendas só finalizadas)")
+
+    subparsers.add_parser("snapshot-estoque", help="fotografa o estoque atual de todos os produtos")
+    estoque_em = subparsers.add_parser("estoque-em", help="estoque de cada produto num momento passado")
+    estoque_em.add_argument("momento", help="AAAA-MM-DD (fim do dia) ou 'AAAA-MM-DD HH:MM:SS'")
+    subparsers.add_parser("reconciliar-estoque", help="confere Estoque contra o livro de movimentos")
+
+    previsao = subparsers.add_parser("previsao-estoque", help="dias até acabar o estoque de cada produto")
+    previsao.add_argument("--janela", type=int, help=f"dias de vendas na média (padrão: {SorveteriaBackend.JANELA_PREVISAO})")
+    previsao.add_argument("--alertas", action="store_true",
+                          help="só os abaixo do mínimo ou que acabam antes da reposição (sai com 1 se houver)")
+    previsao.add_argument("--dias-reposicao", type=int,
+                          help=f"prazo de reposição dos alertas (padrão: {SorveteriaBackend.DIAS_REPOSICAO})")
+
+    arquivar = subparsers.add_parser("arquivar-vendas", help="move vendas finalizadas antigas para arquivos anuais e poda as vendas diárias")
+    arquivar.add_argument("--dias", type=int, help=f"idade mínima em dias (padrão: {SorveteriaBackend.DIAS_SEM_ARQUIVAR})")
+    arquivar.add_argument("--antes-de", help="ou uma data de corte (AAAA-MM-DD)")
+
+    backup = subparsers.add_parser("backup", help="fotografa o banco sem parar o caixa, com rotação")
+    backup.add_argument("pasta", nargs="?", default="backups")
+    backup.add_argument("--sem-compactar", action="store_true", help="guarda o .db sem gzip")
+    backup.add_argument("--horarios", type=int, default=24, help="horas com uma fotografia mantida")
+    backup.add_argument("--diarios", type=int, default=30, help="dias com uma fotografia mantida")
+    verificar_backups = subparsers.add_parser("verificar-backups", help="integrity_check em cada fotografia")
+    verificar_backups.add_argument("pasta", nargs="?", default="backups")
+
+    args = parser.parse_args(argv)
+    backend = SorveteriaBackend(args.db)
+    if backend.indices_recriados:
+        print(f"Índices recriados: {', '.join(backend.indices_recriados)}")
+
+    comandos = {
+        "consultas": comando_consultas,
+        "reconstruir-resumo": comando_reconstruir_resumo,
+        "importar": comando_importar,
+        "exportar": comando_exportar,
+        "snapshot-estoque": comando_snapshot_estoque,
+        "estoque-em": comando_estoque_em,
+        "reconciliar-estoque": comando_reconciliar_estoque,
+        "previsao-estoque": comando_previsao_estoque,
+        "arquivar-vendas": comando_arquivar_vendas,
+        "backup": comando_backup,
+        "verificar-backups": comando_verificar_backups,
+    }
+    return comandos[args.comando](backend, args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,192 @@
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from sorveteria_backend import SorveteriaBackend
+
+DIAS_SEMANA = ["seg", "ter", "qua", "qui", "sex", "sáb", "dom"]
+
+# Dias desde 1970-01-01 (uma quinta-feira) -> 0 = segunda
+_DESLOCAMENTO_SEGUNDA = 3
+
+
+class VendasPeriodo:
+    """Colunas das vendas de um período em arrays NumPy, uma posição por venda"""
+
+    def __init__(self, inicio: str, fim: str, produto: np.ndarray, quantidade: np.ndarray, valor: np.ndarray,
+                 dia: np.ndarray, hora: np.ndarray, promocao: np.ndarray, nomes: Dict[int, str]):
+        self.inicio = inicio
+        self.fim = fim
+        self.produto = produto        # Código do produto
+        self.quantidade = quantidade
+        self.valor = valor            # valor_total, já com desconto
+        self.dia = dia                # Dias desde 1970-01-01
+        self.hora = hora              # 0 a 23
+        self.promocao = promocao      # Código da promoção, 0 quando não houve
+        self.nomes = nomes            # Nome atual de cada produto
+
+    def __len__(self) -> int:
+        return len(self.valor)
+
+    @property
+    def dia_semana(self) -> np.ndarray:
+        return (self.dia + _DESLOCAMENTO_SEGUNDA) % 7
+
+
+def carregar_vendas(backend: SorveteriaBackend, inicio: str, fim: str, status: str = 'finalizada',
+                    tamanho_bloco: int = 100_000) -> VendasPeriodo:
+    """Lê numa só consulta as vendas de `inicio` a `fim` (AAAA-MM-DD, inclusive) para arrays.
+
+    O índice idx_venda_periodo cobre todas as colunas lidas, então a consulta não toca a tabela.
+    Períodos que alcançam vendas arquivadas leem também os arquivos anuais delas.
+    """
+    cursor = backend._cursor_vendas_periodo(inicio, fim, status)
+    # Em blocos, para não manter um milhão de tuplas Python vivas ao mesmo tempo
+    blocos = [np.empty((0, 6))]
+    while True:
+        linhas = cursor.fetchmany(tamanho_bloco)
+        if not linhas:
+            break
+        blocos.append(np.array(linhas, dtype=np.float64))
+    colunas = np.concatenate(blocos).T
+
+    produto = colunas[0].astype(np.int64)
+    codigos = np.unique(produto).tolist()
+    nomes = {}
+    if codigos:
+        marcadores = ", ".join("?" for _ in codigos)
+        cursor.execute(f"SELECT codigo, nome FROM Produto WHERE codigo IN ({marcadores})", codigos)
+        nomes = dict(cursor.fetchall())
+    cursor.close()
+
+    return VendasPeriodo(inicio, fim, produto, colunas[1], colunas[2], colunas[3].astype(np.int64),
+                         colunas[4].astype(np.int64), colunas[5].astype(np.int64), nomes)
+
+
+def _agrupar(chaves: np.ndarray, valores: np.ndarray, quantidades: np.ndarray):
+    """Group-by vetorizado: (chaves distintas, soma de valores, soma de quantidades, número de vendas)"""
+    distintas, posicoes = np.unique(chaves, return_inverse=True)
+    return (distintas,
+            np.bincount(posicoes, weights=valores, minlength=len(distintas)),
+            np.bincount(posicoes, weights=quantidades, minlength=len(distintas)),
+            np.bincount(posicoes, minlength=len(distintas)))
+
+
+def _dia_para_texto(dia: int) -> str:
+    return str(date(1970, 1, 1) + timedelta(days=int(dia)))
+
+
+def _texto_para_dia(texto: str) -> int:
+    return (datetime.strptime(texto, "%Y-%m-%d").date() - date(1970, 1, 1)).days
+
+
+def resumo(vendas: VendasPeriodo) -> Dict[str, float]:
+    """Receita, número de vendas, unidades e ticket médio (receita por venda registrada)"""
+    quantidade_vendas = len(vendas)
+    receita = float(vendas.valor.sum())
+    return {
+        "receita": round(receita, 2),
+        "vendas": quantidade_vendas,
+        "unidades": int(vendas.quantidade.sum()),
+        "ticket_medio": round(receita / quantidade_vendas, 2) if quantidade_vendas else 0.0,
+    }
+
+
+def por_hora(vendas: VendasPeriodo) -> List[Dict]:
+    """Receita e vendas por hora do dia (24 linhas)"""
+    receita = np.bincount(vendas.hora, weights=vendas.valor, minlength=24)
+    contagem = np.bincount(vendas.hora, minlength=24)
+    return [{"hora": hora, "receita": round(float(receita[hora]), 2), "vendas": int(contagem[hora])}
+            for hora in range(24)]
+
+
+def mapa_calor(vendas: VendasPeriodo) -> Dict[str, List]:
+    """Receita por dia da semana x hora: 7 linhas (seg a dom) de 24 colunas"""
+    celulas = vendas.dia_semana * 24 + vendas.hora
+    receita = np.bincount(celulas, weights=vendas.valor, minlength=7 * 24).reshape(7, 24)
+    return {"dias": DIAS_SEMANA, "horas": list(range(24)), "receita": np.round(receita, 2).tolist()}
+
+
+def por_dia_semana(vendas: VendasPeriodo) -> List[Dict]:
+    receita = np.bincount(vendas.dia_semana, weights=vendas.valor, minlength=7)
+    contagem = np.bincount(vendas.dia_semana, minlength=7)
+    return [{"dia": DIAS_SEMANA[dia], "receita": round(float(receita[dia]), 2), "vendas": int(contagem[dia])}
+            for dia in range(7)]
+
+
+def mais_vendidos(vendas: VendasPeriodo, limite: int = 10, por: str = "receita") -> List[Dict]:
+    """Produtos ordenados por receita (ou por unidades), do maior para o menor"""
+    codigos, receita, unidades, contagem = _agrupar(vendas.produto, vendas.valor, vendas.quantidade)
+    ordem = np.argsort(-(receita if por == "receita" else unidades), kind="stable")[:limite]
+    return [{
+        "codigo_produto": int(codigos[i]),
+        "nome": vendas.nomes.get(int(codigos[i]), ""),
+        "receita": round(float(receita[i]), 2),
+        "unidades": int(unidades[i]),
+        "vendas": int(contagem[i]),
+    } for i in ordem]
+
+
+def por_promocao(vendas: VendasPeriodo) -> List[Dict]:
+    """Receita e vendas por promoção; codigo_promocao None agrupa as vendas sem desconto"""
+    codigos, receita, unidades, contagem = _agrupar(vendas.promocao, vendas.valor, vendas.quantidade)
+    return [{
+        "codigo_promocao": int(codigo) or None,
+        "receita": round(float(receita[i]), 2),
+        "unidades": int(unidades[i]),
+        "vendas": int(contagem[i]),
+    } for i, codigo in enumerate(codigos)]
+
+
+def por_semana(vendas: VendasPeriodo) -> List[Dict]:
+    """Receita por semana do período, contada em blocos de 7 dias a partir do fim (a última é a mais recente)"""
+    fim = _texto_para_dia(vendas.fim)
+    semanas = (fim - _texto_para_dia(vendas.inicio)) // 7 + 1
+    atras = (fim - vendas.dia) // 7               # 0 = os 7 dias que terminam em `fim`
+    receita = np.bincount(atras, weights=vendas.valor, minlength=semanas)[:semanas][::-1]
+    contagem = np.bincount(atras, minlength=semanas)[:semanas][::-1]
+    return [{
+        "inicio": _dia_para_texto(fim - 7 * (semanas - i) + 1),
+        "fim": _dia_para_texto(fim - 7 * (semanas - 1 - i)),
+        "receita": round(float(receita[i]), 2),
+        "vendas": int(contagem[i]),
+    } for i in range(semanas)]
+
+
+def comparar_semanas(vendas: VendasPeriodo) -> Dict[str, Optional[float]]:
+    """Últimos 7 dias do período contra os 7 anteriores"""
+    semanas = por_semana(vendas)
+    atual = semanas[-1]
+    anterior = semanas[-2] if len(semanas) > 1 else {"receita": 0.0, "vendas": 0}
+    variacao = None
+    if anterior["receita"]:
+        variacao = round((atual["receita"] - anterior["receita"]) / anterior["receita"] * 100, 1)
+    return {
+        "receita_semana": atual["receita"],
+        "receita_semana_anterior": anterior["receita"],
+        "variacao_percentual": variacao,
+        "vendas_semana": atual["vendas"],
+        "vendas_semana_anterior": anterior["vendas"],
+    }
+
+
+def analisar(backend: SorveteriaBackend, inicio: Optional[str] = None, fim: Optional[str] = None,
+             limite_produtos: int = 10) -> Dict:
+    """Todas as análises de um período (padrão: os últimos 28 dias) a partir de uma única leitura"""
+    if fim is None:
+        fim = datetime.now().strftime("%Y-%m-%d")
+    if inicio is None:
+        inicio = _dia_para_texto(_texto_para_dia(fim) - 27)
+    vendas = carregar_vendas(backend, inicio, fim)
+    return {
+        "inicio": inicio,
+        "fim": fim,
+        "resumo": resumo(vendas),
+        "semanas": comparar_semanas(vendas),
+        "por_hora": por_hora(vendas),
+        "por_dia_semana": por_dia_semana(vendas),
+        "mapa_calor": mapa_calor(vendas),
+        "mais_vendidos": mais_vendidos(vendas, limite_produtos),
+        "por_promocao": por_promocao(vendas),
+    }
@@ -1,21 +1,84 @@
 import customtkinter as ctk
+import importlib.util
+import os
+from collections import OrderedDict
 import tkinter.messagebox as messagebox
 from datetime import datetime, timedelta
+from sorveteria_async import BackendAssincrono, entregar_no_tk
 from sorveteria_backend import SorveteriaBackend
+from sorveteria_backup import BackupPeriodico
+from sorveteria_busca import IndiceBusca
+from sorveteria_instrumentacao import Instrumentacao
+from sorveteria_widgets import BuscaProduto, ListaVirtual
+
+# Sem NumPy o painel mostra só os totais. O módulo de análise (e o NumPy, que demora a
+# importar) só é carregado na thread do banco, quando o painel pede a análise
+ANALISE_DISPONIVEL = importlib.util.find_spec("numpy") is not None
+
+
+def analisar_painel(backend):
+    from sorveteria_analise import analisar
+    return analisar(backend)
 
 # Configuração da interface
 ctk.set_appearance_mode("dark")
 ctk.set_default_color_theme("blue")
 
 class SorveteriaApp(ctk.CTk):
-    def __init__(self):
+    # Telas construídas mantidas em memória; a usada há mais tempo é destruída além disso
+    MAX_TELAS_CONSTRUIDAS = 4
+    # De quanto em quanto tempo os alertas de estoque (mínimo e previsão de ruptura) são refeitos
+    INTERVALO_ALERTAS_MS = 5 * 60 * 1000
+
+    def __init__(self, db_name='sorveteria.db'):
         super().__init__()
         self.title("Sistema Sorveteria do Marcos")
         self.geometry("1000x700")
         self.resizable(False, False)
         
-        # Inicializa o backend SQLite
-        self.backend = SorveteriaBackend()
+        # Inicializa o backend SQLite numa thread própria; toda chamada retorna um Future
+        # O banco é aberto (e o esquema conferido) na própria thread, enquanto a janela é desenhada
+        self.banco = BackendAssincrono(lambda: SorveteriaBackend(db_name))
+        self.protocol("WM_DELETE_WINDOW", self.fechar)
+        # Fotografia de hora em hora em backups/, ao lado do banco, sem parar as vendas
+        self.backups = BackupPeriodico(db_name, os.path.join(os.path.dirname(os.path.abspath(db_name)), "backups"))
+        self.backups.iniciar()
+
+        # Cada tela é construída na primeira visita e depois só escondida e mostrada de novo.
+        # telas: nome -> (construir(frame) que devolve a função de atualizar, tabelas exibidas);
+        # tabelas None indica uma tela atualizada a cada visita
+        self.telas = {
+            'painel': (self.construir_painel, ('Venda', 'Despesa', 'Produto')),
+            'vendas': (self.construir_vendas, ('Venda',)),
+            'produtos': (self.construir_produtos, ('Produto',)),
+            'promocoes': (self.construir_promocoes, ('Promocao',)),
+            'despesas': (self.construir_despesas, ('Despesa',)),
+            'estoque': (self.construir_estoque, ('Produto',)),
+            'diagnostico': (self.construir_diagnostico, None),
+        }
+        self.telas_construidas = OrderedDict()  # nome -> (frame, atualizar), da menos para a mais recente
+        self.listas_por_tela = {}                # nome -> {tabela: [listas que recebem mudanças pontuais]}
+        self.tela_atual = None
+        self.listas_ativas = {}
+
+        # Versão de cada tabela, avançada a cada gravação deste app, e o que cada tela viu por último
+        # (versões das tabelas, gravações próprias e PRAGMA data_version, que acusa outros processos)
+        self.versoes = {}
+        self.gravacoes_proprias = 0
+        self.versoes_vistas = {}
+        self.banco.ouvir_no_tk(self, self.ao_mudar_dados)
+
+        # Métricas do backend, ligadas pela tela de diagnóstico (Ctrl+Shift+D)
+        self.instrumentacao = Instrumentacao()
+        self.instrumentacao_ligada = False
+        self.bind("<Control-D>", lambda evento: self.abrir_diagnostico())
+
+        # Índice de nomes para a busca de produtos na tela de vendas (carregado na primeira visita)
+        self.indice_busca = IndiceBusca()
+        self.indice_busca_carregado = False
+
+        # Produtos em alerta de estoque (código -> previsão), refeitos em segundo plano
+        self.alertas_estoque = {}
 
         # Menu lateral
         self.sidebar = ctk.CTkFrame(self, width=200)
@@ -46,117 +109,346 @@ class SorveteriaApp(ctk.CTk):
         self.frame_principal = ctk.CTkFrame(self)
         self.frame_principal.pack(expand=True, fill="both")
 
-        self.abrir_painel()
+        # O painel só é montado depois que a janela aparece, para ela não esperar por ele
+        self.bind("<Map>", self.ao_aparecer, add="+")
 
-    def limpar_frame(self):
-        for w in self.frame_principal.winfo_children():
-            w.destroy()
+    def ao_aparecer(self, event):
+        if event.widget is not self or self.tela_atual is not None:
+            return
+        self.after_idle(self.abrir_painel)
+        self.after_idle(self.verificar_alertas_estoque)  # Entra na fila do banco depois do painel
+
+    def fechar(self):
+        self.backups.encerrar()
+        # Arquivar vendas antigas fica para o comando arquivar-vendas (sorveteria_admin.py), agendado
+        # fora do expediente: fechar a janela não deve esperar por ele
+        self.banco.encerrar()
+        self.destroy()
+
+    def quando_pronto(self, futuro, ao_concluir):
+        """Entrega o resultado de uma chamada ao banco na thread da interface"""
+        entregar_no_tk(self, futuro, ao_concluir,
+                       ao_falhar=lambda erro: messagebox.showerror("Erro", f"Falha no banco de dados: {erro}"))
+
+    def mostrar_tela(self, nome):
+        """Mostra a tela `nome`, construindo-a na primeira visita; as outras ficam só escondidas"""
+        if self.tela_atual in self.telas_construidas and self.tela_atual != nome:
+            self.telas_construidas[self.tela_atual][0].pack_forget()
+        self.tela_atual = nome
+        self.listas_ativas = self.listas_por_tela.setdefault(nome, {})
+
+        if nome in self.telas_construidas:
+            self.telas_construidas.move_to_end(nome)
+            frame, _ = self.telas_construidas[nome]
+            frame.pack(expand=True, fill="both")
+            self.atualizar_se_mudou(nome)
+            return
+
+        construir, _ = self.telas[nome]
+        frame = ctk.CTkFrame(self.frame_principal, fg_color="transparent")
+        frame.pack(expand=True, fill="both")
+        self.telas_construidas[nome] = (frame, construir(frame))
+        self.descartar_telas_antigas()
+        self.atualizar_tela(nome)
+
+    def descartar_telas_antigas(self):
+        """Destrói as telas escondidas usadas há mais tempo além de MAX_TELAS_CONSTRUIDAS"""
+        while len(self.telas_construidas) > self.MAX_TELAS_CONSTRUIDAS:
+            nome = next(iter(self.telas_construidas))
+            frame, _ = self.telas_construidas.pop(nome)
+            self.listas_por_tela.pop(nome, None)
+            self.versoes_vistas.pop(nome, None)
+            frame.destroy()
+
+    def atualizar_tela(self, nome):
+        """Recarrega os dados da tela e anota as versões que ela passou a exibir"""
+        _, tabelas = self.telas[nome]
+        versoes = {tabela: self.versoes.get(tabela, 0) for tabela in tabelas or ()}
+        gravacoes = self.gravacoes_proprias
+
+        def anotar(versao_banco):
+            if nome in self.telas_construidas:
+                self.versoes_vistas[nome] = (versoes, gravacoes, versao_banco)
+
+        # A versão é lida antes das consultas da tela (a fila do banco é atendida em ordem),
+        # então uma gravação de outro processo no meio delas não passa despercebida
+        self.quando_pronto(self.banco.executar(lambda backend: backend._versao_dados()), anotar)
+        self.telas_construidas[nome][1]()
+
+    def atualizar_se_mudou(self, nome):
+        _, tabelas = self.telas[nome]
+        vistas = self.versoes_vistas.get(nome)
+        if tabelas is None or vistas is None:
+            self.atualizar_tela(nome)
+            return
+        versoes, gravacoes, versao_banco = vistas
+        if any(self.versoes.get(tabela, 0) != versao for tabela, versao in versoes.items()):
+            self.atualizar_tela(nome)
+            return
+
+        def conferir(versao_atual):
+            # O banco mudou sem nenhuma gravação deste app: foi outro processo (outro caixa, a API)
+            if versao_atual != versao_banco and self.gravacoes_proprias == gravacoes and self.tela_atual == nome:
+                self.atualizar_tela(nome)
+
+        self.quando_pronto(self.banco.executar(lambda backend: backend._versao_dados()), conferir)
+
+    def registrar_lista(self, tabela, lista):
+        """Chamado ao construir uma tela: a lista passa a receber as mudanças enquanto a tela estiver visível"""
+        self.listas_ativas.setdefault(tabela, []).append(lista)
+
+    def ao_mudar_dados(self, tabela, codigos):
+        """Aplica nas listas visíveis apenas as linhas afetadas por uma alteração no backend"""
+        atualizar_indice = tabela == 'Produto' and self.indice_busca_carregado
+        if tabela == 'Estoque':
+            tabela = 'Produto'  # As listas de produtos exibem a quantidade em estoque
+        self.versoes[tabela] = self.versoes.get(tabela, 0) + 1
+        self.gravacoes_proprias += 1
+
+        listas = self.listas_ativas.get(tabela)
+        if listas and self.tela_atual in self.versoes_vistas:
+            # A tela visível recebe a mudança agora e não precisa recarregar na próxima visita
+            self.versoes_vistas[self.tela_atual][0][tabela] = self.versoes[tabela]
+        if not listas and not atualizar_indice:
+            return
+
+        obter = {
+            'Venda': self.banco.obter_vendas,
+            'Produto': self.banco.obter_produtos,
+            'Promocao': self.banco.obter_promocoes,
+            'Despesa': self.banco.obter_despesas,
+        }[tabela]
+
+        def aplicar(itens):
+            atuais = {item['codigo']: item for item in itens}
+            if atualizar_indice:
+                self.indice_busca.sincronizar(codigos, itens)
+            # A tela pode ter mudado enquanto a consulta rodava
+            for lista in self.listas_ativas.get(tabela, []):
+                for codigo in codigos:
+                    lista.sincronizar(codigo, atuais.get(codigo))
+
+        self.quando_pronto(obter(codigos), aplicar)
 
     ### PAINEL - Resumo ###
     def abrir_painel(self):
-        self.limpar_frame()
+        self.mostrar_tela('painel')
 
-        titulo = ctk.CTkLabel(self.frame_principal, text="Painel Resumo", font=("Arial", 22, "bold"))
-        titulo.pack(pady=20)
+    def construir_painel(self, tela):
 
-        resumo = self.backend.calcular_resumo()
+        titulo = ctk.CTkLabel(tela, text="Painel Resumo", font=("Arial", 22, "bold"))
+        titulo.pack(pady=20)
 
         # Frame para os resumos
-        frame_resumos = ctk.CTkFrame(self.frame_principal)
+        frame_resumos = ctk.CTkFrame(tela)
         frame_resumos.pack(pady=10, padx=10, fill="x")
 
+        # Os valores aparecem como "Carregando..." até o resumo chegar do banco
+        valores = {}
+
         # Resumo Diário
         frame_diario = ctk.CTkFrame(frame_resumos)
         frame_diario.grid(row=0, column=0, padx=10, pady=10, sticky="nsew")
         ctk.CTkLabel(frame_diario, text="HOJE", font=("Arial", 14, "bold")).pack(pady=5)
-        ctk.CTkLabel(frame_diario, text=f"R$ {resumo['vendas_hoje']:.2f}", font=("Arial", 18)).pack(pady=5)
+        valores['vendas_hoje'] = ctk.CTkLabel(frame_diario, text="Carregando...", font=("Arial", 18))
+        valores['vendas_hoje'].pack(pady=5)
 
         # Resumo Semanal
         frame_semanal = ctk.CTkFrame(frame_resumos)
         frame_semanal.grid(row=0, column=1, padx=10, pady=10, sticky="nsew")
         ctk.CTkLabel(frame_semanal, text="ESTA SEMANA", font=("Arial", 14, "bold")).pack(pady=5)
-        ctk.CTkLabel(frame_semanal, text=f"R$ {resumo['vendas_semana']:.2f}", font=("Arial", 18)).pack(pady=5)
+        valores['vendas_semana'] = ctk.CTkLabel(frame_semanal, text="Carregando...", font=("Arial", 18))
+        valores['vendas_semana'].pack(pady=5)
 
         # Resumo Mensal
         frame_mensal = ctk.CTkFrame(frame_resumos)
         frame_mensal.grid(row=0, column=2, padx=10, pady=10, sticky="nsew")
         ctk.CTkLabel(frame_mensal, text="ESTE MÊS", font=("Arial", 14, "bold")).pack(pady=5)
-        ctk.CTkLabel(frame_mensal, text=f"R$ {resumo['vendas_mes']:.2f}", font=("Arial", 18)).pack(pady=5)
+        valores['vendas_mes'] = ctk.CTkLabel(frame_mensal, text="Carregando...", font=("Arial", 18))
+        valores['vendas_mes'].pack(pady=5)
 
         frame_resumos.grid_columnconfigure(0, weight=1)
         frame_resumos.grid_columnconfigure(1, weight=1)
         frame_resumos.grid_columnconfigure(2, weight=1)
 
         # Resumo Geral
-        frame_geral = ctk.CTkFrame(self.frame_principal)
+        frame_geral = ctk.CTkFrame(tela)
         frame_geral.pack(pady=20, padx=10, fill="x")
 
         ctk.CTkLabel(frame_geral, text="Resumo Geral", font=("Arial", 16, "bold")).pack(pady=10)
 
-        lbl_vendas = ctk.CTkLabel(frame_geral, text=f"Total Vendas (todas): R$ {resumo['total_vendas']:.2f}", font=("Arial", 14))
+        lbl_vendas = ctk.CTkLabel(frame_geral, text="Total Vendas (todas): Carregando...", font=("Arial", 14))
         lbl_vendas.pack(pady=5)
 
-        lbl_despesas = ctk.CTkLabel(frame_geral, text=f"Total Despesas: R$ {resumo['total_despesas']:.2f}", font=("Arial", 14))
+        lbl_despesas = ctk.CTkLabel(frame_geral, text="Total Despesas: Carregando...", font=("Arial", 14))
         lbl_despesas.pack(pady=5)
 
-        lbl_lucro = ctk.CTkLabel(frame_geral, text=f"Lucro Total: R$ {resumo['lucro']:.2f}", font=("Arial", 14))
+        lbl_lucro = ctk.CTkLabel(frame_geral, text="Lucro Total: Carregando...", font=("Arial", 14))
         lbl_lucro.pack(pady=5)
 
+        def mostrar_resumo(resumo):
+            if not lbl_lucro.winfo_exists():
+                return  # A tela foi descartada enquanto o resumo era calculado
+            for chave, lbl in valores.items():
+                lbl.configure(text=f"R$ {resumo[chave]:.2f}")
+            lbl_vendas.configure(text=f"Total Vendas (todas): R$ {resumo['total_vendas']:.2f}")
+            lbl_despesas.configure(text=f"Total Despesas: R$ {resumo['total_despesas']:.2f}")
+            lbl_lucro.configure(text=f"Lucro Total: R$ {resumo['lucro']:.2f}")
+
+        atualizar_analise = self.construir_analise_painel(tela) if ANALISE_DISPONIVEL else None
+
+        def atualizar():
+            self.quando_pronto(self.banco.calcular_resumo(), mostrar_resumo)
+            if atualizar_analise:
+                atualizar_analise()
+
+        return atualizar
+
+    def construir_analise_painel(self, tela):
+        """Ticket médio, semana contra a anterior, mais vendidos e mapa de calor dos últimos 28 dias"""
+        frame_analise = ctk.CTkFrame(tela)
+        frame_analise.pack(pady=10, padx=10, fill="both", expand=True)
+
+        frame_numeros = ctk.CTkFrame(frame_analise, fg_color="transparent")
+        frame_numeros.grid(row=0, column=0, padx=10, pady=5, sticky="nw")
+        ctk.CTkLabel(frame_numeros, text="Últimos 28 dias", font=("Arial", 14, "bold")).pack(anchor="w")
+        lbl_numeros = ctk.CTkLabel(frame_numeros, text="Carregando...", justify="left", font=("Arial", 12))
+        lbl_numeros.pack(anchor="w")
+
+        frame_mapa = ctk.CTkFrame(frame_analise, fg_color="transparent")
+        frame_mapa.grid(row=0, column=1, padx=10, pady=5, sticky="ne")
+        frame_analise.grid_columnconfigure(1, weight=1)
+
+        def mostrar_analise(analise):
+            if not lbl_numeros.winfo_exists():
+                return
+            resumo = analise['resumo']
+            semanas = analise['semanas']
+            variacao = semanas['variacao_percentual']
+            linhas = [
+                f"Vendas: {resumo['vendas']} | Ticket médio: R$ {resumo['ticket_medio']:.2f}",
+                f"Semana: R$ {semanas['receita_semana']:.2f} (anterior: R$ {semanas['receita_semana_anterior']:.2f}"
+                + (f", {variacao:+.1f}%)" if variacao is not None else ")"),
+                "Mais vendidos:",
+            ]
+            linhas += [f"  {i}. {p['nome']} - R$ {p['receita']:.2f} ({p['unidades']} un.)"
+                       for i, p in enumerate(analise['mais_vendidos'][:5], start=1)]
+            lbl_numeros.configure(text="\n".join(linhas))
+
+            # Mapa de calor: só as horas em que houve alguma venda
+            for widget in frame_mapa.winfo_children():
+                widget.destroy()
+            mapa = analise['mapa_calor']
+            horas = [h for h in mapa['horas'] if any(linha[h] for linha in mapa['receita'])]
+            maximo = max((max(linha) for linha in mapa['receita']), default=0) or 1
+            ctk.CTkLabel(frame_mapa, text="Receita por dia e hora", font=("Arial", 12, "bold")).grid(
+                row=0, column=0, columnspan=len(horas) + 1)
+            for coluna, hora in enumerate(horas, start=1):
+                ctk.CTkLabel(frame_mapa, text=f"{hora}h", font=("Arial", 9), width=26, height=14).grid(row=1, column=coluna)
+            for dia, nome in enumerate(mapa['dias']):
+                ctk.CTkLabel(frame_mapa, text=nome, font=("Arial", 9), width=30, height=16).grid(row=dia + 2, column=0)
+                for coluna, hora in enumerate(horas, start=1):
+                    intensidade = mapa['receita'][dia][hora] / maximo
+                    cor = f"#{int(30 + 200 * intensidade):02x}{int(40 + 90 * intensidade):02x}{int(60 + 20 * intensidade):02x}"
+                    ctk.CTkLabel(frame_mapa, text="", width=26, height=16, fg_color=cor, corner_radius=2).grid(
+                        row=dia + 2, column=coluna, padx=1, pady=1)
+
+        return lambda: self.quando_pronto(self.banco.executar(analisar_painel), mostrar_analise)
+
     ### VENDAS ###
     def abrir_vendas(self):
-        self.limpar_frame()
-        titulo = ctk.CTkLabel(self.frame_principal, text="Vendas", font=("Arial", 22, "bold"))
+        self.mostrar_tela('vendas')
+
+    def construir_vendas(self, tela):
+        titulo = ctk.CTkLabel(tela, text="Vendas", font=("Arial", 22, "bold"))
         titulo.pack(pady=10)
 
         # Frame para criar nova venda
-        frame_nova_venda = ctk.CTkFrame(self.frame_principal)
+        frame_nova_venda = ctk.CTkFrame(tela)
         frame_nova_venda.pack(pady=10, padx=10, fill="x")
 
         ctk.CTkLabel(frame_nova_venda, text="Criar nova venda", font=("Arial", 16, "bold")).grid(row=0, column=0, columnspan=6, pady=5)
 
         # Combobox para selecionar produto por nome
-        ctk.CTkLabel(frame_nova_venda, text="Selecione o Produto:").grid(row=1, column=0, padx=5, pady=5, sticky="e")
+        ctk.CTkLabel(frame_nova_venda, text="Produto:").grid(row=1, column=0, padx=5, pady=5, sticky="ne")
         
-        produtos = self.backend.listar_produtos()
-        nomes_produtos = [f"{p['codigo']} - {p['nome']}" for p in produtos]
+        if not self.indice_busca_carregado:
+            def carregar_indice(produtos):
+                self.indice_busca.carregar(produtos)
+                self.indice_busca_carregado = True
+            self.quando_pronto(self.banco.listar_produtos(), carregar_indice)
         
-        self.combo_produtos = ctk.CTkComboBox(frame_nova_venda, values=nomes_produtos)
-        self.combo_produtos.grid(row=1, column=1, padx=5, pady=5, sticky="ew")
+        self.busca_produto = BuscaProduto(frame_nova_venda, self.indice_busca)
+        self.busca_produto.grid(row=1, column=1, padx=5, pady=5, sticky="new")
 
-        ctk.CTkLabel(frame_nova_venda, text="Quantidade:").grid(row=1, column=2, padx=5, pady=5, sticky="e")
+        ctk.CTkLabel(frame_nova_venda, text="Quantidade:").grid(row=1, column=2, padx=5, pady=5, sticky="ne")
         self.entrada_quantidade_venda = ctk.CTkEntry(frame_nova_venda)
-        self.entrada_quantidade_venda.grid(row=1, column=3, padx=5, pady=5)
+        self.entrada_quantidade_venda.grid(row=1, column=3, padx=5, pady=5, sticky="n")
 
         btn_adicionar = ctk.CTkButton(frame_nova_venda, text="Adicionar Venda", command=self.adicionar_venda)
-        btn_adicionar.grid(row=2, column=0, columnspan=6, pady=10)
+        btn_adicionar.grid(row=2, column=0, columnspan=2, pady=10)
+
+        btn_carrinho = ctk.CTkButton(frame_nova_venda, text="Adicionar ao Carrinho", command=self.adicionar_ao_carrinho)
+        btn_carrinho.grid(row=2, column=2, columnspan=2, pady=10)
+
+        # Carrinho: vários itens registrados de uma vez
+        self.lbl_carrinho = ctk.CTkLabel(frame_nova_venda, text="", justify="left")
+        self.lbl_carrinho.grid(row=3, column=0, columnspan=4, padx=5, sticky="w")
+
+        btn_registrar_carrinho = ctk.CTkButton(frame_nova_venda, text="Registrar Carrinho", command=self.registrar_carrinho)
+        btn_registrar_carrinho.grid(row=4, column=0, columnspan=2, pady=10)
+
+        btn_limpar_carrinho = ctk.CTkButton(frame_nova_venda, text="Limpar Carrinho", fg_color="#d9534f", hover_color="#c9302c", command=self.limpar_carrinho)
+        btn_limpar_carrinho.grid(row=4, column=2, columnspan=2, pady=10)
+
+        self.carrinho = []
+        self.atualizar_carrinho()
 
         # Ajustar colunas
         frame_nova_venda.grid_columnconfigure(1, weight=1)
         frame_nova_venda.grid_columnconfigure(3, weight=1)
 
         # Frame listando vendas abertas
-        ctk.CTkLabel(self.frame_principal, text="Vendas em andamento", font=("Arial", 18, "bold")).pack(pady=10)
-
-        self.frame_vendas_abertas = ctk.CTkScrollableFrame(self.frame_principal, height=180)
+        ctk.CTkLabel(tela, text="Vendas em andamento", font=("Arial", 18, "bold")).pack(pady=10)
+
+        self.frame_vendas_abertas = ListaVirtual(
+            tela,
+            carregar_pagina=lambda ultima, limite: self.carregar_pagina_vendas('aberta', ultima, limite),
+            formatar=self.formatar_venda, linhas=4,
+            texto_botao="Finalizar", comando_botao=lambda venda: self.finalizar_venda(venda['codigo']),
+            pertence=lambda venda: venda['status'] == 'aberta',
+            chave_ordem=self.chave_ordem_venda, ordem_decrescente=True
+        )
         self.frame_vendas_abertas.pack(padx=10, fill="x")
-
-        self.atualizar_lista_vendas_abertas()
+        self.registrar_lista('Venda', self.frame_vendas_abertas)
 
         # Frame histórico vendas finalizadas
-        ctk.CTkLabel(self.frame_principal, text="Histórico de vendas finalizadas", font=("Arial", 18, "bold")).pack(pady=10)
-
-        self.frame_vendas_finalizadas = ctk.CTkScrollableFrame(self.frame_principal, height=150)
+        ctk.CTkLabel(tela, text="Histórico de vendas finalizadas", font=("Arial", 18, "bold")).pack(pady=10)
+
+        self.frame_vendas_finalizadas = ListaVirtual(
+            tela,
+            carregar_pagina=lambda ultima, limite: self.carregar_pagina_vendas('finalizada', ultima, limite),
+            formatar=self.formatar_venda, linhas=4,
+            pertence=lambda venda: venda['status'] == 'finalizada',
+            chave_ordem=self.chave_ordem_venda, ordem_decrescente=True
+        )
         self.frame_vendas_finalizadas.pack(padx=10, fill="x")
+        self.registrar_lista('Venda', self.frame_vendas_finalizadas)
 
-        self.atualizar_lista_vendas_finalizadas()
+        def atualizar():
+            self.atualizar_lista_vendas_abertas()
+            self.atualizar_lista_vendas_finalizadas()
 
-    def adicionar_venda(self):
-        produto_selecionado = self.combo_produtos.get()
+        return atualizar
+
+    def ler_selecao_venda(self):
+        """Valida o produto e a quantidade do formulário; retorna (produto_id, quantidade) ou None"""
+        produto_id = self.busca_produto.codigo_selecionado
         quantidade = self.entrada_quantidade_venda.get().strip()
 
-        if not produto_selecionado or not quantidade:
+        if produto_id is None or not quantidade:
             messagebox.showerror("Erro", "Selecione um produto e informe a quantidade!")
-            return
+            return None
 
         try:
             quantidade = float(quantidade)
@@ -164,79 +456,120 @@ class SorveteriaApp(ctk.CTk):
                 raise ValueError
         except ValueError:
             messagebox.showerror("Erro", "Quantidade inválida!")
-            return
+            return None
 
-        # Extrair ID do produto da seleção (formato "ID - Nome")
-        produto_id = produto_selecionado.split(" - ")[0]
-        
-        produtos = self.backend.listar_produtos()
-        produto = next((p for p in produtos if str(p['codigo']) == produto_id), None)
-        
-        if not produto:
-            messagebox.showerror("Erro", "Produto não encontrado!")
+        return produto_id, quantidade
+
+    def adicionar_venda(self):
+        selecao = self.ler_selecao_venda()
+        if not selecao:
             return
+        produto_id, quantidade = selecao
+
+        # Busca o produto e registra a venda de uma vez, na thread do banco
+        def registrar(backend):
+            produto = backend.obter_produto_por_id(produto_id)
+            if not produto:
+                return None, "Produto não encontrado!"
+            # O estoque é conferido pelo backend no mesmo comando que faz a baixa
+            return backend.criar_venda(
+                produto_id=produto['codigo'],
+                produto_nome=produto['nome'],
+                quantidade=quantidade,
+                preco_unitario=produto['preco']
+            )
+
+        def concluir(resultado):
+            venda_id, erro = resultado
+            if erro:
+                messagebox.showerror("Erro", erro)
+            else:
+                messagebox.showinfo("Sucesso", f"Venda {venda_id} registrada!")
+                self.entrada_quantidade_venda.delete(0, 'end')
 
-        if quantidade > produto['quantidade']:
-            messagebox.showerror("Erro", f"Estoque insuficiente! Atual: {produto['quantidade']}")
+        self.quando_pronto(self.banco.executar(registrar), concluir)
+
+    def adicionar_ao_carrinho(self):
+        selecao = self.ler_selecao_venda()
+        if not selecao:
             return
+        produto_id, quantidade = selecao
 
-        venda_id, erro = self.backend.criar_venda(
-            produto_id=produto['codigo'],
-            produto_nome=produto['nome'],
-            quantidade=quantidade,
-            preco_unitario=produto['preco']
-        )
+        def adicionar(produto):
+            if not produto:
+                messagebox.showerror("Erro", "Produto não encontrado!")
+                return
+            self.carrinho.append({"produto_id": produto['codigo'], "nome": produto['nome'],
+                                  "preco": produto['preco'], "quantidade": quantidade})
+            self.entrada_quantidade_venda.delete(0, 'end')
+            self.atualizar_carrinho()
 
-        if erro:
-            messagebox.showerror("Erro", erro)
-        else:
-            messagebox.showinfo("Sucesso", f"Venda {venda_id} registrada!")
-            self.abrir_vendas()
+        self.quando_pronto(self.banco.obter_produto_por_id(produto_id), adicionar)
 
-    def atualizar_lista_vendas_abertas(self):
-        for w in self.frame_vendas_abertas.winfo_children():
-            w.destroy()
+    def atualizar_carrinho(self):
+        if not self.carrinho:
+            self.lbl_carrinho.configure(text="Carrinho vazio")
+            return
+        linhas = [f"{item['quantidade']:g} x {item['nome']} = R$ {item['quantidade'] * item['preco']:.2f}"
+                  for item in self.carrinho]
+        total = sum(item['quantidade'] * item['preco'] for item in self.carrinho)
+        self.lbl_carrinho.configure(text="\n".join(linhas) + f"\nTotal: R$ {total:.2f}")
+
+    def limpar_carrinho(self):
+        self.carrinho = []
+        self.atualizar_carrinho()
+
+    def registrar_carrinho(self):
+        if not self.carrinho:
+            messagebox.showerror("Erro", "O carrinho está vazio!")
+            return
 
-        vendas_abertas = self.backend.listar_vendas(status='aberta')
+        def concluir(resultado):
+            vendas_ids, erro = resultado
+            if erro:
+                messagebox.showerror("Erro", erro)
+            else:
+                messagebox.showinfo("Sucesso", f"{len(vendas_ids)} itens registrados!")
+                self.limpar_carrinho()
 
-        for venda in vendas_abertas:
-            frame = ctk.CTkFrame(self.frame_vendas_abertas)
-            frame.pack(fill="x", pady=2, padx=2)
+        self.quando_pronto(self.banco.criar_venda_lote(list(self.carrinho)), concluir)
 
-            info = f"ID: {venda['codigo']} | Produto: {venda['produto_nome']} | Qtde: {venda['quantidade']} | Total: R$ {venda['valor_total']:.2f} | Data: {venda['data']} {venda['hora']}"
-            lbl = ctk.CTkLabel(frame, text=info)
-            lbl.pack(side="left", padx=5)
+    def carregar_pagina_vendas(self, status, ultima, limite):
+        if ultima is None:
+            return self.banco.listar_vendas_pagina(status=status, limit=limite)
+        return self.banco.listar_vendas_pagina(status, ultima['data'], ultima['hora'], ultima['codigo'], limite)
 
-            btn_finalizar = ctk.CTkButton(frame, text="Finalizar", width=100, command=lambda vid=venda['codigo']: self.finalizar_venda(vid))
-            btn_finalizar.pack(side="right", padx=5)
+    def chave_ordem_venda(self, venda):
+        return (venda['data'], venda['hora'], venda['codigo'])
 
-    def finalizar_venda(self, id_venda):
-        if self.backend.finalizar_venda(id_venda):
-            self.atualizar_lista_vendas_abertas()
-            self.atualizar_lista_vendas_finalizadas()
-            messagebox.showinfo("Sucesso", f"Venda {id_venda} finalizada!")
-        else:
-            messagebox.showerror("Erro", "Não foi possível finalizar a venda")
+    def formatar_venda(self, venda):
+        return f"ID: {venda['codigo']} | Produto: {venda['produto_nome']} | Qtde: {venda['quantidade']} | Total: R$ {venda['valor_total']:.2f} | Data: {venda['data']} {venda['hora']}"
 
-    def atualizar_lista_vendas_finalizadas(self):
-        for w in self.frame_vendas_finalizadas.winfo_children():
-            w.destroy()
+    def atualizar_lista_vendas_abertas(self):
+        self.frame_vendas_abertas.recarregar()
 
-        vendas_finalizadas = self.backend.listar_vendas(status='finalizada')
+    def finalizar_venda(self, id_venda):
+        def concluir(sucesso):
+            if sucesso:
+                messagebox.showinfo("Sucesso", f"Venda {id_venda} finalizada!")
+            else:
+                messagebox.showerror("Erro", "Não foi possível finalizar a venda")
 
-        for venda in vendas_finalizadas:
-            info = f"ID: {venda['codigo']} | Produto: {venda['produto_nome']} | Qtde: {venda['quantidade']} | Total: R$ {venda['valor_total']:.2f} | Data: {venda['data']} {venda['hora']}"
-            lbl = ctk.CTkLabel(self.frame_vendas_finalizadas, text=info)
-            lbl.pack(anchor="w", padx=10, pady=2)
+        self.quando_pronto(self.banco.finalizar_venda(id_venda), concluir)
+
+    def atualizar_lista_vendas_finalizadas(self):
+        self.frame_vendas_finalizadas.recarregar()
 
     ### PRODUTOS ###
     def abrir_produtos(self):
-        self.limpar_frame()
-        titulo = ctk.CTkLabel(self.frame_principal, text="Produtos", font=("Arial", 22, "bold"))
+        self.mostrar_tela('produtos')
+
+    def construir_produtos(self, tela):
+        titulo = ctk.CTkLabel(tela, text="Produtos", font=("Arial", 22, "bold"))
         titulo.pack(pady=10)
 
         # Frame para cadastro/edição
-        frame_cadastro = ctk.CTkFrame(self.frame_principal)
+        frame_cadastro = ctk.CTkFrame(tela)
         frame_cadastro.pack(pady=10, padx=10, fill="x")
 
         ctk.CTkLabel(frame_cadastro, text="Cadastrar/Editar Produto", font=("Arial", 16, "bold")).grid(row=0, column=0, columnspan=4, pady=5)
@@ -258,29 +591,44 @@ class SorveteriaApp(ctk.CTk):
         self.entrada_quantidade_produto = ctk.CTkEntry(frame_cadastro)
         self.entrada_quantidade_produto.grid(row=4, column=1, padx=5, pady=5, sticky="w")
 
+        ctk.CTkLabel(frame_cadastro, text="Categoria (opcional):").grid(row=5, column=0, padx=5, pady=5, sticky="e")
+        self.entrada_categoria_produto = ctk.CTkEntry(frame_cadastro)
+        self.entrada_categoria_produto.grid(row=5, column=1, padx=5, pady=5, sticky="w")
+
+        ctk.CTkLabel(frame_cadastro, text="Estoque mínimo (opcional):").grid(row=4, column=2, padx=5, pady=5, sticky="e")
+        self.entrada_minimo_produto = ctk.CTkEntry(frame_cadastro)
+        self.entrada_minimo_produto.grid(row=4, column=3, padx=5, pady=5, sticky="w")
+
         # Botões
         btn_carregar = ctk.CTkButton(frame_cadastro, text="Carregar", command=self.carregar_produto)
-        btn_carregar.grid(row=5, column=0, pady=10, padx=5)
+        btn_carregar.grid(row=6, column=0, pady=10, padx=5)
 
         btn_salvar = ctk.CTkButton(frame_cadastro, text="Salvar", command=self.salvar_produto)
-        btn_salvar.grid(row=5, column=1, pady=10, padx=5)
+        btn_salvar.grid(row=6, column=1, pady=10, padx=5)
 
         btn_limpar = ctk.CTkButton(frame_cadastro, text="Limpar", command=self.limpar_formulario_produto)
-        btn_limpar.grid(row=5, column=2, pady=10, padx=5)
+        btn_limpar.grid(row=6, column=2, pady=10, padx=5)
 
         btn_excluir = ctk.CTkButton(frame_cadastro, text="Excluir", fg_color="#d9534f", hover_color="#c9302c", command=self.excluir_produto)
-        btn_excluir.grid(row=5, column=3, pady=10, padx=5)
+        btn_excluir.grid(row=6, column=3, pady=10, padx=5)
 
         # Lista de produtos
-        frame_lista = ctk.CTkFrame(self.frame_principal)
+        frame_lista = ctk.CTkFrame(tela)
         frame_lista.pack(pady=10, padx=10, fill="both", expand=True)
 
         ctk.CTkLabel(frame_lista, text="Lista de Produtos", font=("Arial", 18, "bold")).pack(pady=5)
 
-        self.lista_produtos = ctk.CTkScrollableFrame(frame_lista, height=300)
+        self.lista_produtos = ListaVirtual(
+            frame_lista, carregar_pagina=self.carregar_pagina_produtos,
+            formatar=lambda p: f"{p['codigo']} - {p['nome']} | Preço: R$ {p['preco']:.2f} | Estoque: {p['quantidade']}"
+                               + (f" | {p['categoria']}" if p['categoria'] else ""),
+            linhas=7, texto_botao="Editar", comando_botao=self.editar_produto,
+            chave_ordem=self.chave_ordem_produto
+        )
         self.lista_produtos.pack(fill="both", expand=True)
+        self.registrar_lista('Produto', self.lista_produtos)
 
-        self.atualizar_lista_produtos()
+        return self.atualizar_lista_produtos
 
     def carregar_produto(self):
         codigo = self.entrada_codigo_produto.get().strip()
@@ -288,21 +636,21 @@ class SorveteriaApp(ctk.CTk):
             messagebox.showerror("Erro", "Informe o código do produto!")
             return
 
-        produto = self.backend.obter_produto_por_id(codigo)
-        if produto:
-            self.limpar_formulario_produto()
-            self.entrada_codigo_produto.insert(0, str(produto['codigo']))
-            self.entrada_nome_produto.insert(0, produto['nome'])
-            self.entrada_preco_produto.insert(0, str(produto['preco']))
-            self.entrada_quantidade_produto.insert(0, str(produto['quantidade']))
-        else:
-            messagebox.showerror("Erro", "Produto não encontrado!")
+        def preencher(produto):
+            if produto:
+                self.editar_produto(produto)
+            else:
+                messagebox.showerror("Erro", "Produto não encontrado!")
+
+        self.quando_pronto(self.banco.obter_produto_por_id(codigo), preencher)
 
     def salvar_produto(self):
         codigo = self.entrada_codigo_produto.get().strip()
         nome = self.entrada_nome_produto.get().strip()
         preco = self.entrada_preco_produto.get().strip()
         quantidade = self.entrada_quantidade_produto.get().strip()
+        categoria = self.entrada_categoria_produto.get().strip() or None
+        estoque_minimo = self.entrada_minimo_produto.get().strip() or None
 
         if not nome or not preco or not quantidade:
             messagebox.showerror("Erro", "Preencha todos os campos!")
@@ -311,32 +659,39 @@ class SorveteriaApp(ctk.CTk):
         try:
             preco = float(preco)
             quantidade = int(quantidade)
-            if preco <= 0 or quantidade < 0:
+            if estoque_minimo is not None:
+                estoque_minimo = int(estoque_minimo)
+            if preco <= 0 or quantidade < 0 or (estoque_minimo is not None and estoque_minimo < 0):
                 raise ValueError
         except ValueError:
-            messagebox.showerror("Erro", "Preço deve ser número positivo e quantidade inteiro não negativo!")
+            messagebox.showerror("Erro", "Preço deve ser número positivo e quantidade e estoque mínimo inteiros não negativos!")
             return
 
         if codigo:  # Edição
-            if self.backend.atualizar_produto(codigo, nome, preco, quantidade):
-                messagebox.showinfo("Sucesso", "Produto atualizado com sucesso!")
-                self.atualizar_lista_produtos()
-            else:
-                messagebox.showerror("Erro", "Falha ao atualizar produto!")
+            def concluir_edicao(sucesso):
+                if sucesso:
+                    messagebox.showinfo("Sucesso", "Produto atualizado com sucesso!")
+                else:
+                    messagebox.showerror("Erro", "Falha ao atualizar produto!")
+
+            self.quando_pronto(self.banco.atualizar_produto(codigo, nome, preco, quantidade, categoria, estoque_minimo), concluir_edicao)
         else:  # Cadastro novo
-            novo_codigo = self.backend.criar_produto(nome, preco, quantidade)
-            if novo_codigo:
-                messagebox.showinfo("Sucesso", f"Produto cadastrado com código {novo_codigo}!")
-                self.limpar_formulario_produto()
-                self.atualizar_lista_produtos()
-            else:
-                messagebox.showerror("Erro", "Falha ao cadastrar produto!")
+            def concluir_cadastro(novo_codigo):
+                if novo_codigo:
+                    messagebox.showinfo("Sucesso", f"Produto cadastrado com código {novo_codigo}!")
+                    self.limpar_formulario_produto()
+                else:
+                    messagebox.showerror("Erro", "Falha ao cadastrar produto!")
+
+            self.quando_pronto(self.banco.criar_produto(nome, preco, quantidade, categoria, estoque_minimo), concluir_cadastro)
 
     def limpar_formulario_produto(self):
         self.entrada_codigo_produto.delete(0, 'end')
         self.entrada_nome_produto.delete(0, 'end')
         self.entrada_preco_produto.delete(0, 'end')
         self.entrada_quantidade_produto.delete(0, 'end')
+        self.entrada_categoria_produto.delete(0, 'end')
+        self.entrada_minimo_produto.delete(0, 'end')
 
     def excluir_produto(self):
         codigo = self.entrada_codigo_produto.get().strip()
@@ -346,28 +701,25 @@ class SorveteriaApp(ctk.CTk):
 
         confirmacao = messagebox.askyesno("Confirmação", f"Tem certeza que deseja excluir o produto {codigo}?")
         if confirmacao:
-            if self.backend.excluir_produto(codigo):
-                messagebox.showinfo("Sucesso", "Produto excluído com sucesso!")
-                self.limpar_formulario_produto()
-                self.atualizar_lista_produtos()
-            else:
-                messagebox.showerror("Erro", "Falha ao excluir produto!")
+            def concluir(sucesso):
+                if sucesso:
+                    messagebox.showinfo("Sucesso", "Produto excluído com sucesso!")
+                    self.limpar_formulario_produto()
+                else:
+                    messagebox.showerror("Erro", "Falha ao excluir produto!")
 
-    def atualizar_lista_produtos(self):
-        for widget in self.lista_produtos.winfo_children():
-            widget.destroy()
+            self.quando_pronto(self.banco.excluir_produto(codigo), concluir)
 
-        produtos = self.backend.listar_produtos()
-        for produto in produtos:
-            frame = ctk.CTkFrame(self.lista_produtos)
-            frame.pack(fill="x", pady=2, padx=2)
+    def carregar_pagina_produtos(self, ultimo, limite, estoque_baixo=False):
+        if ultimo is None:
+            return self.banco.listar_produtos_pagina(limit=limite, estoque_baixo=estoque_baixo)
+        return self.banco.listar_produtos_pagina(ultimo['nome'], ultimo['codigo'], limite, estoque_baixo=estoque_baixo)
 
-            info = f"{produto['codigo']} - {produto['nome']} | Preço: R$ {produto['preco']:.2f} | Estoque: {produto['quantidade']}"
-            lbl = ctk.CTkLabel(frame, text=info)
-            lbl.pack(side="left", padx=5)
+    def chave_ordem_produto(self, produto):
+        return (produto['nome'], produto['codigo'])
 
-            btn_editar = ctk.CTkButton(frame, text="Editar", width=80, command=lambda p=produto: self.editar_produto(p))
-            btn_editar.pack(side="right", padx=5)
+    def atualizar_lista_produtos(self):
+        self.lista_produtos.recarregar()
 
     def editar_produto(self, produto):
         self.limpar_formulario_produto()
@@ -375,14 +727,18 @@ class SorveteriaApp(ctk.CTk):
         self.entrada_nome_produto.insert(0, produto['nome'])
         self.entrada_preco_produto.insert(0, str(produto['preco']))
         self.entrada_quantidade_produto.insert(0, str(produto['quantidade']))
+        self.entrada_categoria_produto.insert(0, produto['categoria'] or "")
+        self.entrada_minimo_produto.insert(0, str(produto['estoque_minimo']))
 
     ### PROMOÇÕES ###
     def abrir_promocoes(self):
-        self.limpar_frame()
-        titulo = ctk.CTkLabel(self.frame_principal, text="Promoções", font=("Arial", 22, "bold"))
+        self.mostrar_tela('promocoes')
+
+    def construir_promocoes(self, tela):
+        titulo = ctk.CTkLabel(tela, text="Promoções", font=("Arial", 22, "bold"))
         titulo.pack(pady=10)
 
-        frame_cadastro = ctk.CTkFrame(self.frame_principal)
+        frame_cadastro = ctk.CTkFrame(tela)
         frame_cadastro.pack(pady=10, padx=10, fill="x")
 
         ctk.CTkLabel(frame_cadastro, text="Cadastrar nova promoção", font=("Arial", 16, "bold")).grid(row=0, column=0, columnspan=2, pady=5)
@@ -403,53 +759,80 @@ class SorveteriaApp(ctk.CTk):
         entrada_data_fim = ctk.CTkEntry(frame_cadastro)
         entrada_data_fim.grid(row=4, column=1, sticky="w", padx=5, pady=5)
 
+        # Sem produto nem categoria, a promoção vale para todos os produtos
+        ctk.CTkLabel(frame_cadastro, text="Código do produto (opcional):").grid(row=5, column=0, sticky="e", padx=5, pady=5)
+        entrada_produto = ctk.CTkEntry(frame_cadastro)
+        entrada_produto.grid(row=5, column=1, sticky="w", padx=5, pady=5)
+
+        ctk.CTkLabel(frame_cadastro, text="Categoria (opcional):").grid(row=6, column=0, sticky="e", padx=5, pady=5)
+        entrada_categoria = ctk.CTkEntry(frame_cadastro)
+        entrada_categoria.grid(row=6, column=1, sticky="w", padx=5, pady=5)
+
         def cadastrar_promocao():
             desc = entrada_desc.get().strip()
             pct = entrada_desc_pct.get().strip()
             dt_inicio = entrada_data_inicio.get().strip()
             dt_fim = entrada_data_fim.get().strip()
+            produto = entrada_produto.get().strip()
+            categoria = entrada_categoria.get().strip() or None
             if not desc or not pct or not dt_inicio or not dt_fim:
                 messagebox.showerror("Erro", "Preencha todos os campos!")
                 return
             try:
                 pct = float(pct)
+                if not 0 < pct <= 100:
+                    raise ValueError
                 datetime.strptime(dt_inicio, "%Y-%m-%d")
                 datetime.strptime(dt_fim, "%Y-%m-%d")
+                produto = int(produto) if produto else None
             except ValueError:
-                messagebox.showerror("Erro", "Dados inválidos! Confira o formato das datas e do desconto.")
+                messagebox.showerror("Erro", "Dados inválidos! Confira as datas, o desconto (até 100%) e o código do produto.")
                 return
             
-            promocao_id = self.backend.criar_promocao(desc, pct, dt_inicio, dt_fim)
-            if promocao_id:
-                messagebox.showinfo("Sucesso", f"Promoção cadastrada com código {promocao_id}!")
-                self.abrir_promocoes()
-            else:
-                messagebox.showerror("Erro", "Falha ao cadastrar promoção!")
+            def concluir(promocao_id):
+                if promocao_id:
+                    messagebox.showinfo("Sucesso", f"Promoção cadastrada com código {promocao_id}!")
+                    for entrada in (entrada_desc, entrada_desc_pct, entrada_data_inicio, entrada_data_fim,
+                                    entrada_produto, entrada_categoria):
+                        entrada.delete(0, 'end')
+                else:
+                    messagebox.showerror("Erro", "Falha ao cadastrar promoção!")
+
+            self.quando_pronto(self.banco.criar_promocao(desc, pct, dt_inicio, dt_fim, produto, categoria), concluir)
 
         btn_cadastrar = ctk.CTkButton(frame_cadastro, text="Cadastrar Promoção", command=cadastrar_promocao)
-        btn_cadastrar.grid(row=5, column=0, columnspan=2, pady=10)
+        btn_cadastrar.grid(row=7, column=0, columnspan=2, pady=10)
 
-        frame_lista = ctk.CTkFrame(self.frame_principal)
+        frame_lista = ctk.CTkFrame(tela)
         frame_lista.pack(padx=10, pady=10, fill="both", expand=True)
 
         ctk.CTkLabel(frame_lista, text="Promoções Atuais", font=("Arial", 18, "bold")).pack(pady=5)
 
-        lista_scroll = ctk.CTkScrollableFrame(frame_lista)
+        def carregar_pagina(ultima, limite):
+            if ultima is None:
+                return self.banco.listar_promocoes_pagina(limit=limite)
+            return self.banco.listar_promocoes_pagina(ultima['data_inicio'], ultima['codigo'], limite)
+
+        lista_scroll = ListaVirtual(
+            frame_lista, carregar_pagina=carregar_pagina,
+            formatar=lambda p: f"Código: {p['codigo']} | {p['descricao']} | Desconto: {p['desconto_percentual']}% | De {p['data_inicio']} até {p['data_fim']}"
+                               + (f" | Produto {p['codigo_produto']}" if p['codigo_produto'] is not None
+                                  else f" | Categoria {p['categoria']}" if p['categoria'] else ""),
+            linhas=6, chave_ordem=lambda p: (p['data_inicio'], p['codigo']), ordem_decrescente=True
+        )
         lista_scroll.pack(fill="both", expand=True, pady=5)
-
-        promocoes = self.backend.listar_promocoes()
-        for p in promocoes:
-            info = f"Código: {p['codigo']} | {p['descricao']} | Desconto: {p['desconto_percentual']}% | De {p['data_inicio']} até {p['data_fim']}"
-            lbl = ctk.CTkLabel(lista_scroll, text=info)
-            lbl.pack(anchor="w", padx=10, pady=2)
+        self.registrar_lista('Promocao', lista_scroll)
+        return lista_scroll.recarregar
 
     ### DESPESAS ###
     def abrir_despesas(self):
-        self.limpar_frame()
-        titulo = ctk.CTkLabel(self.frame_principal, text="Despesas", font=("Arial", 22, "bold"))
+        self.mostrar_tela('despesas')
+
+    def construir_despesas(self, tela):
+        titulo = ctk.CTkLabel(tela, text="Despesas", font=("Arial", 22, "bold"))
         titulo.pack(pady=10)
 
-        frame_cadastro = ctk.CTkFrame(self.frame_principal)
+        frame_cadastro = ctk.CTkFrame(tela)
         frame_cadastro.pack(padx=10, pady=10, fill="x")
 
         ctk.CTkLabel(frame_cadastro, text="Cadastrar nova despesa", font=("Arial", 16, "bold")).grid(row=0, column=0, columnspan=2, pady=5)
@@ -474,37 +857,48 @@ class SorveteriaApp(ctk.CTk):
                 messagebox.showerror("Erro", "Valor inválido!")
                 return
             
-            if self.backend.criar_despesa(desc, valor):
-                messagebox.showinfo("Sucesso", "Despesa cadastrada!")
-                self.abrir_despesas()
-            else:
-                messagebox.showerror("Erro", "Falha ao cadastrar despesa!")
+            def concluir(sucesso):
+                if sucesso:
+                    messagebox.showinfo("Sucesso", "Despesa cadastrada!")
+                    entrada_desc.delete(0, 'end')
+                    entrada_valor.delete(0, 'end')
+                else:
+                    messagebox.showerror("Erro", "Falha ao cadastrar despesa!")
+
+            self.quando_pronto(self.banco.criar_despesa(desc, valor), concluir)
 
         btn_cadastrar = ctk.CTkButton(frame_cadastro, text="Cadastrar Despesa", command=cadastrar_despesa)
         btn_cadastrar.grid(row=3, column=0, columnspan=2, pady=10)
 
-        frame_lista = ctk.CTkFrame(self.frame_principal)
+        frame_lista = ctk.CTkFrame(tela)
         frame_lista.pack(padx=10, pady=10, fill="both", expand=True)
 
         ctk.CTkLabel(frame_lista, text="Despesas Registradas", font=("Arial", 18, "bold")).pack(pady=5)
 
-        lista_scroll = ctk.CTkScrollableFrame(frame_lista)
-        lista_scroll.pack(fill="both", expand=True, pady=5)
+        def carregar_pagina(ultima, limite):
+            if ultima is None:
+                return self.banco.listar_despesas_pagina(limit=limite)
+            return self.banco.listar_despesas_pagina(ultima['data'], ultima['codigo'], limite)
 
-        despesas = self.backend.listar_despesas()
-        for d in despesas:
-            info = f"Descrição: {d['descricao']} | Valor: R$ {d['valor']:.2f} | Data: {d['data']}"
-            lbl = ctk.CTkLabel(lista_scroll, text=info)
-            lbl.pack(anchor="w", padx=10, pady=2)
+        lista_scroll = ListaVirtual(
+            frame_lista, carregar_pagina=carregar_pagina,
+            formatar=lambda d: f"Descrição: {d['descricao']} | Valor: R$ {d['valor']:.2f} | Data: {d['data']}",
+            linhas=8, chave_ordem=lambda d: (d['data'], d['codigo']), ordem_decrescente=True
+        )
+        lista_scroll.pack(fill="both", expand=True, pady=5)
+        self.registrar_lista('Despesa', lista_scroll)
+        return lista_scroll.recarregar
 
     ### ESTOQUE ###
     def abrir_estoque(self):
-        self.limpar_frame()
-        titulo = ctk.CTkLabel(self.frame_principal, text="Controle de Estoque", font=("Arial", 22, "bold"))
+        self.mostrar_tela('estoque')
+
+    def construir_estoque(self, tela):
+        titulo = ctk.CTkLabel(tela, text="Controle de Estoque", font=("Arial", 22, "bold"))
         titulo.pack(pady=10)
 
         # Frame para ajuste de estoque
-        frame_ajuste = ctk.CTkFrame(self.frame_principal)
+        frame_ajuste = ctk.CTkFrame(tela)
         frame_ajuste.pack(pady=10, padx=10, fill="x")
 
         ctk.CTkLabel(frame_ajuste, text="Ajustar Estoque", font=("Arial", 16, "bold")).grid(row=0, column=0, columnspan=4, pady=5)
@@ -517,35 +911,61 @@ class SorveteriaApp(ctk.CTk):
         self.entrada_quantidade_estoque = ctk.CTkEntry(frame_ajuste)
         self.entrada_quantidade_estoque.grid(row=1, column=3, padx=5, pady=5)
 
+        ctk.CTkLabel(frame_ajuste, text="Motivo:").grid(row=2, column=0, padx=5, pady=5, sticky="e")
+        self.entrada_motivo_estoque = ctk.CTkComboBox(frame_ajuste, values=["ajuste", "reposição", "perda", "quebra", "inventário"])
+        self.entrada_motivo_estoque.set("ajuste")
+        self.entrada_motivo_estoque.grid(row=2, column=1, padx=5, pady=5)
+
         btn_adicionar = ctk.CTkButton(frame_ajuste, text="Adicionar", command=lambda: self.ajustar_estoque("adicionar"))
-        btn_adicionar.grid(row=2, column=0, columnspan=2, pady=10, padx=5)
+        btn_adicionar.grid(row=3, column=0, columnspan=2, pady=10, padx=5)
 
         btn_remover = ctk.CTkButton(frame_ajuste, text="Remover", command=lambda: self.ajustar_estoque("remover"))
-        btn_remover.grid(row=2, column=2, columnspan=2, pady=10, padx=5)
+        btn_remover.grid(row=3, column=2, columnspan=2, pady=10, padx=5)
 
         # Frame listando produtos com estoque baixo
-        frame_baixo_estoque = ctk.CTkFrame(self.frame_principal)
+        frame_baixo_estoque = ctk.CTkFrame(tela)
         frame_baixo_estoque.pack(pady=10, padx=10, fill="x")
 
         ctk.CTkLabel(frame_baixo_estoque, text="Produtos com Estoque Baixo", font=("Arial", 16, "bold")).pack(pady=5)
 
-        self.lista_baixo_estoque = ctk.CTkScrollableFrame(frame_baixo_estoque, height=150)
+        # Produtos que acabam antes do prazo de reposição, mesmo ainda acima do mínimo
+        self.rotulo_previsao_estoque = ctk.CTkLabel(frame_baixo_estoque, text="", text_color="orange",
+                                                    wraplength=700, justify="left")
+        self.rotulo_previsao_estoque.pack(pady=2)
+
+        # Listar produtos abaixo do próprio estoque mínimo, com a previsão de quando acabam
+        self.lista_baixo_estoque = ListaVirtual(
+            frame_baixo_estoque,
+            carregar_pagina=lambda ultimo, limite: self.carregar_pagina_produtos(ultimo, limite, estoque_baixo=True),
+            formatar=self.formatar_estoque_baixo,
+            linhas=3, texto_botao="Editar", comando_botao=self.editar_direto_estoque,
+            cor_texto="red", texto_vazio="Nenhum produto com estoque baixo",
+            pertence=lambda p: p['quantidade'] < p['estoque_minimo'], chave_ordem=self.chave_ordem_produto
+        )
         self.lista_baixo_estoque.pack(fill="both", expand=True, padx=5, pady=5)
+        self.registrar_lista('Produto', self.lista_baixo_estoque)
 
         # Frame listando todos os produtos
-        frame_todos_produtos = ctk.CTkFrame(self.frame_principal)
+        frame_todos_produtos = ctk.CTkFrame(tela)
         frame_todos_produtos.pack(pady=10, padx=10, fill="both", expand=True)
 
         ctk.CTkLabel(frame_todos_produtos, text="Todos os Produtos", font=("Arial", 16, "bold")).pack(pady=5)
 
-        self.lista_todos_produtos = ctk.CTkScrollableFrame(frame_todos_produtos, height=250)
+        self.lista_todos_produtos = ListaVirtual(
+            frame_todos_produtos, carregar_pagina=self.carregar_pagina_produtos,
+            formatar=lambda p: f"ID: {p['codigo']} | Nome: {p['nome']} | Preço: R$ {p['preco']:.2f} | Estoque: {p['quantidade']}",
+            linhas=6, texto_botao="Editar", comando_botao=self.editar_direto_estoque,
+            chave_ordem=self.chave_ordem_produto
+        )
         self.lista_todos_produtos.pack(fill="both", expand=True, padx=5, pady=5)
+        self.registrar_lista('Produto', self.lista_todos_produtos)
 
-        self.atualizar_listas_estoque()
+        return self.atualizar_listas_estoque
 
     def ajustar_estoque(self, operacao):
         produto_id = self.entrada_id_produto_estoque.get().strip()
         quantidade = self.entrada_quantidade_estoque.get().strip()
+        motivo = self.entrada_motivo_estoque.get().strip() or "ajuste"
 
         if not produto_id or not quantidade:
             messagebox.showerror("Erro", "Preencha o ID do produto e a quantidade!")
@@ -562,63 +982,143 @@ class SorveteriaApp(ctk.CTk):
         if operacao == "remover":
             quantidade = -quantidade
 
-        if self.backend.atualizar_estoque(int(produto_id), quantidade):
-            messagebox.showinfo("Sucesso", f"Estoque do produto {produto_id} atualizado!")
-            self.entrada_id_produto_estoque.delete(0, 'end')
-            self.entrada_quantidade_estoque.delete(0, 'end')
-            self.atualizar_listas_estoque()
-        else:
-            messagebox.showerror("Erro", "Falha ao atualizar estoque!")
+        def concluir(sucesso):
+            if sucesso:
+                messagebox.showinfo("Sucesso", f"Estoque do produto {produto_id} atualizado!")
+                self.entrada_id_produto_estoque.delete(0, 'end')
+                self.entrada_quantidade_estoque.delete(0, 'end')
+            else:
+                messagebox.showerror("Erro", "Falha ao atualizar estoque!")
+
+        self.quando_pronto(self.banco.atualizar_estoque(int(produto_id), quantidade, motivo), concluir)
 
     def atualizar_listas_estoque(self):
-        # Limpar listas
-        for widget in self.lista_baixo_estoque.winfo_children():
-            widget.destroy()
-        for widget in self.lista_todos_produtos.winfo_children():
-            widget.destroy()
+        self.lista_baixo_estoque.recarregar()
+        self.lista_todos_produtos.recarregar()
+        self.verificar_alertas_estoque(reagendar=False)
+
+    def formatar_estoque_baixo(self, produto):
+        texto = f"ID: {produto['codigo']} | Nome: {produto['nome']} | Estoque: {produto['quantidade']} (mínimo {produto['estoque_minimo']})"
+        previsao = self.alertas_estoque.get(produto['codigo'])
+        if previsao and previsao['dias_ate_acabar'] is not None:
+            texto += f" | acaba em ~{previsao['dias_ate_acabar']:g} dias"
+        return texto
+
+    def verificar_alertas_estoque(self, reagendar=True):
+        """Refaz os alertas de estoque na thread do banco e marca o botão Estoque; roda em segundo
+        plano a cada INTERVALO_ALERTAS_MS"""
+        def mostrar(alertas):
+            self.alertas_estoque = {alerta['codigo']: alerta for alerta in alertas}
+            if alertas:
+                self.btn_estoque.configure(text=f"Estoque ({len(alertas)} ⚠)", fg_color="#d9534f")
+            else:
+                self.btn_estoque.configure(text="Estoque", fg_color=self.btn_painel.cget("fg_color"))
 
-        produtos = self.backend.listar_produtos()
-        
-        # Listar produtos com estoque baixo (menos de 10 unidades)
-        baixo_estoque = [p for p in produtos if p['quantidade'] < 10]
-        
-        if not baixo_estoque:
-            ctk.CTkLabel(self.lista_baixo_estoque, text="Nenhum produto com estoque baixo").pack(pady=10)
-        else:
-            for produto in baixo_estoque:
-                frame = ctk.CTkFrame(self.lista_baixo_estoque)
-                frame.pack(fill="x", pady=2, padx=2)
-                
-                texto = f"ID: {produto['codigo']} | Nome: {produto['nome']} | Estoque: {produto['quantidade']} (estoque baixo!)"
-                ctk.CTkLabel(frame, text=texto, text_color="red").pack(side="left", padx=5)
-
-                btn_editar = ctk.CTkButton(frame, text="Editar", width=80,
-                                         command=lambda p=produto: self.editar_direto_estoque(p))
-                btn_editar.pack(side="right", padx=5)
-
-        # Listar todos os produtos
-        for produto in produtos:
-            frame = ctk.CTkFrame(self.lista_todos_produtos)
-            frame.pack(fill="x", pady=2, padx=2)
-            
-            texto = f"ID: {produto['codigo']} | Nome: {produto['nome']} | Preço: R$ {produto['preco']:.2f} | Estoque: {produto['quantidade']}"
-            ctk.CTkLabel(frame, text=texto).pack(side="left", padx=5)
+            if 'estoque' in self.telas_construidas:
+                ruptura = [alerta for alerta in alertas
+                           if alerta['quantidade'] >= alerta['estoque_minimo']]
+                self.rotulo_previsao_estoque.configure(text="Acabam antes da reposição: " + ", ".join(
+                    f"{alerta['nome']} (~{alerta['dias_ate_acabar']:g} dias)" for alerta in ruptura
+                ) if ruptura else "")
+                # Redesenha as linhas visíveis com as previsões novas
+                self.lista_baixo_estoque.mover_para(self.lista_baixo_estoque.inicio)
 
-            btn_editar = ctk.CTkButton(frame, text="Editar", width=80,
-                                     command=lambda p=produto: self.editar_direto_estoque(p))
-            btn_editar.pack(side="right", padx=5)
+        self.quando_pronto(self.banco.alertas_estoque(), mostrar)
+        if reagendar:
+            self.after(self.INTERVALO_ALERTAS_MS, self.verificar_alertas_estoque)
 
     def editar_direto_estoque(self, produto):
         """Abre a tela de produtos já com os dados carregados para edição"""
         self.abrir_produtos()
-        self.entrada_codigo_produto.delete(0, 'end')
-        self.entrada_codigo_produto.insert(0, str(produto['codigo']))
-        self.entrada_nome_produto.delete(0, 'end')
-        self.entrada_nome_produto.insert(0, produto['nome'])
-        self.entrada_preco_produto.delete(0, 'end')
-        self.entrada_preco_produto.insert(0, str(produto['preco']))
-        self.entrada_quantidade_produto.delete(0, 'end')
-        self.entrada_quantidade_produto.insert(0, str(produto['quantidade']))
+        self.editar_produto(produto)
+
+    ### DIAGNÓSTICO (oculto: Ctrl+Shift+D) ###
+    def abrir_diagnostico(self):
+        self.mostrar_tela('diagnostico')
+
+    def construir_diagnostico(self, tela):
+        titulo = ctk.CTkLabel(tela, text="Diagnóstico do Banco", font=("Arial", 22, "bold"))
+        titulo.pack(pady=10)
+
+        frame_botoes = ctk.CTkFrame(tela)
+        frame_botoes.pack(padx=10, pady=5, fill="x")
+
+        texto = ctk.CTkTextbox(tela, font=("Courier", 12), wrap="none")
+        texto.pack(padx=10, pady=10, fill="both", expand=True)
+
+        def mostrar():
+            if not texto.winfo_exists():
+                return
+            # A fotografia é lida direto daqui: não espera na fila do banco, mesmo com ele ocupado
+            texto.delete("1.0", "end")
+            texto.insert("1.0", self.formatar_diagnostico(self.instrumentacao.fotografia()))
+
+        def alternar():
+            ligar = not self.instrumentacao_ligada
+            if ligar:
+                futuro = self.banco.executar(lambda backend: backend.instrumentar(self.instrumentacao))
+            else:
+                futuro = self.banco.executar(lambda backend: backend.desinstrumentar())
+
+            def concluir(_):
+                self.instrumentacao_ligada = ligar
+                if btn_alternar.winfo_exists():
+                    btn_alternar.configure(text="Desligar medições" if ligar else "Ligar medições")
+                    mostrar()
+
+            self.quando_pronto(futuro, concluir)
+
+        def zerar():
+            self.instrumentacao.zerar()
+            mostrar()
+
+        def salvar():
+            import tkinter.filedialog as filedialog
+            caminho = filedialog.asksaveasfilename(defaultextension=".json", initialfile="diagnostico.json",
+                                                   filetypes=[("JSON", "*.json")])
+            if not caminho:
+                return
+            try:
+                self.instrumentacao.salvar(caminho)
+                messagebox.showinfo("Sucesso", f"Métricas salvas em {caminho}")
+            except OSError as e:
+                messagebox.showerror("Erro", f"Falha ao salvar: {e}")
+
+        btn_alternar = ctk.CTkButton(frame_botoes, command=alternar,
+                                     text="Desligar medições" if self.instrumentacao_ligada else "Ligar medições")
+        btn_alternar.grid(row=0, column=0, padx=5, pady=5)
+        ctk.CTkButton(frame_botoes, text="Atualizar", command=mostrar).grid(row=0, column=1, padx=5, pady=5)
+        ctk.CTkButton(frame_botoes, text="Zerar", command=zerar).grid(row=0, column=2, padx=5, pady=5)
+        ctk.CTkButton(frame_botoes, text="Salvar em arquivo...", command=salvar).grid(row=0, column=3, padx=5, pady=5)
+
+        return mostrar
+
+    def formatar_diagnostico(self, fotografia):
+        """Texto da tela de diagnóstico: métodos e comandos mais demorados, lentos e erros"""
+        estado = "ligadas" if self.instrumentacao_ligada else "desligadas"
+        linhas = [f"Medições {estado} | desde {fotografia['desde']} | lentos: acima de {fotografia['limite_lento_ms']:.0f} ms", ""]
+
+        def tabela(titulo, metricas, limite=15):
+            linhas.append(titulo)
+            linhas.append(f"  {'chamadas':>8} {'total ms':>10} {'média':>8} {'p95':>8} {'máx':>9} {'linhas':>8} {'erros':>5}  nome")
+            for nome, m in list(metricas.items())[:limite]:
+                linhas.append(f"  {m['chamadas']:>8} {m['total_ms']:>10.1f} {m['media_ms']:>8.2f} {m['p95_ms']:>8}"
+                              f" {m['max_ms']:>9.1f} {m['linhas']:>8} {m['erros']:>5}  {nome[:90]}")
+            linhas.append("")
+
+        tabela("MÉTODOS (por tempo total)", fotografia['metodos'])
+        tabela("COMANDOS SQL (por tempo total)", fotografia['sql'])
+
+        linhas.append(f"COMANDOS LENTOS ({len(fotografia['lentas'])})")
+        for lenta in reversed(fotografia['lentas'][-20:]):
+            linhas.append(f"  {lenta['momento']}  {lenta['ms']:.1f} ms  {lenta['linhas']} linhas  {lenta['sql'][:100]}")
+            linhas += [f"      {passo}" for passo in lenta['plano']]
+        linhas.append("")
+
+        linhas.append(f"ERROS ({len(fotografia['erros'])})")
+        for erro in reversed(fotografia['erros'][-20:]):
+            linhas.append(f"  {erro['momento']}  {erro.get('metodo') or erro.get('sql', '')[:80]}: {erro['erro']}")
+        return "\n".join(linhas)
 
 
 if __name__ == "__main__":
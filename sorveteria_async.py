@@ -0,0 +1,124 @@
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Optional
+
+from sorveteria_backend import SorveteriaBackend
+
+
+class BackendAssincrono:
+    """Fachada que executa os métodos do SorveteriaBackend numa thread dedicada.
+
+    O backend é criado dentro da própria thread, que fica dona das conexões SQLite (o sqlite3
+    não aceita usar uma conexão em outra thread). Cada chamada retorna um Future:
+
+        futuro = banco.listar_vendas_pagina(status='aberta', limit=50)
+        entregar_no_tk(widget, futuro, lambda vendas: ...)
+
+    Os pedidos são atendidos na ordem em que chegam, então uma gravação seguida de uma
+    leitura sempre enxerga o que foi gravado.
+    """
+
+    def __init__(self, fabrica: Callable[[], SorveteriaBackend] = SorveteriaBackend):
+        self._fila: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._executar, args=(fabrica,),
+                                        name="sorveteria-banco", daemon=True)
+        self._thread.start()
+
+    def _executar(self, fabrica: Callable[[], SorveteriaBackend]):
+        backend = None
+        while True:
+            # Com gravação agrupada ligada, acorda a tempo de descarregar a fila dela
+            grupo = backend.gravacao_agrupada if backend is not None else None
+            try:
+                pedido = self._fila.get(timeout=grupo.prazo() if grupo else None)
+            except queue.Empty:
+                grupo.descarregar_se_vencida()
+                continue
+            if pedido is None:
+                break
+            futuro, funcao, args, kwargs = pedido
+            if not futuro.set_running_or_notify_cancel():
+                continue
+            try:
+                if backend is None:
+                    backend = fabrica()
+                futuro.set_result(funcao(backend, *args, **kwargs))
+            except BaseException as e:
+                futuro.set_exception(e)
+            if backend is not None and backend.gravacao_agrupada is not None:
+                backend.gravacao_agrupada.descarregar_se_vencida()
+        # As conexões são fechadas na mesma thread que as abriu
+        if backend is not None:
+            backend.desativar_gravacao_agrupada()
+            backend.conexoes.fechar()
+
+    def executar(self, funcao: Callable[..., Any], *args, **kwargs) -> Future:
+        """Executa funcao(backend, *args, **kwargs) na thread do banco"""
+        futuro: Future = Future()
+        self._fila.put((futuro, funcao, args, kwargs))
+        return futuro
+
+    def agrupar(self, nome: str, *args, **kwargs) -> Future:
+        """Chama o método `nome` da gravação agrupada do backend (ligada com ativar_gravacao_agrupada);
+        o futuro só termina depois do commit do grupo, com o resultado do ticket"""
+        concluido: Future = Future()
+
+        def enfileirar(backend: SorveteriaBackend):
+            getattr(backend.gravacao_agrupada, nome)(*args, **kwargs).ao_concluir(concluido.set_result)
+
+        def repassar_erro(futuro: Future):
+            if futuro.exception() is not None:
+                concluido.set_exception(futuro.exception())
+        self.executar(enfileirar).add_done_callback(repassar_erro)
+        return concluido
+
+    def __getattr__(self, nome: str) -> Callable[..., Future]:
+        if nome.startswith("_"):
+            raise AttributeError(nome)
+
+        def chamar(*args, **kwargs) -> Future:
+            return self.executar(lambda backend, *a, **k: getattr(backend, nome)(*a, **k), *args, **kwargs)
+        return chamar
+
+    def ouvir_no_tk(self, widget, ouvinte: Callable[[str, list], None], intervalo_ms: int = 50):
+        """Registra um ouvinte de mudanças que é chamado na thread do Tk, não na do banco"""
+        notificacoes: "queue.Queue[tuple]" = queue.Queue()
+        self.adicionar_ouvinte(lambda tabela, codigos: notificacoes.put((tabela, codigos)))
+
+        def despachar():
+            if not widget.winfo_exists():
+                return
+            while True:
+                try:
+                    tabela, codigos = notificacoes.get_nowait()
+                except queue.Empty:
+                    break
+                ouvinte(tabela, codigos)
+            widget.after(intervalo_ms, despachar)
+        despachar()
+
+    def encerrar(self, esperar: bool = True):
+        """Atende os pedidos pendentes e encerra a thread do banco"""
+        self._fila.put(None)
+        if esperar:
+            self._thread.join()
+
+
+def entregar_no_tk(widget, futuro: Future, ao_concluir: Callable[[Any], None],
+                   ao_falhar: Optional[Callable[[BaseException], None]] = None, intervalo_ms: int = 15):
+    """Chama ao_concluir(resultado) na thread do Tk quando o futuro terminar, consultando-o via after()"""
+    def verificar():
+        if not widget.winfo_exists():
+            return  # A tela foi fechada enquanto a consulta rodava
+        if not futuro.done():
+            widget.after(intervalo_ms, verificar)
+            return
+        erro = futuro.exception()
+        if erro is None:
+            ao_concluir(futuro.result())
+        elif ao_falhar:
+            ao_falhar(erro)
+        else:
+            raise erro
+    widget.after(0, verificar)
@@ -1,15 +1,779 @@
+import os
+import re
 import sqlite3
+import time
+from bisect import bisect_right
 from datetime import datetime, timedelta
-from typing import List, Dict, Union, Optional
+from typing import List, Dict, Union, Optional, Callable, Iterator, Tuple
+
+from sorveteria_instrumentacao import (CapturaComandos, Conexao, Instrumentacao, envolver_metodo,
+                                       instrumentar_conexao, metodos_publicos)
+from sorveteria_registros import Despesa, Produto, Promocao, Venda, colunas, marcadores
+
+# Recalcula ResumoDiario a partir do histórico de vendas finalizadas e despesas
+SQL_RECONSTRUIR_RESUMO = """
+INSERT INTO ResumoDiario (data, total_vendas, quantidade_vendas, total_despesas)
+SELECT data, SUM(total_vendas), SUM(quantidade_vendas), SUM(total_despesas)
+FROM (
+    SELECT data, SUM(valor_total) AS total_vendas, COUNT(*) AS quantidade_vendas, 0 AS total_despesas
+    FROM Venda WHERE status = 'finalizada' GROUP BY data
+    UNION ALL
+    SELECT data, 0, 0, SUM(valor) FROM Despesa GROUP BY data
+)
+GROUP BY data
+"""
+
+# Refaz a linha de ResumoTotal a partir de ResumoDiario (os triggers só aplicam diferenças)
+SQL_RECONSTRUIR_TOTAL = """
+INSERT OR REPLACE INTO ResumoTotal (codigo, total_vendas, quantidade_vendas, total_despesas)
+SELECT 1, COALESCE(SUM(total_vendas), 0), COALESCE(SUM(quantidade_vendas), 0), COALESCE(SUM(total_despesas), 0)
+FROM ResumoDiario
+"""
+
+COLUNAS_VENDA = colunas(Venda)
+
+# Esquema de cada banco anual de vendas arquivadas, anexado como {banco}. Sem chaves estrangeiras:
+# Produto e Promocao ficam no banco principal
+ESQUEMA_ARQUIVO = [
+    """
+    CREATE TABLE IF NOT EXISTS {banco}.Venda (
+        codigo INTEGER PRIMARY KEY,
+        codigo_produto INTEGER NOT NULL,
+        produto_nome TEXT NOT NULL,
+        quantidade INTEGER NOT NULL,
+        preco_unitario REAL NOT NULL,
+        valor_total REAL NOT NULL,
+        data TEXT NOT NULL,
+        hora TEXT NOT NULL,
+        status TEXT NOT NULL,
+        codigo_promocao INTEGER
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS {banco}.idx_venda_data ON Venda (data, hora)",
+    """
+    CREATE INDEX IF NOT EXISTS {banco}.idx_venda_periodo
+    ON Venda (status, data, hora, valor_total, codigo_produto, quantidade, codigo_promocao)
+    """,
+]
+
+# Soma aos totais diários as vendas de um arquivo anual, até a data de corte dele
+SQL_RESUMO_ARQUIVO = """
+INSERT INTO ResumoDiario (data, total_vendas, quantidade_vendas)
+SELECT data, SUM(valor_total), COUNT(*)
+FROM {banco}.Venda WHERE status = 'finalizada' AND data < ? GROUP BY data
+ON CONFLICT(data) DO UPDATE SET
+    total_vendas = total_vendas + excluded.total_vendas,
+    quantidade_vendas = quantidade_vendas + excluded.quantidade_vendas
+"""
+
+
+class GerenciadorConexoes:
+    """Abre e configura as conexões SQLite do backend.
+
+    Em modo WAL leitores não bloqueiam o escritor (nem o contrário), então o backend usa
+    uma conexão para gravações e outra, somente leitura, para consultas. Isso permite que
+    outro caixa ou um processo de relatórios usem o mesmo arquivo ao mesmo tempo.
+    """
+    
+    PRAGMAS = {
+        "synchronous": "NORMAL",   # Em WAL só sincroniza no checkpoint; um commit nunca corrompe o banco
+        "cache_size": -16000,      # 16 MB de cache de páginas por conexão
+        "mmap_size": 268435456,    # Até 256 MB lidos via mmap, sem cópia para o cache
+        "temp_store": "MEMORY",    # Ordenações e tabelas temporárias em memória
+    }
+    
+    def __init__(self, db_name: str = 'sorveteria.db', wal: bool = True, timeout: float = 5.0):
+        self.db_name = db_name
+        self.wal = wal
+        self.timeout = timeout  # Segundos esperando um lock antes de "database is locked"
+        self.fechado = False
+        
+        self.escrita = self._abrir()
+        # O modo WAL fica gravado no arquivo; só é trocado na primeira abertura
+        if wal and self.escrita.execute("PRAGMA journal_mode").fetchone()[0] != "wal":
+            self._ativar_wal()
+        
+        if db_name == ':memory:':
+            self.leitura = self.escrita  # Cada conexão :memory: é um banco diferente
+        else:
+            self.leitura = self._abrir()
+            self.leitura.execute("PRAGMA query_only = ON")
+    
+    def _ativar_wal(self):
+        # Duas aberturas simultâneas de um banco novo disputam a troca, e o SQLite responde
+        # "database is locked" na hora, sem esperar o timeout: tenta de novo até o prazo, a não
+        # ser que a outra abertura já tenha trocado o modo
+        prazo = time.monotonic() + self.timeout
+        while True:
+            try:
+                self.escrita.execute("PRAGMA journal_mode = WAL")
+                return
+            except sqlite3.OperationalError:
+                if self.escrita.execute("PRAGMA journal_mode").fetchone()[0] == "wal":
+                    return
+                if time.monotonic() > prazo:
+                    raise
+                time.sleep(0.01)
+    
+    def _abrir(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_name, timeout=self.timeout, factory=Conexao)
+        conn.row_factory = sqlite3.Row  # Para retornar dicionários
+        for pragma, valor in self.PRAGMAS.items():
+            conn.execute(f"PRAGMA {pragma} = {valor}")
+        if not self.wal:
+            conn.execute("PRAGMA synchronous = FULL")  # NORMAL só é seguro em WAL
+        return conn
+    
+    def fechar(self):
+        if self.fechado:
+            return
+        if self.leitura is not self.escrita:
+            self.leitura.close()
+        self.escrita.close()
+        self.fechado = True
+
+
+class CatalogoCache:
+    """Catálogo de produtos (com estoque) em memória: dicionário por código e visão ordenada por nome.
+    
+    O backend corrige as entradas afetadas a cada alteração que ele mesmo grava (via notificações);
+    alterações de outros processos são percebidas pelo PRAGMA data_version, consultado no máximo
+    uma vez a cada `intervalo_verificacao` segundos, e descartam o cache inteiro.
+    """
+    
+    def __init__(self, consultar: Callable[[Optional[List[int]]], List[Dict]],
+                 versao_banco: Callable[[], int], intervalo_verificacao: float = 1.0):
+        self._consultar = consultar          # consultar(None) carrega tudo; consultar(codigos) só esses
+        self._versao_banco = versao_banco
+        self.intervalo_verificacao = intervalo_verificacao
+        
+        self.produtos: Dict[int, Dict] = {}
+        self._ordenados: Optional[List[Dict]] = None
+        self._carregado = False
+        self._versao = None
+        self._ultima_verificacao = 0.0
+        
+        self.acertos = 0
+        self.falhas = 0
+    
+    def _garantir(self):
+        agora = time.monotonic()
+        if self._carregado and agora - self._ultima_verificacao >= self.intervalo_verificacao:
+            self._ultima_verificacao = agora
+            if self._versao_banco() != self._versao:
+                self.invalidar()
+        
+        if self._carregado:
+            self.acertos += 1
+            return
+        
+        self.falhas += 1
+        self._ordenados = [dict(produto) for produto in self._consultar(None)]
+        self.produtos = {produto['codigo']: produto for produto in self._ordenados}
+        self._versao = self._versao_banco()
+        self._ultima_verificacao = agora
+        self._carregado = True
+    
+    def invalidar(self):
+        self.produtos = {}
+        self._ordenados = None
+        self._carregado = False
+    
+    def obter(self, codigo: int) -> Optional[Dict]:
+        self._garantir()
+        produto = self.produtos.get(codigo)
+        return dict(produto) if produto else None
+    
+    def listar(self) -> List[Dict]:
+        self._garantir()
+        if self._ordenados is None:
+            self._ordenados = sorted(self.produtos.values(), key=lambda p: (p['nome'], p['codigo']))
+        return [dict(produto) for produto in self._ordenados]
+    
+    def ao_mudar_dados(self, tabela: str, codigos: List[int]):
+        """Ouvinte do backend: relê só os produtos alterados"""
+        if tabela not in ('Produto', 'Estoque') or not self._carregado:
+            return
+        try:
+            atuais = {produto['codigo']: produto for produto in self._consultar(codigos)}
+            self._versao = self._versao_banco()
+        except sqlite3.Error:
+            self.invalidar()
+            return
+        
+        for codigo in codigos:
+            antigo = self.produtos.get(codigo)
+            novo = atuais.get(codigo)
+            if novo is None:
+                self.produtos.pop(codigo, None)
+                self._ordenados = None
+            elif antigo is None or antigo['nome'] != novo['nome']:
+                self.produtos[codigo] = dict(novo)
+                self._ordenados = None
+            else:
+                antigo.update(novo)  # Mesmo objeto da visão ordenada, que continua válida
+    
+    def estatisticas(self) -> Dict[str, int]:
+        return {"acertos": self.acertos, "falhas": self.falhas, "produtos": len(self.produtos)}
+
+
+class MotorPromocoes:
+    """Promoções em memória para o preço de cada venda não consultar a tabela Promocao.
+    
+    As promoções que ainda não terminaram ficam ordenadas pela data de início: as vigentes num
+    dia são as de início até ele (bisect) que terminam depois dele. Essas são separadas por alvo
+    (produto, categoria ou todos) e só recalculadas quando o dia muda. Promoções gravadas por este
+    backend invalidam o índice via notificação; as de outros processos, pelo data_version.
+    """
+    
+    def __init__(self, consultar: Callable[[str], List[Dict]], versao_banco: Callable[[], int],
+                 intervalo_verificacao: float = 1.0):
+        self._consultar = consultar          # consultar(data) traz as promoções com data_fim >= data
+        self._versao_banco = versao_banco
+        self.intervalo_verificacao = intervalo_verificacao
+        
+        self._promocoes: List[Dict] = []     # Ordenadas por data_inicio
+        self._inicios: List[str] = []
+        self._carregado_em: Optional[str] = None
+        self._versao = None
+        self._ultima_verificacao = 0.0
+        
+        # Vigentes no dia `_dia`, por alvo, da de maior desconto para a de menor
+        self._dia: Optional[str] = None
+        self._por_produto: Dict[int, List[Dict]] = {}
+        self._por_categoria: Dict[str, List[Dict]] = {}
+        self._gerais: List[Dict] = []
+    
+    def _garantir(self, data: str):
+        agora = time.monotonic()
+        if self._carregado_em is not None and agora - self._ultima_verificacao >= self.intervalo_verificacao:
+            self._ultima_verificacao = agora
+            if self._versao_banco() != self._versao:
+                self.invalidar()
+        
+        # Promoções terminadas antes da carga foram descartadas; uma data anterior exige recarregar
+        if self._carregado_em is None or data < self._carregado_em:
+            self._promocoes = sorted((dict(p) for p in self._consultar(data)),
+                                     key=lambda p: (p['data_inicio'], p['codigo']))
+            self._inicios = [p['data_inicio'] for p in self._promocoes]
+            self._carregado_em = data
+            self._versao = self._versao_banco()
+            self._ultima_verificacao = agora
+            self._dia = None
+        
+        if data != self._dia:
+            self._separar(data)
+    
+    def _separar(self, data: str):
+        self._por_produto = {}
+        self._por_categoria = {}
+        self._gerais = []
+        for promocao in self.vigentes(data):
+            if promocao['codigo_produto'] is not None:
+                self._por_produto.setdefault(promocao['codigo_produto'], []).append(promocao)
+            elif promocao['categoria']:
+                self._por_categoria.setdefault(promocao['categoria'], []).append(promocao)
+            else:
+                self._gerais.append(promocao)
+        
+        def ordenar(promocoes: List[Dict]):
+            promocoes.sort(key=lambda p: (-p['desconto_percentual'], p['codigo']))
+        for promocoes in self._por_produto.values():
+            ordenar(promocoes)
+        for promocoes in self._por_categoria.values():
+            ordenar(promocoes)
+        ordenar(self._gerais)
+        self._dia = data
+    
+    def vigentes(self, data: str) -> List[Dict]:
+        fim = bisect_right(self._inicios, data)
+        return [p for p in self._promocoes[:fim] if p['data_fim'] >= data]
+    
+    def invalidar(self):
+        self._promocoes = []
+        self._inicios = []
+        self._carregado_em = None
+        self._dia = None
+    
+    def _candidatas(self, produto_id: int, categoria: Optional[str]) -> List[List[Dict]]:
+        # Da mais específica para a mais geral, para o desempate favorecer a do produto
+        return [self._por_produto.get(produto_id, []),
+                self._por_categoria.get(categoria, []) if categoria else [],
+                self._gerais]
+    
+    def melhor(self, produto_id: int, categoria: Optional[str], data: str) -> Optional[Dict]:
+        """Promoção de maior desconto vigente na data para o produto, ou None"""
+        self._garantir(data)
+        melhor = None
+        for promocoes in self._candidatas(produto_id, categoria):
+            if promocoes and (melhor is None or promocoes[0]['desconto_percentual'] > melhor['desconto_percentual']):
+                melhor = promocoes[0]
+        return dict(melhor) if melhor else None
+    
+    def aplicavel(self, codigo_promocao: int, produto_id: int, categoria: Optional[str],
+                  data: str) -> Optional[Dict]:
+        """A promoção informada, se estiver vigente e valer para o produto"""
+        self._garantir(data)
+        for promocoes in self._candidatas(produto_id, categoria):
+            for promocao in promocoes:
+                if promocao['codigo'] == codigo_promocao:
+                    return dict(promocao)
+        return None
+    
+    def ao_mudar_dados(self, tabela: str, codigos: List[int]):
+        """Ouvinte do backend: promoções novas recriam o índice na próxima venda"""
+        if tabela == 'Promocao':
+            self.invalidar()
+
+
+class Ticket:
+    """Resultado de uma gravação agrupada, disponível depois do commit do grupo em que ela entrou.
+    
+    `resultado()` tem a mesma forma do retorno do método direto (criar_venda devolve
+    (venda_id, erro), os demais um bool). Chamado antes do commit, descarrega a fila na hora,
+    por isso só pode ser usado na thread dona do backend; nas outras, use `ao_concluir`.
+    """
+    
+    def __init__(self, grupo: "GravacaoAgrupada"):
+        self._grupo = grupo
+        self._callbacks: List[Callable[[object], None]] = []
+        self.pronto = False
+        self.valor = None
+    
+    def ao_concluir(self, callback: Callable[[object], None]):
+        """Chama callback(resultado) logo após o commit (na thread do backend), ou já, se pronto"""
+        if self.pronto:
+            callback(self.valor)
+        else:
+            self._callbacks.append(callback)
+    
+    def resultado(self):
+        if not self.pronto:
+            self._grupo.descarregar()
+        return self.valor
+    
+    def _concluir(self, valor):
+        self.valor = valor
+        self.pronto = True
+        callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(valor)
+
+
+class GravacaoAgrupada:
+    """Fila de gravações (write-behind) gravada numa única transação a cada `intervalo_ms` ou
+    `max_operacoes`, em vez de um commit (e uma sincronização com o disco) por venda.
+    
+    Cada operação devolve um Ticket. Semântica em caso de queda:
+    - o que ainda está na fila vive só na memória: se o processo cair antes do commit do grupo,
+      essas operações se perdem e os seus tickets nunca ficam prontos;
+    - o ticket só fica pronto depois do COMMIT. Com `sincronizar=True` (padrão) a conexão de
+      escrita passa a synchronous = FULL, e em WAL cada commit sincroniza o log: um ticket
+      pronto sobrevive a queda de energia, e a fila paga uma sincronização por grupo. Com
+      `sincronizar=False` vale o NORMAL do backend, que sobrevive à queda do programa mas
+      pode perder os últimos grupos numa queda de energia (o banco nunca fica corrompido);
+    - cada operação roda num SAVEPOINT: uma venda sem estoque, ou uma operação em que o SQLite
+      dá erro, falha sozinha, sem derrubar o grupo. Se o próprio commit falhar, todos os tickets
+      do grupo ficam prontos com erro.
+    
+    Leituras não enxergam o que ainda está na fila, e gravações feitas direto no backend
+    podem chegar ao banco antes de operações enfileiradas antes delas. A fila não tem thread
+    própria: quem atende o backend chama `descarregar_se_vencida` (ou espera até `prazo()`).
+    """
+    
+    def __init__(self, backend: "SorveteriaBackend", intervalo_ms: float = 50.0, max_operacoes: int = 200,
+                 sincronizar: bool = True):
+        self.backend = backend
+        self.intervalo = intervalo_ms / 1000
+        self.max_operacoes = max_operacoes
+        self.sincronizar = sincronizar
+        self.pendentes: List[tuple] = []   # (ticket, função de gravação, falha, argumentos)
+        self._primeira: Optional[float] = None
+        self.commits = 0
+        self.operacoes = 0
+        if sincronizar:
+            backend.conn.execute("PRAGMA synchronous = FULL")
+    
+    def _enfileirar(self, gravar: Callable, falha, *args) -> Ticket:
+        ticket = Ticket(self)
+        if self._primeira is None:
+            self._primeira = time.monotonic()
+        self.pendentes.append((ticket, gravar, falha, args))
+        if len(self.pendentes) >= self.max_operacoes:
+            self.descarregar()
+        return ticket
+    
+    def criar_venda(self, produto_id: int, produto_nome: str, quantidade: int,
+                    preco_unitario: float, codigo_promocao: Optional[int] = None) -> Ticket:
+        """Como SorveteriaBackend.criar_venda; data, hora e promoção são as do momento da chamada"""
+        agora = datetime.now()
+        data = agora.strftime("%Y-%m-%d")
+        promocao, erro = self.backend._promocao_para(produto_id, data, codigo_promocao)
+        if erro:
+            ticket = Ticket(self)
+            ticket._concluir((None, erro))
+            return ticket
+        return self._enfileirar(self._venda, (None, "Falha ao gravar a venda"), produto_id, produto_nome,
+                                quantidade, preco_unitario, promocao, data, agora.strftime("%H:%M:%S"))
+    
+    def finalizar_venda(self, venda: Union[int, Ticket]) -> Ticket:
+        """Como SorveteriaBackend.finalizar_venda; aceita o ticket de um criar_venda ainda na fila"""
+        return self._enfileirar(self._finalizacao, False, venda)
+    
+    def criar_despesa(self, descricao: str, valor: float) -> Ticket:
+        """Como SorveteriaBackend.criar_despesa"""
+        return self._enfileirar(self._despesa, False, descricao, valor, datetime.now().strftime("%Y-%m-%d"))
+    
+    # Cada função grava uma operação e retorna (resultado, [(tabela, codigos)], desfazer)
+    def _venda(self, cursor: sqlite3.Cursor, provisorios: Dict[Ticket, object], produto_id: int, *args):
+        venda_id, erro = self.backend._gravar_venda(cursor, produto_id, *args)
+        if erro:
+            return (None, erro), [], True
+        return (venda_id, None), [('Venda', [venda_id]), ('Estoque', [produto_id])], False
+    
+    def _finalizacao(self, cursor: sqlite3.Cursor, provisorios: Dict[Ticket, object], venda: Union[int, Ticket]):
+        if isinstance(venda, Ticket):
+            criada = venda.valor if venda.pronto else provisorios.get(venda)
+            venda = criada[0] if criada else None
+            if venda is None:
+                return False, [], False
+        finalizada = self.backend._gravar_finalizacao(cursor, venda)
+        return finalizada, [('Venda', [venda])] if finalizada else [], False
+    
+    def _despesa(self, cursor: sqlite3.Cursor, provisorios: Dict[Ticket, object], *args):
+        despesa_id = self.backend._gravar_despesa(cursor, *args)
+        return True, [('Despesa', [despesa_id])], False
+    
+    def prazo(self) -> Optional[float]:
+        """Segundos até o próximo descarregamento, ou None com a fila vazia"""
+        if self._primeira is None:
+            return None
+        return max(0.0, self._primeira + self.intervalo - time.monotonic())
+    
+    def descarregar_se_vencida(self) -> int:
+        if self._primeira is not None and time.monotonic() - self._primeira >= self.intervalo:
+            return self.descarregar()
+        return 0
+    
+    def descarregar(self) -> int:
+        """Grava a fila numa transação, conclui os tickets e notifica os ouvintes; retorna quantas operações"""
+        if not self.pendentes:
+            return 0
+        pendentes, self.pendentes = self.pendentes, []
+        self._primeira = None
+        conn = self.backend.conn
+        provisorios: Dict[Ticket, object] = {}
+        mudancas: Dict[str, List[int]] = {}
+        try:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            for ticket, gravar, falha, args in pendentes:
+                cursor.execute("SAVEPOINT operacao")
+                try:
+                    resultado, alteradas, desfazer = gravar(cursor, provisorios, *args)
+                except sqlite3.Error as e:
+                    # Só esta operação falha; se o erro desfez a transação inteira, o ROLLBACK TO
+                    # abaixo falha e o grupo todo fica com erro
+                    print(f"Erro na gravação agrupada: {e}")
+                    resultado, alteradas, desfazer = falha, [], True
+                if desfazer:
+                    cursor.execute("ROLLBACK TO operacao")
+                cursor.execute("RELEASE operacao")
+                provisorios[ticket] = resultado
+                for tabela, codigos in alteradas:
+                    mudancas.setdefault(tabela, []).extend(codigos)
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            print(f"Erro ao descarregar gravações agrupadas: {e}")
+            for ticket, _, falha, _ in pendentes:
+                ticket._concluir(falha)
+            return 0
+        
+        self.commits += 1
+        self.operacoes += len(pendentes)
+        for tabela, codigos in mudancas.items():
+            self.backend._notificar(tabela, list(dict.fromkeys(codigos)))
+        for ticket, resultado in provisorios.items():
+            ticket._concluir(resultado)
+        return len(pendentes)
+    
+    def encerrar(self):
+        """Descarrega o que falta e devolve a conexão ao synchronous do backend"""
+        self.descarregar()
+        if self.sincronizar:
+            self.backend.conn.execute(f"PRAGMA synchronous = {GerenciadorConexoes.PRAGMAS['synchronous']}"
+                                      if self.backend.conexoes.wal else "PRAGMA synchronous = FULL")
+
 
 class SorveteriaBackend:
-    def __init__(self, db_name='sorveteria.db'):
-        self.conn = sqlite3.connect(db_name)
-        self.conn.row_factory = sqlite3.Row  # Para retornar dicionários
+    # Migrações de esquema em ordem; a versão já aplicada fica em PRAGMA user_version
+    MIGRACOES = [
+        # Versão 1: índices para listagens e somas por status/data e para a busca de vendas por produto
+        [
+            "CREATE INDEX IF NOT EXISTS idx_venda_status_data ON Venda (status, data, hora, valor_total)",
+            "CREATE INDEX IF NOT EXISTS idx_venda_produto ON Venda (codigo_produto)",
+            "CREATE INDEX IF NOT EXISTS idx_despesa_data ON Despesa (data, valor)",
+            "CREATE INDEX IF NOT EXISTS idx_produto_nome ON Produto (nome)",
+            "CREATE INDEX IF NOT EXISTS idx_promocao_inicio ON Promocao (data_inicio)",
+        ],
+        # Versão 2: totais diários mantidos por triggers, para o painel não varrer Venda e Despesa
+        [
+            """
+            CREATE TABLE IF NOT EXISTS ResumoDiario (
+                data TEXT PRIMARY KEY,
+                total_vendas REAL NOT NULL DEFAULT 0,
+                quantidade_vendas INTEGER NOT NULL DEFAULT 0,
+                total_despesas REAL NOT NULL DEFAULT 0
+            ) WITHOUT ROWID
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_resumo_venda_finalizada
+            AFTER UPDATE OF status ON Venda
+            WHEN NEW.status = 'finalizada' AND OLD.status <> 'finalizada'
+            BEGIN
+                INSERT INTO ResumoDiario (data, total_vendas, quantidade_vendas)
+                VALUES (NEW.data, NEW.valor_total, 1)
+                ON CONFLICT(data) DO UPDATE SET
+                    total_vendas = total_vendas + excluded.total_vendas,
+                    quantidade_vendas = quantidade_vendas + 1;
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_resumo_venda_inserida
+            AFTER INSERT ON Venda
+            WHEN NEW.status = 'finalizada'
+            BEGIN
+                INSERT INTO ResumoDiario (data, total_vendas, quantidade_vendas)
+                VALUES (NEW.data, NEW.valor_total, 1)
+                ON CONFLICT(data) DO UPDATE SET
+                    total_vendas = total_vendas + excluded.total_vendas,
+                    quantidade_vendas = quantidade_vendas + 1;
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_resumo_despesa_inserida
+            AFTER INSERT ON Despesa
+            BEGIN
+                INSERT INTO ResumoDiario (data, total_despesas)
+                VALUES (NEW.data, NEW.valor)
+                ON CONFLICT(data) DO UPDATE SET
+                    total_despesas = total_despesas + excluded.total_despesas;
+            END
+            """,
+            SQL_RECONSTRUIR_RESUMO,
+        ],
+        # Versão 3: categoria de produto e promoções direcionadas a um produto ou a uma categoria
+        [
+            "ALTER TABLE Produto ADD COLUMN categoria TEXT",
+            "ALTER TABLE Promocao ADD COLUMN codigo_produto INTEGER REFERENCES Produto(codigo)",
+            "ALTER TABLE Promocao ADD COLUMN categoria TEXT",
+            "CREATE INDEX IF NOT EXISTS idx_promocao_fim ON Promocao (data_fim)",
+        ],
+        # Versão 4: livro de movimentos de estoque (só recebe inserções) e fotografias periódicas
+        [
+            """
+            CREATE TABLE IF NOT EXISTS MovimentoEstoque (
+                codigo INTEGER PRIMARY KEY AUTOINCREMENT,
+                codigo_produto INTEGER NOT NULL,
+                delta INTEGER NOT NULL,
+                motivo TEXT NOT NULL,
+                codigo_venda INTEGER,
+                momento TEXT NOT NULL
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_movimento_produto ON MovimentoEstoque (codigo_produto, momento, delta)",
+            """
+            CREATE TABLE IF NOT EXISTS SnapshotEstoque (
+                codigo_produto INTEGER NOT NULL,
+                momento TEXT NOT NULL,
+                quantidade INTEGER NOT NULL,
+                ultimo_movimento INTEGER NOT NULL,
+                PRIMARY KEY (codigo_produto, momento)
+            ) WITHOUT ROWID
+            """,
+            # O estoque atual vira a primeira fotografia: o livro começa a valer a partir daqui
+            """
+            INSERT OR IGNORE INTO SnapshotEstoque (codigo_produto, momento, quantidade, ultimo_movimento)
+            SELECT codigo_produto, datetime('now', 'localtime'), quantidade, 0 FROM Estoque
+            """,
+        ],
+        # Versão 5: o índice por status/data passa a cobrir as colunas lidas pelas análises do painel
+        [
+            "DROP INDEX IF EXISTS idx_venda_status_data",
+            """
+            CREATE INDEX IF NOT EXISTS idx_venda_periodo
+            ON Venda (status, data, hora, valor_total, codigo_produto, quantidade, codigo_promocao)
+            """,
+        ],
+        # Versão 6: vendas finalizadas antigas arquivadas em um banco por ano (ver arquivar_vendas);
+        # o índice por data ordena as páginas sem filtro de status e a junção com os arquivos
+        [
+            "CREATE INDEX IF NOT EXISTS idx_venda_data ON Venda (data, hora)",
+            """
+            CREATE TABLE IF NOT EXISTS ArquivoVendas (
+                ano INTEGER PRIMARY KEY,
+                arquivo TEXT NOT NULL,
+                ate_data TEXT NOT NULL,
+                quantidade_vendas INTEGER NOT NULL DEFAULT 0,
+                total_vendas REAL NOT NULL DEFAULT 0
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS VendaArquivadaMensal (
+                codigo_produto INTEGER NOT NULL,
+                mes TEXT NOT NULL,
+                quantidade_vendas INTEGER NOT NULL,
+                unidades INTEGER NOT NULL,
+                total_vendas REAL NOT NULL,
+                PRIMARY KEY (codigo_produto, mes)
+            ) WITHOUT ROWID
+            """,
+        ],
+        # Versão 7: estoque mínimo por produto (o índice parcial só guarda os que estão abaixo dele)
+        # e unidades vendidas por produto e dia, mantidas por trigger, para a previsão de ruptura
+        [
+            "ALTER TABLE Estoque ADD COLUMN estoque_minimo INTEGER NOT NULL DEFAULT 10",
+            """
+            CREATE INDEX IF NOT EXISTS idx_estoque_baixo ON Estoque (codigo_produto)
+            WHERE quantidade < estoque_minimo
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS VendaProdutoDiaria (
+                codigo_produto INTEGER NOT NULL,
+                data TEXT NOT NULL,
+                unidades INTEGER NOT NULL DEFAULT 0,
+                quantidade_vendas INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (codigo_produto, data)
+            ) WITHOUT ROWID
+            """,
+            # Conta a venda ao ser criada, aberta ou não: é aí que as unidades saem do estoque
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_venda_produto_diaria
+            AFTER INSERT ON Venda
+            BEGIN
+                INSERT INTO VendaProdutoDiaria (codigo_produto, data, unidades, quantidade_vendas)
+                VALUES (NEW.codigo_produto, NEW.data, NEW.quantidade, 1)
+                ON CONFLICT(codigo_produto, data) DO UPDATE SET
+                    unidades = unidades + excluded.unidades,
+                    quantidade_vendas = quantidade_vendas + 1;
+            END
+            """,
+            """
+            INSERT INTO VendaProdutoDiaria (codigo_produto, data, unidades, quantidade_vendas)
+            SELECT codigo_produto, data, SUM(quantidade), COUNT(*) FROM Venda
+            WHERE data >= date('now', 'localtime', '-90 days')
+            GROUP BY codigo_produto, data
+            """,
+        ],
+        # Versão 8: totais de todo o histórico numa linha só, mantidos por triggers sobre ResumoDiario,
+        # para o painel mostrar os totais gerais lendo só os dias do período que exibe
+        [
+            """
+            CREATE TABLE IF NOT EXISTS ResumoTotal (
+                codigo INTEGER PRIMARY KEY CHECK (codigo = 1),
+                total_vendas REAL NOT NULL DEFAULT 0,
+                quantidade_vendas INTEGER NOT NULL DEFAULT 0,
+                total_despesas REAL NOT NULL DEFAULT 0
+            )
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_resumo_total_inserido
+            AFTER INSERT ON ResumoDiario
+            BEGIN
+                UPDATE ResumoTotal SET
+                    total_vendas = total_vendas + NEW.total_vendas,
+                    quantidade_vendas = quantidade_vendas + NEW.quantidade_vendas,
+                    total_despesas = total_despesas + NEW.total_despesas
+                WHERE codigo = 1;
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_resumo_total_alterado
+            AFTER UPDATE ON ResumoDiario
+            BEGIN
+                UPDATE ResumoTotal SET
+                    total_vendas = total_vendas + NEW.total_vendas - OLD.total_vendas,
+                    quantidade_vendas = quantidade_vendas + NEW.quantidade_vendas - OLD.quantidade_vendas,
+                    total_despesas = total_despesas + NEW.total_despesas - OLD.total_despesas
+                WHERE codigo = 1;
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_resumo_total_removido
+            AFTER DELETE ON ResumoDiario
+            BEGIN
+                UPDATE ResumoTotal SET
+                    total_vendas = total_vendas - OLD.total_vendas,
+                    quantidade_vendas = quantidade_vendas - OLD.quantidade_vendas,
+                    total_despesas = total_despesas - OLD.total_despesas
+                WHERE codigo = 1;
+            END
+            """,
+            SQL_RECONSTRUIR_TOTAL,
+        ],
+    ]
+    
+    # Vendas finalizadas com mais dias que isso saem de Venda em arquivar_vendas
+    DIAS_SEM_ARQUIVAR = 365
+    
+    # Previsão de ruptura: dias de vendas que entram na média diária de cada produto, dias guardados
+    # em VendaProdutoDiaria (o excedente sai em podar_vendas_diarias) e prazo de reposição, em dias,
+    # abaixo do qual a previsão vira alerta
+    JANELA_PREVISAO = 28
+    DIAS_VENDA_DIARIA = 90
+    DIAS_REPOSICAO = 7
+    
+    # Passos de plano que percorrem uma tabela (ou um índice) inteira por natureza, por consulta
+    # (não são regressões): as listagens completas devolvem todas as linhas na ordem do índice, o
+    # estoque e a reconciliação passam por todos os produtos, a página de estoque baixo só percorre
+    # o que o índice parcial entrega e ArquivoVendas tem uma linha por ano arquivado. Qualquer
+    # outro SCAN ou ordenação sem índice no plano de um caminho é apontado.
+    VARREDURAS_ESPERADAS = {
+        "catalogo (completo)": ("SCAN p USING INDEX idx_produto_nome",),
+        "listar_produtos_pagina (estoque baixo)": ("SCAN e USING INDEX idx_estoque_baixo",
+                                                   "USE TEMP B-TREE FOR ORDER BY"),
+        "prever_ruptura": ("SCAN p USING COVERING INDEX idx_produto_nome",),
+        "estoque_em": ("SCAN e",),
+        "reconciliar_estoque": ("SCAN e", "SCAN Estoque"),
+        "analise (vendas do período)": ("SCAN ArquivoVendas",),
+        "listar_vendas (período)": ("SCAN ArquivoVendas",),
+        "listar_vendas (todas)": ("SCAN Venda USING INDEX idx_venda_data",),
+        "listar_promocoes": ("SCAN Promocao USING INDEX idx_promocao_inicio",),
+        "listar_despesas": ("SCAN Despesa USING INDEX idx_despesa_data",),
+    }
+    
+    def __init__(self, db_name='sorveteria.db', wal: bool = True, timeout: float = 5.0,
+                 instrumentacao: Optional[Instrumentacao] = None):
+        self.instrumentacao: Optional[Instrumentacao] = None
+        self.conexoes = GerenciadorConexoes(db_name, wal=wal, timeout=timeout)
+        self.conn = self.conexoes.escrita
+        self.conn_leitura = self.conexoes.leitura
+        self.ouvintes: List[Callable[[str, List[int]], None]] = []
+        self.gravacao_agrupada: Optional[GravacaoAgrupada] = None
+        self.indices_recriados: List[str] = []  # Preenchida por criar_tabelas, para quem abriu o banco
         self.criar_tabelas()
+        
+        self.catalogo = CatalogoCache(self._consultar_produtos, self._versao_dados)
+        self.adicionar_ouvinte(self.catalogo.ao_mudar_dados)
+        self.promocoes = MotorPromocoes(self._consultar_promocoes_ativas, self._versao_dados)
+        self.adicionar_ouvinte(self.promocoes.ao_mudar_dados)
+        if instrumentacao is not None:
+            self.instrumentar(instrumentacao)
     
     def criar_tabelas(self):
+        """Cria as tabelas, aplica as migrações pendentes e recria índices conhecidos que faltem;
+        num banco já atualizado e íntegro são só leituras"""
         cursor = self.conn.cursor()
+        versao = cursor.execute("PRAGMA user_version").fetchone()[0]
+        if versao == len(self.MIGRACOES):
+            # Esquema em dia: DDL só se algum índice sumiu
+            self.indices_recriados = self.recriar_indices_ausentes()
+            return
+        if versao > 0:
+            self.aplicar_migracoes()  # As tabelas base vêm de antes da primeira migração
+            self.indices_recriados = self.recriar_indices_ausentes()
+            return
         
         # Tabela Produto
         cursor.execute("""
@@ -69,108 +833,351 @@ class SorveteriaBackend:
         """)
         
         self.conn.commit()
+        self.aplicar_migracoes()
+    
+    def aplicar_migracoes(self):
+        """Aplica as migrações de esquema que ainda não foram aplicadas neste banco.
+        
+        Cada passo reserva a escrita (BEGIN IMMEDIATE) e só então relê a versão: se outro processo
+        ou thread abrir o banco ao mesmo tempo, um espera o outro e ninguém repete um passo (um
+        ALTER TABLE ... ADD COLUMN repetido falharia com "duplicate column").
+        """
+        cursor = self.conn.cursor()
+        while True:
+            try:
+                cursor.execute("BEGIN IMMEDIATE")
+                versao = cursor.execute("PRAGMA user_version").fetchone()[0]
+                if versao >= len(self.MIGRACOES):
+                    self.conn.rollback()
+                    return
+                for comando in self.MIGRACOES[versao]:
+                    cursor.execute(comando)
+                cursor.execute(f"PRAGMA user_version = {versao + 1}")
+                self.conn.commit()
+            except sqlite3.Error:
+                self.conn.rollback()
+                raise
+    
+    def indices_esperados(self) -> Dict[str, str]:
+        """Índices que as migrações deixam no banco, pelo nome, com o comando que cria cada um"""
+        indices = {}
+        for migracao in self.MIGRACOES:
+            for comando in migracao:
+                criado = re.match(r"\s*CREATE INDEX IF NOT EXISTS (\w+)", comando)
+                removido = re.match(r"\s*DROP INDEX IF EXISTS (\w+)", comando)
+                if criado:
+                    indices[criado.group(1)] = comando
+                elif removido:
+                    indices.pop(removido.group(1), None)
+        return indices
+    
+    def recriar_indices_ausentes(self) -> List[str]:
+        """Recria os índices conhecidos que não estão no banco (por exemplo, uma importação
+        interrompida por uma versão antiga que os removia) e devolve os nomes recriados"""
+        existentes = {linha[0] for linha in
+                      self.conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        ausentes = {nome: comando for nome, comando in self.indices_esperados().items()
+                    if nome not in existentes}
+        if not ausentes:
+            return []
+        
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            for comando in ausentes.values():
+                cursor.execute(comando)  # IF NOT EXISTS: outra abertura pode ter recriado antes
+            self.conn.commit()
+        except sqlite3.Error as e:
+            print(f"Erro ao recriar índices: {e}")
+            self.conn.rollback()
+            return []
+        return sorted(ausentes)
     
     def __del__(self):
-        self.conn.close()
+        self.conexoes.fechar()
+    
+    # Instrumentação
+    def instrumentar(self, instrumentacao: Instrumentacao):
+        """Passa a medir cada método público e cada comando SQL deste backend em `instrumentacao`"""
+        self.desinstrumentar()
+        for nome in metodos_publicos(type(self), {"instrumentar", "desinstrumentar"}):
+            setattr(self, nome, envolver_metodo(instrumentacao, nome, getattr(self, nome)))
+        instrumentar_conexao(self.conn, instrumentacao)
+        instrumentar_conexao(self.conn_leitura, instrumentacao)
+        self.instrumentacao = instrumentacao
+    
+    def desinstrumentar(self):
+        """Volta aos métodos e cursores originais, sem custo algum por chamada"""
+        if self.instrumentacao is None:
+            return
+        for nome in metodos_publicos(type(self), {"instrumentar", "desinstrumentar"}):
+            self.__dict__.pop(nome, None)
+        instrumentar_conexao(self.conn, None)
+        instrumentar_conexao(self.conn_leitura, None)
+        self.instrumentacao = None
+    
+    # Notificações de mudança
+    def adicionar_ouvinte(self, ouvinte: Callable[[str, List[int]], None]):
+        """Registra uma função chamada como ouvinte(tabela, codigos) após cada alteração gravada"""
+        self.ouvintes.append(ouvinte)
+    
+    def remover_ouvinte(self, ouvinte: Callable[[str, List[int]], None]):
+        """Remove um ouvinte registrado com adicionar_ouvinte"""
+        if ouvinte in self.ouvintes:
+            self.ouvintes.remove(ouvinte)
+    
+    def _notificar(self, tabela: str, codigos: List[int]):
+        for ouvinte in list(self.ouvintes):
+            ouvinte(tabela, [int(codigo) for codigo in codigos])
+    
+    # Gravação agrupada
+    def ativar_gravacao_agrupada(self, intervalo_ms: float = 50.0, max_operacoes: int = 200,
+                                 sincronizar: bool = True) -> GravacaoAgrupada:
+        """Liga a fila de gravações agrupadas (ver GravacaoAgrupada) e a retorna"""
+        self.desativar_gravacao_agrupada()
+        self.gravacao_agrupada = GravacaoAgrupada(self, intervalo_ms, max_operacoes, sincronizar)
+        return self.gravacao_agrupada
+    
+    def desativar_gravacao_agrupada(self):
+        """Grava o que estiver na fila e volta a um commit por operação"""
+        if self.gravacao_agrupada is not None:
+            self.gravacao_agrupada.encerrar()
+            self.gravacao_agrupada = None
+    
+    # Livro de movimentos de estoque
+    @staticmethod
+    def _agora() -> str:
+        return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    
+    def _registrar_movimentos(self, cursor: sqlite3.Cursor, movimentos: List[tuple]):
+        """Grava (codigo_produto, delta, motivo, codigo_venda) no livro, na transação do chamador"""
+        momento = self._agora()
+        cursor.executemany("""
+            INSERT INTO MovimentoEstoque (codigo_produto, delta, motivo, codigo_venda, momento)
+            VALUES (?, ?, ?, ?, ?)
+        """, [(*movimento, momento) for movimento in movimentos if movimento[1]])
     
     # Métodos para Produtos
-    def criar_produto(self, nome: str, preco: float, quantidade: int) -> Optional[int]:
-        """Cria um novo produto e seu registro de estoque"""
+    def criar_produto(self, nome: str, preco: float, quantidade: int,
+                      categoria: Optional[str] = None, estoque_minimo: Optional[int] = None) -> Optional[int]:
+        """Cria um novo produto e seu registro de estoque (sem `estoque_minimo`, vale o padrão do esquema)"""
         try:
             cursor = self.conn.cursor()
-            cursor.execute("INSERT INTO Produto (nome, preco) VALUES (?, ?)", (nome, preco))
+            cursor.execute("INSERT INTO Produto (nome, preco, categoria) VALUES (?, ?, ?)",
+                           (nome, preco, categoria or None))
             produto_id = cursor.lastrowid
             cursor.execute("INSERT INTO Estoque (codigo_produto, quantidade) VALUES (?, ?)", 
                          (produto_id, quantidade))
+            if estoque_minimo is not None:
+                cursor.execute("UPDATE Estoque SET estoque_minimo = ? WHERE codigo_produto = ?",
+                               (estoque_minimo, produto_id))
+            self._registrar_movimentos(cursor, [(produto_id, quantidade, 'cadastro', None)])
             self.conn.commit()
+            self._notificar('Produto', [produto_id])
             return produto_id
         except sqlite3.Error as e:
             print(f"Erro ao criar produto: {e}")
             self.conn.rollback()
             return None
     
-    def obter_produto_por_id(self, produto_id: int) -> Optional[Dict]:
-        """Obtém um produto específico pelo seu código"""
-        try:
-            cursor = self.conn.cursor()
+    def _consultar_produtos(self, codigos: Optional[List[int]] = None) -> List[Dict]:
+        """Lê do banco os produtos com estoque (todos, ou só os códigos informados), por nome"""
+        cursor = self.conn_leitura.cursor()
+        if codigos is None:
             cursor.execute("""
-                SELECT p.codigo, p.nome, p.preco, e.quantidade 
+                SELECT p.codigo, p.nome, p.preco, p.categoria, e.quantidade, e.estoque_minimo
                 FROM Produto p
                 JOIN Estoque e ON p.codigo = e.codigo_produto
-                WHERE p.codigo = ?
-            """, (produto_id,))
-            produto = cursor.fetchone()
-            return dict(produto) if produto else None
+                ORDER BY p.nome, p.codigo
+            """)
+        else:
+            lista, parametros = marcadores(codigos)
+            cursor.execute(f"""
+                SELECT p.codigo, p.nome, p.preco, p.categoria, e.quantidade, e.estoque_minimo
+                FROM Produto p
+                JOIN Estoque e ON p.codigo = e.codigo_produto
+                WHERE p.codigo IN ({lista})
+            """, parametros)
+        return [dict(row) for row in cursor.fetchall()]
+    
+    def _registros(self, registro, sql: str, parametros=(), tamanho_lote: int = 1000) -> Iterator:
+        """Executa `sql` na conexão de leitura e entrega cada linha como `registro`, lendo em lotes
+        de fetchmany: só um lote fica em memória por vez. Até o gerador terminar (ou ser fechado)
+        o cursor segura o mesmo instantâneo do banco."""
+        cursor = self.conn_leitura.cursor()
+        cursor.row_factory = None  # A tupla do sqlite3 vira o registro direto, sem sqlite3.Row no meio
+        try:
+            cursor.execute(sql, parametros)
+            while True:
+                linhas = cursor.fetchmany(tamanho_lote)
+                if not linhas:
+                    return
+                yield from map(registro._make, linhas)
+        finally:
+            cursor.close()
+    
+    def _versao_dados(self) -> int:
+        # Muda sempre que outra conexão (inclusive a de escrita deste backend) grava no banco
+        return self.conn_leitura.execute("PRAGMA data_version").fetchone()[0]
+    
+    def obter_produto_por_id(self, produto_id: int) -> Optional[Dict]:
+        """Obtém um produto específico pelo seu código"""
+        try:
+            return self.catalogo.obter(int(produto_id))
+        except ValueError:
+            return None
         except sqlite3.Error as e:
             print(f"Erro ao obter produto: {e}")
             return None
     
-    def listar_produtos(self) -> List[Dict]:
-        """Lista todos os produtos com suas quantidades em estoque"""
+    def obter_produtos(self, codigos: List[int]) -> List[Dict]:
+        """Obtém os produtos (com estoque) cujos códigos estão na lista"""
         try:
-            cursor = self.conn.cursor()
-            cursor.execute("""
-                SELECT p.codigo, p.nome, p.preco, e.quantidade 
+            produtos = [self.catalogo.obter(int(codigo)) for codigo in codigos]
+            return [produto for produto in produtos if produto]
+        except sqlite3.Error as e:
+            print(f"Erro ao obter produtos: {e}")
+            return []
+    
+    def iter_produtos(self, tamanho_lote: int = 1000) -> Iterator[Produto]:
+        """Percorre os produtos com estoque, por nome, direto do banco (sem passar pelo catálogo)"""
+        try:
+            yield from self._registros(Produto, """
+                SELECT p.codigo, p.nome, p.preco, p.categoria, e.quantidade, e.estoque_minimo
                 FROM Produto p
                 JOIN Estoque e ON p.codigo = e.codigo_produto
-                ORDER BY p.nome
-            """)
+                ORDER BY p.nome, p.codigo
+            """, (), tamanho_lote)
+        except sqlite3.Error as e:
+            print(f"Erro ao listar produtos: {e}")
+    
+    def listar_produtos(self) -> List[Dict]:
+        """Lista todos os produtos com suas quantidades em estoque"""
+        try:
+            return self.catalogo.listar()
+        except sqlite3.Error as e:
+            print(f"Erro ao listar produtos: {e}")
+            return []
+    
+    def listar_produtos_pagina(self, after_nome: Optional[str] = None, after_codigo: Optional[int] = None,
+                               limit: int = 50, estoque_abaixo_de: Optional[int] = None,
+                               estoque_baixo: bool = False) -> List[Dict]:
+        """Lista uma página de produtos em ordem de nome, continuando após o último item exibido.
+        
+        `estoque_baixo` fica só com os produtos abaixo do próprio estoque mínimo (pelo índice
+        parcial idx_estoque_baixo); `estoque_abaixo_de`, com os abaixo de um limite único.
+        """
+        try:
+            cursor = self.conn_leitura.cursor()
+            condicoes = []
+            parametros = []
+            
+            if after_codigo is not None:
+                condicoes.append("(p.nome, p.codigo) > (?, ?)")
+                parametros.extend([after_nome, after_codigo])
+            if estoque_abaixo_de is not None:
+                condicoes.append("e.quantidade < ?")
+                parametros.append(estoque_abaixo_de)
+            # Sozinho, o planejador percorre todos os produtos pelo índice de nome; com CROSS JOIN
+            # parte do índice parcial (só os que estão abaixo do mínimo) e ordena esses poucos
+            juncao = "Produto p JOIN Estoque e"
+            if estoque_baixo:
+                condicoes.append("e.quantidade < e.estoque_minimo")  # Igual ao WHERE do índice parcial
+                juncao = "Estoque e CROSS JOIN Produto p"
+            
+            where = f"WHERE {' AND '.join(condicoes)}" if condicoes else ""
+            cursor.execute(f"""
+                SELECT p.codigo, p.nome, p.preco, p.categoria, e.quantidade, e.estoque_minimo
+                FROM {juncao} ON p.codigo = e.codigo_produto
+                {where}
+                ORDER BY p.nome, p.codigo
+                LIMIT ?
+            """, (*parametros, limit))
             return [dict(row) for row in cursor.fetchall()]
         except sqlite3.Error as e:
             print(f"Erro ao listar produtos: {e}")
             return []
     
-    def atualizar_produto(self, codigo: int, nome: str, preco: float, quantidade: int) -> bool:
-        """Atualiza os dados de um produto e seu estoque"""
+    def atualizar_produto(self, codigo: int, nome: str, preco: float, quantidade: int,
+                          categoria: Optional[str] = None, estoque_minimo: Optional[int] = None) -> bool:
+        """Atualiza os dados de um produto e seu estoque (o estoque mínimo só se `estoque_minimo` vier)"""
         try:
             cursor = self.conn.cursor()
             
             # Atualiza produto
             cursor.execute("""
                 UPDATE Produto 
-                SET nome = ?, preco = ? 
+                SET nome = ?, preco = ?, categoria = ? 
                 WHERE codigo = ?
-            """, (nome, preco, codigo))
+            """, (nome, preco, categoria or None, codigo))
             
-            # Atualiza estoque
+            # Atualiza estoque, registrando a diferença no livro
+            cursor.execute("SELECT quantidade FROM Estoque WHERE codigo_produto = ?", (codigo,))
+            anterior = cursor.fetchone()
             cursor.execute("""
                 UPDATE Estoque 
-                SET quantidade = ? 
+                SET quantidade = ?, estoque_minimo = COALESCE(?, estoque_minimo) 
                 WHERE codigo_produto = ?
-            """, (quantidade, codigo))
+            """, (quantidade, estoque_minimo, codigo))
+            atualizado = cursor.rowcount > 0
+            if anterior is not None:
+                self._registrar_movimentos(cursor, [(codigo, quantidade - anterior[0], 'edicao', None)])
             
             self.conn.commit()
-            return cursor.rowcount > 0
+            if atualizado:
+                self._notificar('Produto', [codigo])
+            return atualizado
         except sqlite3.Error as e:
             print(f"Erro ao atualizar produto: {e}")
             self.conn.rollback()
             return False
     
+    @staticmethod
+    def _tem_vendas(cursor: sqlite3.Cursor, codigo: int) -> bool:
+        """Se o produto tem vendas em Venda ou já arquivadas"""
+        cursor.execute("SELECT 1 FROM Venda WHERE codigo_produto = ? LIMIT 1", (codigo,))
+        if cursor.fetchone():
+            return True
+        cursor.execute("SELECT 1 FROM VendaArquivadaMensal WHERE codigo_produto = ? LIMIT 1", (codigo,))
+        return cursor.fetchone() is not None
+    
     def excluir_produto(self, codigo: int) -> bool:
         """Remove um produto e seu registro de estoque"""
         try:
             cursor = self.conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
             
-            # Verifica se há vendas associadas ao produto
-            cursor.execute("SELECT COUNT(*) FROM Venda WHERE codigo_produto = ?", (codigo,))
-            if cursor.fetchone()[0] > 0:
-                return False  # Não permite excluir produtos com vendas registradas
+            # Não permite excluir produtos com vendas registradas
+            if self._tem_vendas(cursor, codigo):
+                self.conn.rollback()
+                return False
             
-            # Remove o estoque primeiro por causa da constraint de chave estrangeira
+            # Remove o estoque primeiro por causa da constraint de chave estrangeira;
+            # o saldo que sai fica registrado no livro
+            cursor.execute("SELECT quantidade FROM Estoque WHERE codigo_produto = ?", (codigo,))
+            anterior = cursor.fetchone()
+            if anterior is not None:
+                self._registrar_movimentos(cursor, [(codigo, -anterior[0], 'exclusao', None)])
             cursor.execute("DELETE FROM Estoque WHERE codigo_produto = ?", (codigo,))
             
             # Remove o produto
             cursor.execute("DELETE FROM Produto WHERE codigo = ?", (codigo,))
             
             self.conn.commit()
+            if cursor.rowcount > 0:
+                self._notificar('Produto', [codigo])
             return cursor.rowcount > 0
         except sqlite3.Error as e:
             print(f"Erro ao excluir produto: {e}")
             self.conn.rollback()
             return False
     
-    def atualizar_estoque(self, produto_id: int, quantidade_alterar: int) -> bool:
-        """Atualiza a quantidade em estoque de um produto"""
+    def produto_tem_vendas(self, codigo: int) -> bool:
+        """Se o produto tem vendas registradas, o que impede a exclusão"""
+        return self._tem_vendas(self.conn_leitura.cursor(), codigo)
+    
+    def atualizar_estoque(self, produto_id: int, quantidade_alterar: int, motivo: str = 'ajuste') -> bool:
+        """Soma (ou subtrai) uma quantidade ao estoque de um produto, registrando o motivo no livro"""
         try:
             cursor = self.conn.cursor()
             cursor.execute("""
@@ -178,169 +1185,747 @@ class SorveteriaBackend:
                 SET quantidade = quantidade + ? 
                 WHERE codigo_produto = ?
             """, (quantidade_alterar, produto_id))
+            atualizado = cursor.rowcount > 0
+            if atualizado:
+                self._registrar_movimentos(cursor, [(produto_id, quantidade_alterar, motivo or 'ajuste', None)])
             self.conn.commit()
-            return cursor.rowcount > 0
+            if atualizado:
+                self._notificar('Estoque', [produto_id])
+            return atualizado
         except sqlite3.Error as e:
             print(f"Erro ao atualizar estoque: {e}")
             self.conn.rollback()
             return False
     
+    def criar_snapshot_estoque(self) -> int:
+        """Fotografa o estoque atual de todos os produtos; retorna quantos foram fotografados"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")  # Nenhum movimento entra entre a leitura do livro e a do estoque
+            cursor.execute("SELECT COALESCE(MAX(codigo), 0) FROM MovimentoEstoque")
+            ultimo_movimento = cursor.fetchone()[0]
+            cursor.execute("""
+                INSERT OR REPLACE INTO SnapshotEstoque (codigo_produto, momento, quantidade, ultimo_movimento)
+                SELECT codigo_produto, ?, quantidade, ? FROM Estoque
+            """, (self._agora(), ultimo_movimento))
+            fotografados = cursor.rowcount
+            self.conn.commit()
+            return fotografados
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            print(f"Erro ao fotografar estoque: {e}")
+            return 0
+    
+    def estoque_em(self, momento: Optional[str] = None) -> Dict[int, int]:
+        """Estoque de cada produto num momento ('AAAA-MM-DD' vale o fim do dia; None, agora).
+        
+        Parte da última fotografia do produto até o momento e soma só os movimentos posteriores
+        a ela, em vez de repassar o livro inteiro. Momentos anteriores à primeira fotografia de
+        um produto que já existia antes do livro não têm como ser reconstituídos.
+        """
+        if momento is None:
+            momento = "9999-12-31 23:59:59"
+        elif len(momento) == 10:
+            momento += " 23:59:59"
+        try:
+            cursor = self.conn_leitura.cursor()
+            cursor.execute("""
+                SELECT e.codigo_produto,
+                       COALESCE(s.quantidade, 0) + COALESCE((
+                           SELECT SUM(m.delta) FROM MovimentoEstoque m
+                           WHERE m.codigo_produto = e.codigo_produto
+                             AND m.momento BETWEEN COALESCE(s.momento, '') AND :momento
+                             AND m.codigo > COALESCE(s.ultimo_movimento, 0)
+                       ), 0) AS quantidade
+                FROM Estoque e
+                LEFT JOIN SnapshotEstoque s ON s.codigo_produto = e.codigo_produto AND s.momento = (
+                    SELECT MAX(momento) FROM SnapshotEstoque
+                    WHERE codigo_produto = e.codigo_produto AND momento <= :momento
+                )
+            """, {"momento": momento})
+            return {row['codigo_produto']: row['quantidade'] for row in cursor.fetchall()}
+        except sqlite3.Error as e:
+            print(f"Erro ao calcular estoque: {e}")
+            return {}
+    
+    def reconciliar_estoque(self) -> List[Dict]:
+        """Produtos cujo Estoque difere da última fotografia mais os movimentos do livro"""
+        esperado = self.estoque_em()
+        try:
+            cursor = self.conn_leitura.cursor()
+            cursor.execute("SELECT codigo_produto, quantidade FROM Estoque")
+            divergencias = []
+            for row in cursor.fetchall():
+                calculado = esperado.get(row['codigo_produto'], 0)
+                if row['quantidade'] != calculado:
+                    divergencias.append({
+                        "codigo_produto": row['codigo_produto'],
+                        "estoque": row['quantidade'],
+                        "livro": calculado,
+                        "diferenca": row['quantidade'] - calculado,
+                    })
+            return divergencias
+        except sqlite3.Error as e:
+            print(f"Erro ao reconciliar estoque: {e}")
+            return []
+    
+    def prever_ruptura(self, janela_dias: Optional[int] = None) -> List[Dict]:
+        """Estima em quantos dias o estoque de cada produto acaba, no ritmo de venda dos últimos
+        `janela_dias` (padrão: JANELA_PREVISAO), do que acaba primeiro ao que acaba por último.
+        
+        A média diária vem de VendaProdutoDiaria, que o trigger atualiza a cada venda: são no máximo
+        `janela_dias` linhas por produto, sem varrer Venda. A média divide pela janela inteira,
+        então um produto cadastrado há poucos dias aparece vendendo menos do que vende. Produtos
+        sem venda na janela (média diária zero) ficam de fora: não há ritmo para prever.
+        """
+        janela = janela_dias or self.JANELA_PREVISAO
+        hoje = datetime.now()
+        inicio = (hoje - timedelta(days=janela - 1)).strftime("%Y-%m-%d")
+        try:
+            cursor = self.conn_leitura.cursor()
+            cursor.execute("""
+                SELECT p.codigo, p.nome, e.quantidade, e.estoque_minimo,
+                       (SELECT COALESCE(SUM(d.unidades), 0) FROM VendaProdutoDiaria d
+                        WHERE d.codigo_produto = e.codigo_produto AND d.data >= ?) AS unidades
+                FROM Estoque e
+                JOIN Produto p ON p.codigo = e.codigo_produto
+            """, (inicio,))
+            previsoes = []
+            for row in cursor.fetchall():
+                media = row['unidades'] / janela
+                if media <= 0:
+                    continue
+                dias = max(row['quantidade'], 0) / media
+                previsoes.append({
+                    "codigo": row['codigo'],
+                    "nome": row['nome'],
+                    "quantidade": row['quantidade'],
+                    "estoque_minimo": row['estoque_minimo'],
+                    "media_diaria": round(media, 2),
+                    "dias_ate_acabar": round(dias, 1),
+                    "data_ruptura": (hoje + timedelta(days=dias)).strftime("%Y-%m-%d"),
+                })
+            previsoes.sort(key=lambda previsao: previsao['dias_ate_acabar'])
+            return previsoes
+        except sqlite3.Error as e:
+            print(f"Erro ao prever ruptura de estoque: {e}")
+            return []
+    
+    def alertas_estoque(self, dias_reposicao: Optional[int] = None) -> List[Dict]:
+        """Produtos abaixo do estoque mínimo ou que acabam em até `dias_reposicao` dias (padrão:
+        DIAS_REPOSICAO), a tempo de fazer o pedido. Os abaixo do mínimo sem venda recente vêm no
+        fim, com media_diaria, dias_ate_acabar e data_ruptura None"""
+        prazo = self.DIAS_REPOSICAO if dias_reposicao is None else dias_reposicao
+        alertas = [
+            previsao for previsao in self.prever_ruptura()
+            if previsao['quantidade'] < previsao['estoque_minimo'] or previsao['dias_ate_acabar'] <= prazo
+        ]
+        com_previsao = {alerta['codigo'] for alerta in alertas}
+        try:
+            cursor = self.conn_leitura.cursor()
+            cursor.execute("""
+                SELECT p.codigo, p.nome, e.quantidade, e.estoque_minimo
+                FROM Estoque e CROSS JOIN Produto p ON p.codigo = e.codigo_produto
+                WHERE e.quantidade < e.estoque_minimo
+                ORDER BY p.nome, p.codigo
+            """)
+            for row in cursor.fetchall():
+                if row['codigo'] not in com_previsao:
+                    alertas.append({**dict(row), "media_diaria": None, "dias_ate_acabar": None, "data_ruptura": None})
+            return alertas
+        except sqlite3.Error as e:
+            print(f"Erro ao listar alertas de estoque: {e}")
+            return alertas
+    
+    def podar_vendas_diarias(self, dias: Optional[int] = None) -> int:
+        """Apaga de VendaProdutoDiaria os dias mais antigos que `dias` (padrão: DIAS_VENDA_DIARIA),
+        que nenhuma previsão usa; retorna quantas linhas saíram"""
+        dias = self.DIAS_VENDA_DIARIA if dias is None else dias
+        limite = (datetime.now() - timedelta(days=dias)).strftime("%Y-%m-%d")
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("DELETE FROM VendaProdutoDiaria WHERE data < ?", (limite,))
+            self.conn.commit()
+            return cursor.rowcount
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            print(f"Erro ao podar vendas diárias: {e}")
+            return 0
+    
     # Métodos para Vendas
+    def _promocao_para(self, produto_id: int, data: str, codigo_promocao: Optional[int] = None) -> tuple:
+        """Escolhe a promoção da venda: a informada, se valer para o produto, ou a de maior desconto.
+        
+        Retorna (promoção ou None, erro).
+        """
+        produto = self.catalogo.obter(produto_id)
+        categoria = produto['categoria'] if produto else None
+        if codigo_promocao is None:
+            return self.promocoes.melhor(produto_id, categoria, data), None
+        promocao = self.promocoes.aplicavel(int(codigo_promocao), produto_id, categoria, data)
+        if promocao is None:
+            return None, f"Promoção {codigo_promocao} não vale para este produto hoje"
+        return promocao, None
+    
+    @staticmethod
+    def _total_com_desconto(quantidade: int, preco_unitario: float, promocao: Optional[Dict]) -> float:
+        total = quantidade * preco_unitario
+        if promocao:
+            total = round(total * (1 - promocao['desconto_percentual'] / 100), 2)
+        return total
+    
+    def _gravar_venda(self, cursor: sqlite3.Cursor, produto_id: int, produto_nome: str, quantidade: int,
+                      preco_unitario: float, promocao: Optional[Dict], data: str, hora: str) -> tuple:
+        """Baixa o estoque e insere a venda, na transação do chamador. Retorna (venda_id, erro)"""
+        # Com quantidade negativa a baixa condicional abaixo sempre passa e devolveria unidades ao estoque
+        if quantidade <= 0:
+            return None, "Quantidade deve ser maior que zero"
+        # Baixa o estoque só se houver quantidade suficiente, num único comando,
+        # para dois caixas nunca venderem a mesma unidade
+        cursor.execute("""
+            UPDATE Estoque 
+            SET quantidade = quantidade - ? 
+            WHERE codigo_produto = ? AND quantidade >= ?
+        """, (quantidade, produto_id, quantidade))
+        
+        if cursor.rowcount == 0:
+            return None, "Estoque insuficiente"
+        
+        # Calcular total
+        total = self._total_com_desconto(quantidade, preco_unitario, promocao)
+        
+        # Inserir venda
+        cursor.execute("""
+            INSERT INTO Venda (
+                codigo_produto, produto_nome, quantidade, preco_unitario, 
+                valor_total, data, hora, status, codigo_promocao
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (
+            produto_id, produto_nome, quantidade, preco_unitario,
+            total, data, hora, 'aberta',
+            promocao['codigo'] if promocao else None
+        ))
+        
+        venda_id = cursor.lastrowid
+        self._registrar_movimentos(cursor, [(produto_id, -quantidade, 'venda', venda_id)])
+        return venda_id, None
+    
     def criar_venda(self, produto_id: int, produto_nome: str, quantidade: int, 
                    preco_unitario: float, codigo_promocao: Optional[int] = None) -> tuple:
-        """Cria uma nova venda e atualiza o estoque"""
+        """Cria uma nova venda, com o desconto da promoção vigente, e atualiza o estoque"""
+        data = datetime.now().strftime("%Y-%m-%d")
         try:
+            promocao, erro = self._promocao_para(produto_id, data, codigo_promocao)
+            if erro:
+                return None, erro
+            
             cursor = self.conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            venda_id, erro = self._gravar_venda(cursor, produto_id, produto_nome, quantidade, preco_unitario,
+                                                promocao, data, datetime.now().strftime("%H:%M:%S"))
+            if erro:
+                self.conn.rollback()
+                return None, erro
+            self.conn.commit()
+            self._notificar('Venda', [venda_id])
+            self._notificar('Estoque', [produto_id])
+            return venda_id, None
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            print(f"Erro ao criar venda: {e}")
+            return None, str(e)
+    
+    def criar_venda_lote(self, itens: List[Dict], codigo_promocao: Optional[int] = None) -> tuple:
+        """Registra várias vendas (um carrinho) numa única transação: ou todas entram, ou nenhuma.
+        
+        Cada item é um dicionário com 'produto_id' e 'quantidade'; nome e preço vêm do cadastro.
+        Cada item leva a promoção de maior desconto que vale para ele; `codigo_promocao` força
+        essa promoção nos itens em que ela vale. Retorna (lista de códigos das vendas, erro).
+        """
+        if not itens:
+            return [], "Carrinho vazio"
+        for item in itens:
+            if item['quantidade'] <= 0:
+                return [], f"Quantidade do produto {item['produto_id']} deve ser maior que zero"
+        
+        # Soma as quantidades por produto, caso o mesmo sabor apareça mais de uma vez
+        necessario: Dict[int, int] = {}
+        for item in itens:
+            produto_id = int(item['produto_id'])
+            necessario[produto_id] = necessario.get(produto_id, 0) + item['quantidade']
+        
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")  # Reserva a escrita antes de conferir o estoque
             
-            # Verificar estoque
-            cursor.execute("SELECT quantidade FROM Estoque WHERE codigo_produto = ?", (produto_id,))
-            estoque = cursor.fetchone()
+            # Verificar estoque de todos os itens de uma vez
+            lista, parametros = marcadores(list(necessario))
+            cursor.execute(f"""
+                SELECT p.codigo, p.nome, p.preco, p.categoria, e.quantidade 
+                FROM Produto p
+                JOIN Estoque e ON p.codigo = e.codigo_produto
+                WHERE p.codigo IN ({lista})
+            """, parametros)
+            produtos = {row['codigo']: row for row in cursor.fetchall()}
             
-            if not estoque or estoque['quantidade'] < quantidade:
-                return None, "Estoque insuficiente"
+            for produto_id, quantidade in necessario.items():
+                produto = produtos.get(produto_id)
+                if not produto:
+                    self.conn.rollback()
+                    return [], f"Produto {produto_id} não encontrado"
+                if produto['quantidade'] < quantidade:
+                    self.conn.rollback()
+                    return [], f"Estoque insuficiente para {produto['nome']} (atual: {produto['quantidade']})"
             
-            # Calcular total
-            total = quantidade * preco_unitario
+            data = datetime.now().strftime("%Y-%m-%d")
+            hora = datetime.now().strftime("%H:%M:%S")
+            cursor.execute("SELECT COALESCE(MAX(codigo), 0) FROM Venda")
+            ultimo_codigo = cursor.fetchone()[0]
             
-            # Inserir venda
-            cursor.execute("""
+            linhas = []
+            for item in itens:
+                produto = produtos[int(item['produto_id'])]
+                promocao = None
+                if codigo_promocao is not None:
+                    promocao, _ = self._promocao_para(produto['codigo'], data, codigo_promocao)
+                if promocao is None:
+                    promocao, _ = self._promocao_para(produto['codigo'], data)
+                linhas.append((
+                    produto['codigo'], produto['nome'], item['quantidade'], produto['preco'],
+                    self._total_com_desconto(item['quantidade'], produto['preco'], promocao),
+                    data, hora, 'aberta', promocao['codigo'] if promocao else None
+                ))
+            
+            # Inserir vendas
+            cursor.executemany("""
                 INSERT INTO Venda (
                     codigo_produto, produto_nome, quantidade, preco_unitario, 
                     valor_total, data, hora, status, codigo_promocao
                 ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                produto_id, produto_nome, quantidade, preco_unitario,
-                total, datetime.now().strftime("%Y-%m-%d"), 
-                datetime.now().strftime("%H:%M:%S"), 'aberta', codigo_promocao
-            ))
+            """, linhas)
             
-            # Atualizar estoque
-            cursor.execute("""
+            # Atualizar estoque, com a mesma baixa condicional de criar_venda
+            cursor.executemany("""
                 UPDATE Estoque 
                 SET quantidade = quantidade - ? 
-                WHERE codigo_produto = ?
-            """, (quantidade, produto_id))
+                WHERE codigo_produto = ? AND quantidade >= ?
+            """, [(quantidade, produto_id, quantidade) for produto_id, quantidade in necessario.items()])
+            if cursor.rowcount != len(necessario):
+                self.conn.rollback()
+                return [], "Estoque insuficiente"
+            
+            # Com a escrita reservada, os códigos novos são exatamente os maiores que o anterior
+            cursor.execute("SELECT codigo FROM Venda WHERE codigo > ? ORDER BY codigo", (ultimo_codigo,))
+            vendas_ids = [row['codigo'] for row in cursor.fetchall()]
+            
+            # executemany insere na ordem dos itens, então cada código corresponde a um item
+            self._registrar_movimentos(cursor, [
+                (int(item['produto_id']), -item['quantidade'], 'venda', venda_id)
+                for item, venda_id in zip(itens, vendas_ids)
+            ])
             
-            venda_id = cursor.lastrowid
             self.conn.commit()
-            return venda_id, None
+            self._notificar('Venda', vendas_ids)
+            self._notificar('Estoque', list(necessario))
+            return vendas_ids, None
         except sqlite3.Error as e:
             self.conn.rollback()
-            print(f"Erro ao criar venda: {e}")
-            return None, str(e)
+            print(f"Erro ao criar vendas do carrinho: {e}")
+            return [], str(e)
+    
+    @staticmethod
+    def _gravar_finalizacao(cursor: sqlite3.Cursor, venda_id: int) -> bool:
+        cursor.execute("""
+            UPDATE Venda 
+            SET status = 'finalizada' 
+            WHERE codigo = ?
+        """, (venda_id,))
+        return cursor.rowcount > 0
     
     def finalizar_venda(self, venda_id: int) -> bool:
         """Marca uma venda como finalizada"""
         try:
-            cursor = self.conn.cursor()
-            cursor.execute("""
-                UPDATE Venda 
-                SET status = 'finalizada' 
-                WHERE codigo = ?
-            """, (venda_id,))
+            finalizada = self._gravar_finalizacao(self.conn.cursor(), venda_id)
             self.conn.commit()
-            return cursor.rowcount > 0
+            if finalizada:
+                self._notificar('Venda', [venda_id])
+            return finalizada
         except sqlite3.Error as e:
             self.conn.rollback()
             print(f"Erro ao finalizar venda: {e}")
             return False
     
-    def listar_vendas(self, status: Optional[str] = None) -> List[Dict]:
-        """Lista vendas, opcionalmente filtrando por status"""
+    def obter_vendas(self, codigos: List[int]) -> List[Dict]:
+        """Obtém as vendas cujos códigos estão na lista"""
         try:
-            cursor = self.conn.cursor()
+            cursor = self.conn_leitura.cursor()
+            lista, parametros = marcadores(codigos)
+            cursor.execute(f"SELECT * FROM Venda WHERE codigo IN ({lista})", parametros)
+            return [dict(row) for row in cursor.fetchall()]
+        except sqlite3.Error as e:
+            print(f"Erro ao obter vendas: {e}")
+            return []
+    
+    def iter_vendas(self, status: Optional[str] = None, data_inicio: Optional[str] = None,
+                    data_fim: Optional[str] = None, tamanho_lote: int = 1000) -> Iterator[Venda]:
+        """Percorre as vendas (mais recentes primeiro) como registros Venda, um lote de cada vez,
+        opcionalmente filtrando por status e período (AAAA-MM-DD, inclusive).
+        
+        Os arquivos anuais só são lidos quando `data_inicio` alcança o período arquivado; sem ela,
+        vêm as vendas que ainda estão em Venda.
+        """
+        try:
+            condicoes = []
+            parametros = []
             
             if status:
-                cursor.execute("""
-                    SELECT * FROM Venda 
-                    WHERE status = ? 
-                    ORDER BY data DESC, hora DESC
-                """, (status,))
-            else:
-                cursor.execute("""
-                    SELECT * FROM Venda 
-                    ORDER BY data DESC, hora DESC
-                """)
-                
-            return [dict(row) for row in cursor.fetchall()]
+                condicoes.append("status = ?")
+                parametros.append(status)
+            if data_inicio:
+                condicoes.append("data >= ?")
+                parametros.append(data_inicio)
+            if data_fim:
+                condicoes.append("data <= ?")
+                parametros.append(data_fim)
+            
+            fonte = "Venda" if status == 'aberta' else self._fonte_vendas(data_inicio)
+            where = f"WHERE {' AND '.join(condicoes)}" if condicoes else ""
+            yield from self._registros(Venda, f"""
+                SELECT {COLUNAS_VENDA} FROM {fonte} 
+                {where}
+                ORDER BY data DESC, hora DESC
+            """, parametros, tamanho_lote)
+        except sqlite3.Error as e:
+            print(f"Erro ao listar vendas: {e}")
+    
+    def listar_vendas(self, status: Optional[str] = None, data_inicio: Optional[str] = None,
+                      data_fim: Optional[str] = None) -> List[Dict]:
+        """Lista vendas como dicionários (ver iter_vendas, que não monta a lista inteira)"""
+        return [venda._asdict() for venda in self.iter_vendas(status, data_inicio, data_fim)]
+    
+    def listar_vendas_pagina(self, status: Optional[str] = None, after_data: Optional[str] = None,
+                             after_hora: Optional[str] = None, after_codigo: Optional[int] = None,
+                             limit: int = 50) -> List[Dict]:
+        """Lista uma página de vendas (mais recentes primeiro), continuando após a última venda exibida.
+        
+        A rolagem entra nos arquivos anuais sozinha quando passa da data de corte do arquivamento.
+        """
+        try:
+            cursor = self.conn_leitura.cursor()
+            condicoes = []
+            parametros = []
+            
+            if status:
+                condicoes.append("status = ?")
+                parametros.append(status)
+            if after_codigo is not None:
+                condicoes.append("(data, hora, codigo) < (?, ?, ?)")
+                parametros.extend([after_data, after_hora, after_codigo])
+            
+            where = f"WHERE {' AND '.join(condicoes)}" if condicoes else ""
+            
+            def consultar(fonte: str) -> List[Dict]:
+                cursor.execute(f"""
+                    SELECT * FROM {fonte} 
+                    {where}
+                    ORDER BY data DESC, hora DESC, codigo DESC
+                    LIMIT ?
+                """, (*parametros, limit))
+                return [dict(row) for row in cursor.fetchall()]
+            
+            vendas = consultar("Venda")
+            # Vendas arquivadas são anteriores à data de corte: só fazem falta numa página
+            # incompleta ou que já desceu abaixo dela
+            if status != 'aberta':
+                corte = cursor.execute("SELECT MAX(ate_data) FROM ArquivoVendas").fetchone()[0]
+                if corte and (len(vendas) < limit or vendas[-1]['data'] < corte):
+                    vendas = consultar(self._fonte_vendas(""))
+            return vendas
         except sqlite3.Error as e:
             print(f"Erro ao listar vendas: {e}")
             return []
     
+    def _cursor_vendas_periodo(self, inicio: str, fim: str, status: str = 'finalizada') -> sqlite3.Cursor:
+        """Cursor de tuplas com as colunas que sorveteria_analise lê das vendas de `inicio` a `fim`
+        (AAAA-MM-DD, inclusive), arquivadas ou não: produto, quantidade, valor, dias desde 1970,
+        hora e promoção (0 quando não houve). Quem chama lê em blocos e fecha."""
+        cursor = self.conn_leitura.cursor()
+        cursor.row_factory = None  # Tuplas simples: sqlite3.Row custa caro em um milhão de linhas
+        cursor.execute(f"""
+            SELECT codigo_produto, quantidade, valor_total,
+                   CAST(julianday(data) - 2440587.5 AS INTEGER),
+                   CAST(substr(hora, 1, 2) AS INTEGER),
+                   COALESCE(codigo_promocao, 0)
+            FROM {self._fonte_vendas(inicio)}
+            WHERE status = ? AND data BETWEEN ? AND ?
+        """, (status, inicio, fim))
+        return cursor
+    
+    # Arquivo de vendas antigas
+    def _anexar_arquivos(self, conn: sqlite3.Connection, arquivos: List[sqlite3.Row]):
+        """ATTACH dos arquivos anuais (linhas de ArquivoVendas) que ainda não estão anexados nesta
+        conexão, soltando outros arquivos se o limite de bancos anexados do SQLite for atingido"""
+        anexados = [linha[1] for linha in conn.execute("PRAGMA database_list") if linha[1].startswith("arquivo_")]
+        pedidos = {f"arquivo_{arquivo['ano']}" for arquivo in arquivos}
+        limite = conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+        if len(pedidos) > limite:
+            raise sqlite3.OperationalError(f"O período alcança {len(pedidos)} arquivos anuais; o SQLite anexa até {limite}")
+        faltando = [arquivo for arquivo in arquivos if f"arquivo_{arquivo['ano']}" not in anexados]
+        sobrando = [nome for nome in anexados if nome not in pedidos]
+        for nome in sobrando[:max(0, len(anexados) + len(faltando) - limite)]:
+            conn.execute(f"DETACH DATABASE {nome}")
+        pasta = os.path.dirname(os.path.abspath(self.conexoes.db_name))
+        for arquivo in faltando:
+            caminho = os.path.join(pasta, arquivo['arquivo'])
+            if not os.path.exists(caminho):  # ATTACH criaria um banco vazio no lugar
+                raise sqlite3.OperationalError(f"Arquivo de vendas não encontrado: {caminho}")
+            conn.execute(f"ATTACH DATABASE ? AS arquivo_{arquivo['ano']}", (caminho,))
+    
+    @staticmethod
+    def _soltar_arquivos(conn: sqlite3.Connection):
+        for linha in conn.execute("PRAGMA database_list").fetchall():
+            if linha[1].startswith("arquivo_"):
+                conn.execute(f"DETACH DATABASE {linha[1]}")
+    
+    def _fontes_vendas(self, data_inicio: str, conn: Optional[sqlite3.Connection] = None) -> List[Tuple[str, str]]:
+        """Tabelas de onde vêm as vendas de uma consulta que começa em `data_inicio`, com o filtro
+        de cada uma: os arquivos anuais que o período alcança, por ano, anexados na hora, e por
+        último main.Venda. "" alcança todos os arquivos.
+        
+        Cada arquivo é lido só até a sua data de corte, que muda na mesma transação que remove as
+        vendas de Venda: uma cópia interrompida no meio do arquivamento não aparece em dobro.
+        """
+        conn = conn or self.conn_leitura
+        arquivos = conn.execute(
+            "SELECT ano, arquivo, ate_data FROM ArquivoVendas WHERE ate_data > ? ORDER BY ano", (data_inicio,)
+        ).fetchall()
+        self._anexar_arquivos(conn, arquivos)
+        fontes = [(f"arquivo_{arquivo['ano']}.Venda", f"data < '{arquivo['ate_data']}'") for arquivo in arquivos]
+        return fontes + [("main.Venda", "1")]
+    
+    def _fonte_vendas(self, data_inicio: Optional[str] = None, conn: Optional[sqlite3.Connection] = None) -> str:
+        """Origem das vendas para uma consulta que começa em `data_inicio`: Venda, ou uma subconsulta
+        UNION ALL de Venda com os arquivos anuais que o período alcança (ver _fontes_vendas).
+        Sem data_inicio, só Venda.
+        """
+        if data_inicio is None:
+            return "Venda"
+        fontes = self._fontes_vendas(data_inicio, conn)
+        if len(fontes) == 1:
+            return "Venda"
+        partes = [f"SELECT {COLUNAS_VENDA} FROM main.Venda"]
+        partes += [f"SELECT {COLUNAS_VENDA} FROM {tabela} WHERE {condicao}" for tabela, condicao in fontes[:-1]]
+        return f"({' UNION ALL '.join(partes)})"
+    
+    def arquivar_vendas(self, dias: Optional[int] = None, antes_de: Optional[str] = None) -> Dict[int, int]:
+        """Move as vendas finalizadas anteriores a `antes_de` (padrão: DIAS_SEM_ARQUIVAR dias atrás)
+        para um banco por ano ao lado do principal (sorveteria-arquivo-2024.db, ...).
+        
+        Ficam para trás os totais: ResumoDiario não muda (não tem trigger de remoção),
+        VendaArquivadaMensal recebe vendas, unidades e receita por produto e mês, e ArquivoVendas
+        a data de corte e os totais de cada ano. Cada ano passa por duas transações: a cópia para
+        o arquivo, com sincronização completa, e depois, no banco principal, a remoção de Venda
+        junto com os totais e a nova data de corte. Se o processo cair entre as duas, a próxima
+        execução termina o serviço. Retorna {ano: vendas movidas}.
+        """
+        if self.conexoes.db_name == ':memory:':
+            print("Erro ao arquivar vendas: banco em memória não tem arquivos")
+            return {}
+        if antes_de is None:
+            dias = self.DIAS_SEM_ARQUIVAR if dias is None else dias
+            antes_de = (datetime.now() - timedelta(days=dias)).strftime("%Y-%m-%d")
+        antes_de = datetime.strptime(antes_de, "%Y-%m-%d").strftime("%Y-%m-%d")  # Vai para o SQL dos arquivos
+        base = os.path.splitext(os.path.basename(self.conexoes.db_name))[0]
+        pasta = os.path.dirname(os.path.abspath(self.conexoes.db_name))
+        movidas = {}
+        
+        primeira = self.conn.execute(
+            "SELECT MIN(data) FROM Venda WHERE status = 'finalizada' AND data < ?", (antes_de,)
+        ).fetchone()[0]
+        if primeira is None:
+            return movidas
+        
+        for ano in range(int(primeira[:4]), int(antes_de[:4]) + 1):
+            inicio, fim = f"{ano}-01-01", min(f"{ano + 1}-01-01", antes_de)
+            banco, arquivo = f"arquivo_{ano}", f"{base}-arquivo-{ano}.db"
+            faixa = "status = 'finalizada' AND data >= ? AND data < ?"
+            cursor = self.conn.cursor()
+            cursor.execute(f"ATTACH DATABASE ? AS {banco}", (os.path.join(pasta, arquivo),))
+            try:
+                cursor.execute(f"PRAGMA {banco}.journal_mode = DELETE")
+                cursor.execute(f"PRAGMA {banco}.synchronous = FULL")
+                for comando in ESQUEMA_ARQUIVO:
+                    cursor.execute(comando.format(banco=banco))
+                
+                # 1. Cópia: a data de corte ainda não mudou, então os leitores ainda não a enxergam
+                cursor.execute("BEGIN")
+                cursor.execute(f"""
+                    INSERT OR IGNORE INTO {banco}.Venda ({COLUNAS_VENDA})
+                    SELECT {COLUNAS_VENDA} FROM main.Venda WHERE {faixa}
+                """, (inicio, fim))
+                self.conn.commit()
+                
+                # 2. Remoção, totais e data de corte, numa única transação do banco principal
+                cursor.execute("BEGIN IMMEDIATE")
+                cursor.execute(f"""
+                    SELECT COUNT(*), COALESCE(SUM(valor_total), 0) FROM main.Venda WHERE {faixa}
+                """, (inicio, fim))
+                quantidade, total = cursor.fetchone()
+                cursor.execute(f"""
+                    SELECT COUNT(*) FROM main.Venda v
+                    WHERE {faixa} AND NOT EXISTS (SELECT 1 FROM {banco}.Venda a WHERE a.codigo = v.codigo)
+                """, (inicio, fim))
+                if cursor.fetchone()[0] or not quantidade:
+                    self.conn.rollback()
+                    if quantidade:
+                        print(f"Erro ao arquivar vendas de {ano}: a cópia não tem todas as vendas")
+                        break
+                    continue
+                cursor.execute(f"""
+                    INSERT INTO VendaArquivadaMensal (codigo_produto, mes, quantidade_vendas, unidades, total_vendas)
+                    SELECT codigo_produto, substr(data, 1, 7), COUNT(*), SUM(quantidade), SUM(valor_total)
+                    FROM main.Venda WHERE {faixa}
+                    GROUP BY codigo_produto, substr(data, 1, 7)
+                    ON CONFLICT(codigo_produto, mes) DO UPDATE SET
+                        quantidade_vendas = quantidade_vendas + excluded.quantidade_vendas,
+                        unidades = unidades + excluded.unidades,
+                        total_vendas = total_vendas + excluded.total_vendas
+                """, (inicio, fim))
+                cursor.execute("""
+                    INSERT INTO ArquivoVendas (ano, arquivo, ate_data, quantidade_vendas, total_vendas)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(ano) DO UPDATE SET
+                        ate_data = MAX(ate_data, excluded.ate_data),
+                        quantidade_vendas = quantidade_vendas + excluded.quantidade_vendas,
+                        total_vendas = total_vendas + excluded.total_vendas
+                """, (ano, arquivo, fim, quantidade, total))
+                cursor.execute(f"DELETE FROM main.Venda WHERE {faixa}", (inicio, fim))
+                self.conn.commit()
+                movidas[ano] = quantidade
+            except sqlite3.Error as e:
+                self.conn.rollback()
+                print(f"Erro ao arquivar vendas de {ano}: {e}")
+                break
+            finally:
+                cursor.execute(f"DETACH DATABASE {banco}")
+        return movidas
+    
     # Métodos para Promoções
     def criar_promocao(self, descricao: str, desconto_percentual: float, 
-                      data_inicio: str, data_fim: str) -> Optional[int]:
-        """Cria uma nova promoção"""
+                      data_inicio: str, data_fim: str, codigo_produto: Optional[int] = None,
+                      categoria: Optional[str] = None) -> Optional[int]:
+        """Cria uma nova promoção para um produto, uma categoria ou, sem nenhum dos dois, para todos"""
         try:
             cursor = self.conn.cursor()
             cursor.execute("""
                 INSERT INTO Promocao 
-                (descricao, desconto_percentual, data_inicio, data_fim)
-                VALUES (?, ?, ?, ?)
-            """, (descricao, desconto_percentual, data_inicio, data_fim))
+                (descricao, desconto_percentual, data_inicio, data_fim, codigo_produto, categoria)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (descricao, desconto_percentual, data_inicio, data_fim, codigo_produto, categoria or None))
             
             promocao_id = cursor.lastrowid
             self.conn.commit()
+            self._notificar('Promocao', [promocao_id])
             return promocao_id
         except sqlite3.Error as e:
             self.conn.rollback()
             print(f"Erro ao criar promoção: {e}")
             return None
     
+    def obter_promocoes(self, codigos: List[int]) -> List[Dict]:
+        """Obtém as promoções cujos códigos estão na lista"""
+        try:
+            cursor = self.conn_leitura.cursor()
+            lista, parametros = marcadores(codigos)
+            cursor.execute(f"SELECT * FROM Promocao WHERE codigo IN ({lista})", parametros)
+            return [dict(row) for row in cursor.fetchall()]
+        except sqlite3.Error as e:
+            print(f"Erro ao obter promoções: {e}")
+            return []
+    
+    def _consultar_promocoes_ativas(self, data: str) -> List[Dict]:
+        """Lê do banco as promoções que ainda não terminaram na data informada"""
+        cursor = self.conn_leitura.cursor()
+        cursor.execute("SELECT * FROM Promocao WHERE data_fim >= ?", (data,))
+        return [dict(row) for row in cursor.fetchall()]
+    
+    def iter_promocoes(self, tamanho_lote: int = 1000) -> Iterator[Promocao]:
+        """Percorre as promoções, das que começam mais tarde para as mais antigas"""
+        try:
+            yield from self._registros(Promocao, f"""
+                SELECT {colunas(Promocao)} FROM Promocao 
+                ORDER BY data_inicio DESC
+            """, (), tamanho_lote)
+        except sqlite3.Error as e:
+            print(f"Erro ao listar promoções: {e}")
+    
     def listar_promocoes(self) -> List[Dict]:
         """Lista todas as promoções"""
+        return [promocao._asdict() for promocao in self.iter_promocoes()]
+    
+    def listar_promocoes_pagina(self, after_data_inicio: Optional[str] = None, after_codigo: Optional[int] = None,
+                                limit: int = 50) -> List[Dict]:
+        """Lista uma página de promoções, continuando após a última promoção exibida"""
         try:
-            cursor = self.conn.cursor()
-            cursor.execute("""
-                SELECT * FROM Promocao 
-                ORDER BY data_inicio DESC
-            """)
+            cursor = self.conn_leitura.cursor()
+            
+            if after_codigo is not None:
+                cursor.execute("""
+                    SELECT * FROM Promocao 
+                    WHERE (data_inicio, codigo) < (?, ?)
+                    ORDER BY data_inicio DESC, codigo DESC
+                    LIMIT ?
+                """, (after_data_inicio, after_codigo, limit))
+            else:
+                cursor.execute("""
+                    SELECT * FROM Promocao 
+                    ORDER BY data_inicio DESC, codigo DESC
+                    LIMIT ?
+                """, (limit,))
             return [dict(row) for row in cursor.fetchall()]
         except sqlite3.Error as e:
             print(f"Erro ao listar promoções: {e}")
             return []
     
     # Métodos para Relatórios
-    def calcular_resumo(self) -> Dict[str, float]:
-        """Calcula métricas resumidas para o painel"""
+    def calcular_resumo(self, data_inicio: Optional[str] = None, data_fim: Optional[str] = None) -> Dict:
+        """Calcula métricas resumidas para o painel: totais de todo o histórico (total_vendas,
+        total_despesas, lucro) e do período de `data_inicio` a `data_fim` (AAAA-MM-DD, inclusive).
+        
+        Os totais gerais vêm da linha única de ResumoTotal; só os dias do período são lidos de
+        ResumoDiario. O período padrão é o que o painel mostra: do início da semana ou do mês, o
+        que vier antes, até hoje. vendas_hoje, vendas_semana e vendas_mes só contam dias dentro dele.
+        """
+        hoje = datetime.now().strftime("%Y-%m-%d")
+        inicio_semana = (datetime.now() - timedelta(days=datetime.now().weekday())).strftime("%Y-%m-%d")
+        inicio_mes = datetime.now().replace(day=1).strftime("%Y-%m-%d")
+        data_inicio = data_inicio or min(inicio_semana, inicio_mes)
+        data_fim = data_fim or hoje
         try:
-            cursor = self.conn.cursor()
-            
-            hoje = datetime.now().strftime("%Y-%m-%d")
-            inicio_semana = (datetime.now() - timedelta(days=datetime.now().weekday())).strftime("%Y-%m-%d")
-            inicio_mes = datetime.now().replace(day=1).strftime("%Y-%m-%d")
-            
-            # Total de vendas
-            cursor.execute("""
-                SELECT SUM(valor_total) FROM Venda 
-                WHERE status = 'finalizada'
-            """)
-            total_vendas = cursor.fetchone()[0] or 0
-            
-            # Vendas hoje
-            cursor.execute("""
-                SELECT SUM(valor_total) FROM Venda 
-                WHERE status = 'finalizada' AND data = ?
-            """, (hoje,))
-            vendas_hoje = cursor.fetchone()[0] or 0
-            
-            # Vendas semana
-            cursor.execute("""
-                SELECT SUM(valor_total) FROM Venda 
-                WHERE status = 'finalizada' AND data >= ?
-            """, (inicio_semana,))
-            vendas_semana = cursor.fetchone()[0] or 0
+            cursor = self.conn_leitura.cursor()
             
-            # Vendas mês
+            # Uma linha por dia, lida pela chave primária só no período, mais a linha dos totais gerais
             cursor.execute("""
-                SELECT SUM(valor_total) FROM Venda 
-                WHERE status = 'finalizada' AND data >= ?
-            """, (inicio_mes,))
-            vendas_mes = cursor.fetchone()[0] or 0
+                SELECT 
+                    (SELECT total_vendas FROM ResumoTotal WHERE codigo = 1),
+                    (SELECT total_despesas FROM ResumoTotal WHERE codigo = 1),
+                    SUM(CASE WHEN data = ? THEN total_vendas END),
+                    SUM(CASE WHEN data >= ? THEN total_vendas END),
+                    SUM(CASE WHEN data >= ? THEN total_vendas END),
+                    SUM(total_vendas),
+                    SUM(total_despesas)
+                FROM ResumoDiario
+                WHERE data >= ? AND data <= ?
+            """, (hoje, inicio_semana, inicio_mes, data_inicio, data_fim))
+            linha = cursor.fetchone()
             
-            # Despesas
-            cursor.execute("SELECT SUM(valor) FROM Despesa")
-            total_despesas = cursor.fetchone()[0] or 0
+            total_vendas = linha[0] or 0
+            total_despesas = linha[1] or 0
+            vendas_hoje = linha[2] or 0
+            vendas_semana = linha[3] or 0
+            vendas_mes = linha[4] or 0
+            vendas_periodo = linha[5] or 0
+            despesas_periodo = linha[6] or 0
             
             # Lucro
             lucro = total_vendas - total_despesas
@@ -351,7 +1936,12 @@ class SorveteriaBackend:
                 "lucro": float(lucro),
                 "vendas_hoje": float(vendas_hoje),
                 "vendas_semana": float(vendas_semana),
-                "vendas_mes": float(vendas_mes)
+                "vendas_mes": float(vendas_mes),
+                "data_inicio": data_inicio,
+                "data_fim": data_fim,
+                "vendas_periodo": float(vendas_periodo),
+                "despesas_periodo": float(despesas_periodo),
+                "lucro_periodo": float(vendas_periodo - despesas_periodo)
             }
         except sqlite3.Error as e:
             print(f"Erro ao calcular resumo: {e}")
@@ -361,35 +1951,203 @@ class SorveteriaBackend:
                 "lucro": 0.0,
                 "vendas_hoje": 0.0,
                 "vendas_semana": 0.0,
-                "vendas_mes": 0.0
+                "vendas_mes": 0.0,
+                "data_inicio": data_inicio,
+                "data_fim": data_fim,
+                "vendas_periodo": 0.0,
+                "despesas_periodo": 0.0,
+                "lucro_periodo": 0.0
             }
     
+    def reconstruir_resumo_diario(self) -> bool:
+        """Recalcula as tabelas ResumoDiario e ResumoTotal a partir de todo o histórico de vendas (inclusive
+        arquivadas) e despesas, e VendaProdutoDiaria a partir das vendas dos últimos DIAS_VENDA_DIARIA dias"""
+        try:
+            cursor = self.conn.cursor()
+            # Os arquivos anuais são anexados antes: ATTACH não roda dentro de uma transação
+            arquivos = cursor.execute("SELECT ano, arquivo, ate_data FROM ArquivoVendas").fetchall()
+            self._anexar_arquivos(self.conn, arquivos)
+            cursor.execute("BEGIN")
+            cursor.execute("DELETE FROM ResumoDiario")
+            cursor.execute(SQL_RECONSTRUIR_RESUMO)
+            for arquivo in arquivos:
+                cursor.execute(SQL_RESUMO_ARQUIVO.format(banco=f"arquivo_{arquivo['ano']}"), (arquivo['ate_data'],))
+            cursor.execute(SQL_RECONSTRUIR_TOTAL)  # Sem o resíduo de ponto flutuante das diferenças
+            # Só a tabela Venda: as arquivadas (por padrão, com mais de um ano) já passaram da janela
+            cursor.execute("DELETE FROM VendaProdutoDiaria")
+            cursor.execute("""
+                INSERT INTO VendaProdutoDiaria (codigo_produto, data, unidades, quantidade_vendas)
+                SELECT codigo_produto, data, SUM(quantidade), COUNT(*) FROM Venda
+                WHERE data >= ?
+                GROUP BY codigo_produto, data
+            """, ((datetime.now() - timedelta(days=self.DIAS_VENDA_DIARIA)).strftime("%Y-%m-%d"),))
+            self.conn.commit()
+            return True
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            print(f"Erro ao reconstruir resumo diário: {e}")
+            return False
+        finally:
+            self._soltar_arquivos(self.conn)
+    
+    # Diagnóstico
+    def explicar_consultas(self) -> Dict[str, List[str]]:
+        """Retorna o EXPLAIN QUERY PLAN dos comandos que cada caminho de consulta do backend executa.
+        
+        Cada caminho roda de verdade, com parâmetros de exemplo, enquanto CapturaComandos guarda os
+        comandos das duas conexões: o plano é o do SQL que o método monta, não de uma cópia dele.
+        Os caminhos de escrita rodam numa transação desfeita no fim; os geradores, até o primeiro
+        item. Os planos de todos os comandos de um caminho vêm juntos, na ordem em que rodaram.
+        """
+        hoje = datetime.now().strftime("%Y-%m-%d")
+        
+        def primeiro(gerador: Iterator):
+            next(gerador, None)
+            gerador.close()
+        
+        def escrever(gravar: Callable[[sqlite3.Cursor], object]):
+            cursor = self.conn.cursor()
+            cursor.execute("BEGIN")
+            try:
+                gravar(cursor)
+            finally:
+                self.conn.rollback()
+        
+        caminhos = {
+            "catalogo (por código)": lambda: self._consultar_produtos([1, 2]),
+            "catalogo (completo)": lambda: self._consultar_produtos(),
+            "listar_produtos_pagina": lambda: self.listar_produtos_pagina("", 0, 50),
+            "listar_produtos_pagina (estoque baixo)": lambda: self.listar_produtos_pagina(estoque_baixo=True),
+            "prever_ruptura": lambda: self.prever_ruptura(),
+            "excluir_produto (vendas do produto)": lambda: self._tem_vendas(self.conn_leitura.cursor(), 1),
+            "criar_venda (estoque)": lambda: escrever(
+                lambda cursor: self._gravar_venda(cursor, -1, "", 1, 0.0, None, hoje, "00:00:00")),
+            "estoque_em": lambda: self.estoque_em(hoje),
+            "reconciliar_estoque": lambda: self.reconciliar_estoque(),
+            "analise (vendas do período)": lambda: self._cursor_vendas_periodo(hoje, hoje).close(),
+            "finalizar_venda": lambda: escrever(lambda cursor: self._gravar_finalizacao(cursor, -1)),
+            "listar_vendas (por status)": lambda: primeiro(self.iter_vendas('aberta')),
+            "listar_vendas (período)": lambda: primeiro(self.iter_vendas('finalizada', hoje, hoje)),
+            "listar_vendas (todas)": lambda: primeiro(self.iter_vendas()),
+            "listar_vendas_pagina": lambda: self.listar_vendas_pagina('finalizada', hoje, '23:59:59', 0, 50),
+            "listar_promocoes": lambda: primeiro(self.iter_promocoes()),
+            "promocoes (vigentes)": lambda: self._consultar_promocoes_ativas(hoje),
+            "listar_promocoes_pagina": lambda: self.listar_promocoes_pagina(hoje, 0, 50),
+            "calcular_resumo": lambda: self.calcular_resumo(),
+            "listar_despesas": lambda: primeiro(self.iter_despesas()),
+            "listar_despesas_pagina": lambda: self.listar_despesas_pagina(hoje, 0, 50),
+        }
+        
+        planos = {}
+        captura = CapturaComandos()
+        for nome, caminho in caminhos.items():
+            captura.comandos.clear()
+            instrumentar_conexao(self.conn, captura)
+            instrumentar_conexao(self.conn_leitura, captura)
+            try:
+                caminho()
+            finally:
+                instrumentar_conexao(self.conn, self.instrumentacao)
+                instrumentar_conexao(self.conn_leitura, self.instrumentacao)
+            planos[nome] = []
+            for conn, sql, parametros in captura.comandos:
+                cursor = sqlite3.Cursor(conn)  # Cursor comum: o EXPLAIN não entra nas métricas
+                cursor.execute(f"EXPLAIN QUERY PLAN {sql}", parametros)
+                planos[nome] += [linha[3] for linha in cursor.fetchall()]
+                cursor.close()
+        return planos
+    
+    def consultas_com_varredura(self) -> List[str]:
+        """Lista as consultas cujo plano percorre uma tabela ou índice inteiro, ou ordena sem índice"""
+        suspeitas = []
+        for nome, plano in self.explicar_consultas().items():
+            esperadas = self.VARREDURAS_ESPERADAS.get(nome, ())
+            for detalhe in plano:
+                # SCAN ... USING (COVERING) INDEX também lê o índice inteiro: só SEARCH é seletivo
+                suspeito = detalhe.startswith("SCAN") or "USE TEMP B-TREE FOR ORDER BY" in detalhe
+                if suspeito and not detalhe.startswith(esperadas):
+                    suspeitas.append(nome)
+                    break
+        return suspeitas
+    
     # Métodos para Despesas
+    @staticmethod
+    def _gravar_despesa(cursor: sqlite3.Cursor, descricao: str, valor: float, data: str) -> int:
+        cursor.execute("""
+            INSERT INTO Despesa 
+            (descricao, valor, data) 
+            VALUES (?, ?, ?)
+        """, (descricao, valor, data))
+        return cursor.lastrowid
+    
     def criar_despesa(self, descricao: str, valor: float) -> bool:
         """Registra uma nova despesa"""
         try:
-            cursor = self.conn.cursor()
-            cursor.execute("""
-                INSERT INTO Despesa 
-                (descricao, valor, data) 
-                VALUES (?, ?, ?)
-            """, (descricao, valor, datetime.now().strftime("%Y-%m-%d")))
-            
+            despesa_id = self._gravar_despesa(self.conn.cursor(), descricao, valor,
+                                              datetime.now().strftime("%Y-%m-%d"))
             self.conn.commit()
+            self._notificar('Despesa', [despesa_id])
             return True
         except sqlite3.Error as e:
             self.conn.rollback()
             print(f"Erro ao criar despesa: {e}")
             return False
     
+    def obter_despesas(self, codigos: List[int]) -> List[Dict]:
+        """Obtém as despesas cujos códigos estão na lista"""
+        try:
+            cursor = self.conn_leitura.cursor()
+            lista, parametros = marcadores(codigos)
+            cursor.execute(f"SELECT * FROM Despesa WHERE codigo IN ({lista})", parametros)
+            return [dict(row) for row in cursor.fetchall()]
+        except sqlite3.Error as e:
+            print(f"Erro ao obter despesas: {e}")
+            return []
+    
+    def iter_despesas(self, data_inicio: Optional[str] = None, data_fim: Optional[str] = None,
+                      tamanho_lote: int = 1000) -> Iterator[Despesa]:
+        """Percorre as despesas (mais recentes primeiro), opcionalmente só as de um período"""
+        try:
+            condicoes = []
+            parametros = []
+            if data_inicio:
+                condicoes.append("data >= ?")
+                parametros.append(data_inicio)
+            if data_fim:
+                condicoes.append("data <= ?")
+                parametros.append(data_fim)
+            where = f"WHERE {' AND '.join(condicoes)}" if condicoes else ""
+            yield from self._registros(Despesa, f"""
+                SELECT {colunas(Despesa)} FROM Despesa 
+                {where}
+                ORDER BY data DESC
+            """, parametros, tamanho_lote)
+        except sqlite3.Error as e:
+            print(f"Erro ao listar despesas: {e}")
+    
     def listar_despesas(self) -> List[Dict]:
         """Lista todas as despesas"""
+        return [despesa._asdict() for despesa in self.iter_despesas()]
+    
+    def listar_despesas_pagina(self, after_data: Optional[str] = None, after_codigo: Optional[int] = None,
+                               limit: int = 50) -> List[Dict]:
+        """Lista uma página de despesas, continuando após a última despesa exibida"""
         try:
-            cursor = self.conn.cursor()
-            cursor.execute("""
-                SELECT * FROM Despesa 
-                ORDER BY data DESC
-            """)
+            cursor = self.conn_leitura.cursor()
+            
+            if after_codigo is not None:
+                cursor.execute("""
+                    SELECT * FROM Despesa 
+                    WHERE (data, codigo) < (?, ?)
+                    ORDER BY data DESC, codigo DESC
+                    LIMIT ?
+                """, (after_data, after_codigo, limit))
+            else:
+                cursor.execute("""
+                    SELECT * FROM Despesa 
+                    ORDER BY data DESC, codigo DESC
+                    LIMIT ?
+                """, (limit,))
             return [dict(row) for row in cursor.fetchall()]
         except sqlite3.Error as e:
             print(f"Erro ao listar despesas: {e}")
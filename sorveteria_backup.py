@@ -0,0 +1,250 @@
+import gzip
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+PREFIXO = "sorveteria-"
+FORMATO_MOMENTO = "%Y%m%d-%H%M%S"
+
+
+class BackupCancelado(Exception):
+    pass
+
+
+def copiar_online(origem: str, destino: str, paginas_por_passo: int = 256, pausa_s: float = 0.002,
+                  cancelar: Optional[threading.Event] = None) -> Dict[str, int]:
+    """Copia o banco aberto com a API de backup do SQLite, `paginas_por_passo` páginas de cada vez.
+
+    A cópia inteira sai de uma única transação de leitura: em WAL ela não bloqueia as vendas,
+    e as gravações feitas durante a cópia não a fazem recomeçar (sem a transação, o SQLite
+    reinicia o backup a cada commit de outra conexão). Entre um passo e outro a thread dorme
+    `pausa_s`, deixando o disco para o caixa. Enquanto a cópia dura o WAL não é reaproveitado
+    pelo checkpoint, então ele cresce com as vendas do período.
+    """
+    fonte = sqlite3.connect(origem, isolation_level=None)
+    alvo = sqlite3.connect(destino)
+    passos = 0
+
+    def progresso(status, restantes, total):
+        nonlocal passos
+        passos += 1
+        if cancelar is not None and cancelar.is_set():
+            raise BackupCancelado()
+        if pausa_s:
+            time.sleep(pausa_s)
+
+    try:
+        fonte.execute("BEGIN")
+        fonte.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()  # Fixa o instantâneo lido
+        fonte.backup(alvo, pages=paginas_por_passo, progress=progresso)
+        fonte.execute("COMMIT")
+        # A cópia herda o modo WAL; um arquivo só, sem -wal ao lado, é mais fácil de guardar
+        alvo.execute("PRAGMA journal_mode = DELETE")
+        paginas = alvo.execute("PRAGMA page_count").fetchone()[0]
+    finally:
+        alvo.close()
+        fonte.close()
+    return {"paginas": paginas, "passos": passos}
+
+
+def verificar(caminho: str) -> List[str]:
+    """Roda PRAGMA integrity_check num banco (descompactando antes, se for .gz); lista vazia = íntegro"""
+    if not caminho.endswith(".gz"):
+        conn = sqlite3.connect(caminho)
+        try:
+            mensagens = [linha[0] for linha in conn.execute("PRAGMA integrity_check")]
+        finally:
+            conn.close()
+        return [] if mensagens == ["ok"] else mensagens
+
+    with tempfile.TemporaryDirectory() as pasta:
+        descompactado = os.path.join(pasta, "verificar.db")
+        with gzip.open(caminho, "rb") as entrada, open(descompactado, "wb") as saida:
+            shutil.copyfileobj(entrada, saida, 1024 * 1024)
+        return verificar(descompactado)
+
+
+def listar_snapshots(pasta: str) -> List[Tuple[datetime, str]]:
+    """Fotografias da pasta, da mais recente para a mais antiga"""
+    snapshots = []
+    if not os.path.isdir(pasta):
+        return snapshots
+    for nome in os.listdir(pasta):
+        if not nome.startswith(PREFIXO) or not nome.endswith((".db", ".db.gz")):
+            continue
+        try:
+            momento = datetime.strptime(nome[len(PREFIXO):].split(".")[0], FORMATO_MOMENTO)
+        except ValueError:
+            continue
+        snapshots.append((momento, os.path.join(pasta, nome)))
+    snapshots.sort(reverse=True)
+    return snapshots
+
+
+def arquivos_do_snapshot(caminho: str) -> List[str]:
+    """Cópias dos arquivos anuais de vendas que acompanham a fotografia `caminho`"""
+    pasta, nome = os.path.split(caminho)
+    prefixo = nome.split(".")[0] + "-arquivo-"
+    return sorted(os.path.join(pasta, outro) for outro in os.listdir(pasta or ".")
+                  if outro.startswith(prefixo) and outro.endswith((".db", ".db.gz")))
+
+
+def _arquivos_de_vendas(copia: str, db_name: str) -> List[Tuple[int, str]]:
+    """Arquivos anuais de vendas (ver SorveteriaBackend.arquivar_vendas) registrados na cópia do
+    banco, com o caminho de cada um ao lado do banco original"""
+    conn = sqlite3.connect(copia)
+    try:
+        linhas = conn.execute("SELECT ano, arquivo FROM ArquivoVendas ORDER BY ano").fetchall()
+    except sqlite3.OperationalError:
+        linhas = []  # Banco de antes dos arquivos anuais
+    finally:
+        conn.close()
+    pasta = os.path.dirname(os.path.abspath(db_name))
+    return [(ano, os.path.join(pasta, arquivo)) for ano, arquivo in linhas]
+
+
+def _compactar(temporario: str) -> str:
+    with open(temporario, "rb") as entrada, gzip.open(temporario + ".gz", "wb", compresslevel=6) as saida:
+        shutil.copyfileobj(entrada, saida, 1024 * 1024)
+    os.remove(temporario)
+    return temporario + ".gz"
+
+
+def selecionar_expirados(snapshots: List[Tuple[datetime, str]], horarios: int, diarios: int) -> List[str]:
+    """Rotação: fica a fotografia mais recente de cada uma das últimas `horarios` horas e de cada um
+    dos últimos `diarios` dias que têm fotografia; as demais expiram"""
+    manter = set()
+    horas, dias = set(), set()
+    for momento, caminho in sorted(snapshots, reverse=True):
+        hora = momento.strftime("%Y%m%d%H")
+        if hora not in horas and len(horas) < horarios:
+            horas.add(hora)
+            manter.add(caminho)
+        dia = momento.strftime("%Y%m%d")
+        if dia not in dias and len(dias) < diarios:
+            dias.add(dia)
+            manter.add(caminho)
+    return [caminho for _, caminho in snapshots if caminho not in manter]
+
+
+def fazer_snapshot(db_name: str, pasta: str, compactar: bool = True, horarios: int = 24, diarios: int = 30,
+                   paginas_por_passo: int = 256, pausa_s: float = 0.002,
+                   cancelar: Optional[threading.Event] = None, agora: Optional[datetime] = None) -> Dict:
+    """Copia o banco e os arquivos anuais de vendas para `pasta`, confere as cópias, compacta e
+    aplica a rotação.
+
+    Cada arquivo anual vira sorveteria-<momento>-arquivo-<ano>.db[.gz], ao lado da fotografia do
+    banco. Os arquivos são copiados depois do banco: a data de corte que o banco copiado guarda
+    nunca passa do que já está na cópia do arquivo. A fotografia do banco só ganha o nome
+    definitivo depois de aprovada no integrity_check (e de compactada), por último, então um
+    arquivo sorveteria-<momento>.db[.gz] na pasta é sempre uma cópia inteira, com seus arquivos.
+    """
+    os.makedirs(pasta, exist_ok=True)
+    momento = agora or datetime.now()
+    nome = f"{PREFIXO}{momento.strftime(FORMATO_MOMENTO)}"
+    extensao = ".db.gz" if compactar else ".db"
+    destino = os.path.join(pasta, nome + extensao)
+    temporario = os.path.join(pasta, f".{nome}.tmp")
+    temporarios, copiados, ausentes = [temporario], [], []
+    inicio = time.perf_counter()
+    try:
+        copia = copiar_online(db_name, temporario, paginas_por_passo, pausa_s, cancelar)
+        copia_s = time.perf_counter() - inicio
+
+        erros = verificar(temporario)
+        verificacao_s = time.perf_counter() - inicio - copia_s
+        if erros:
+            print(f"Backup reprovado no integrity_check: {'; '.join(erros[:5])}")
+            os.remove(temporario)
+            return {"ok": False, "erros": erros}
+
+        for ano, origem in _arquivos_de_vendas(temporario, db_name):
+            if not os.path.exists(origem):
+                ausentes.append(origem)  # connect criaria um arquivo vazio no lugar
+                continue
+            temporario_arquivo = os.path.join(pasta, f".{nome}-arquivo-{ano}.tmp")
+            temporarios.append(temporario_arquivo)
+            copiar_online(origem, temporario_arquivo, paginas_por_passo, pausa_s, cancelar)
+            erros = verificar(temporario_arquivo)
+            if erros:
+                raise sqlite3.DatabaseError(f"arquivo de {ano} reprovado no integrity_check: {'; '.join(erros[:5])}")
+            if compactar:
+                temporario_arquivo = _compactar(temporario_arquivo)
+            copiados.append(os.path.join(pasta, f"{nome}-arquivo-{ano}{extensao}"))
+            os.replace(temporario_arquivo, copiados[-1])
+        if ausentes:
+            print(f"Backup sem os arquivos de vendas ausentes: {', '.join(ausentes)}")
+
+        tamanho_banco = os.path.getsize(temporario)
+        if compactar:
+            temporario = _compactar(temporario)
+        os.replace(temporario, destino)
+    except (sqlite3.Error, OSError, BackupCancelado) as e:
+        if not isinstance(e, BackupCancelado):
+            print(f"Erro ao fazer backup: {e}")
+        for resto in temporarios + [resto + ".gz" for resto in temporarios] + copiados:
+            if os.path.exists(resto):
+                os.remove(resto)
+        return {"ok": False, "erros": [str(e) or "cancelado"]}
+
+    removidos = selecionar_expirados(listar_snapshots(pasta), horarios, diarios)
+    for caminho in removidos:
+        for copia_expirada in [caminho] + arquivos_do_snapshot(caminho):
+            os.remove(copia_expirada)
+    return {
+        "ok": True,
+        "destino": destino,
+        "duracao_s": round(time.perf_counter() - inicio, 3),
+        "copia_s": round(copia_s, 3),
+        "verificacao_s": round(verificacao_s, 3),
+        "paginas": copia["paginas"],
+        "passos": copia["passos"],
+        "bytes_banco": tamanho_banco,
+        "bytes_arquivo": os.path.getsize(destino),
+        "removidos": [os.path.basename(caminho) for caminho in removidos],
+        "arquivos": [os.path.basename(caminho) for caminho in copiados],
+        "arquivos_ausentes": ausentes,
+    }
+
+
+class BackupPeriodico:
+    """Thread que fotografa o banco a cada `intervalo_s` (padrão: de hora em hora) enquanto o
+    caixa trabalha, com a rotação de fazer_snapshot. A primeira fotografia sai logo ao iniciar se
+    a mais recente da pasta (ou nenhuma) tiver mais que um intervalo; senão, quando ela completar
+    um intervalo. Assim um programa aberto e fechado antes de cada hora não fica sem backup."""
+
+    def __init__(self, db_name: str, pasta: str, intervalo_s: float = 3600.0, **opcoes):
+        self.db_name = db_name
+        self.pasta = pasta
+        self.intervalo_s = intervalo_s
+        self.opcoes = opcoes
+        self.ultimo: Optional[Dict] = None
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._executar, name="sorveteria-backup", daemon=True)
+
+    def iniciar(self):
+        self._thread.start()
+
+    def _executar(self):
+        # Sobras de uma cópia interrompida (queda ou fechamento no meio) não são fotografias
+        if os.path.isdir(self.pasta):
+            for nome in os.listdir(self.pasta):
+                if nome.startswith("." + PREFIXO):
+                    os.remove(os.path.join(self.pasta, nome))
+        snapshots = listar_snapshots(self.pasta)
+        idade_s = (datetime.now() - snapshots[0][0]).total_seconds() if snapshots else self.intervalo_s
+        espera_s = max(0.0, self.intervalo_s - idade_s)
+        while not self._parar.wait(espera_s):
+            self.ultimo = fazer_snapshot(self.db_name, self.pasta, cancelar=self._parar, **self.opcoes)
+            espera_s = self.intervalo_s
+
+    def encerrar(self, esperar: bool = True):
+        """Interrompe a espera (e uma cópia em andamento, que é descartada) e encerra a thread"""
+        self._parar.set()
+        if esperar and self._thread.is_alive():
+            self._thread.join()
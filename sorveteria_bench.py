@@ -0,0 +1,960 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import socket
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from sorveteria_backend import SorveteriaBackend
+from sorveteria_backup import fazer_snapshot
+from sorveteria_busca import IndiceBusca
+from sorveteria_gerador import gerar_banco
+from sorveteria_registros import marcadores
+from sorveteria_servidor import main as servidor_main
+
+
+def _preparar_banco(caminho: str, wal: bool, produtos: int = 20, estoque: int = 10_000_000) -> None:
+    backend = SorveteriaBackend(caminho, wal=wal)
+    for i in range(produtos):
+        backend.criar_produto(f"Sabor {i}", 5.0 + i, estoque)
+    del backend
+
+
+def _escritor(caminho: str, wal: bool, duracao: float, fila) -> None:
+    backend = SorveteriaBackend(caminho, wal=wal)
+    operacoes = erros = 0
+    fim = time.perf_counter() + duracao
+    while time.perf_counter() < fim:
+        venda_id, erro = backend.criar_venda(1 + operacoes % 20, "Sabor", 1, 5.0)
+        if erro or not backend.finalizar_venda(venda_id):
+            erros += 1
+        else:
+            operacoes += 1
+    fila.put(("escritor", operacoes, erros))
+
+
+def _leitor(caminho: str, wal: bool, duracao: float, fila) -> None:
+    backend = SorveteriaBackend(caminho, wal=wal)
+    operacoes = 0
+    fim = time.perf_counter() + duracao
+    while time.perf_counter() < fim:
+        backend.listar_vendas_pagina(status='finalizada', limit=50)
+        backend.calcular_resumo()
+        operacoes += 1
+    fila.put(("leitor", operacoes, 0))
+
+
+def bench_concorrencia(args) -> dict:
+    """Leitores e escritores em processos separados sobre o mesmo arquivo, com e sem WAL"""
+    resultados = {}
+    for wal in (False, True):
+        with tempfile.TemporaryDirectory() as pasta:
+            caminho = os.path.join(pasta, "bench.db")
+            _preparar_banco(caminho, wal)
+
+            fila = multiprocessing.Queue()
+            processos = [
+                multiprocessing.Process(target=_escritor, args=(caminho, wal, args.duracao, fila))
+                for _ in range(args.escritores)
+            ] + [
+                multiprocessing.Process(target=_leitor, args=(caminho, wal, args.duracao, fila))
+                for _ in range(args.leitores)
+            ]
+            for processo in processos:
+                processo.start()
+            totais = {"escritor": [0, 0], "leitor": [0, 0]}
+            for _ in processos:
+                papel, operacoes, erros = fila.get()
+                totais[papel][0] += operacoes
+                totais[papel][1] += erros
+            for processo in processos:
+                processo.join()
+
+        modo = "wal" if wal else "rollback"
+        resultados[modo] = {
+            "vendas_por_segundo": round(totais["escritor"][0] / args.duracao, 1),
+            "erros_escrita": totais["escritor"][1],
+            "leituras_por_segundo": round(totais["leitor"][0] / args.duracao, 1),
+        }
+        print(f"{modo:>8}: {resultados[modo]}")
+    return resultados
+
+
+def _comprador(caminho: str, produto_id: int, fila) -> None:
+    backend = SorveteriaBackend(caminho)
+    vendido = recusas = 0
+    # Compra até o estoque acabar; algumas recusas seguidas indicam que ele chegou a zero
+    while recusas < 20:
+        quantidade = 1 + (vendido + recusas) % 3
+        venda_id, erro = backend.criar_venda(produto_id, "Sabor", quantidade, 5.0)
+        if erro:
+            recusas += 1
+        else:
+            vendido += quantidade
+            recusas = 0
+    fila.put(vendido)
+
+
+def bench_estresse(args) -> dict:
+    """Vários processos disputando o mesmo estoque; confere que ele nunca fica negativo"""
+    with tempfile.TemporaryDirectory() as pasta:
+        caminho = os.path.join(pasta, "estresse.db")
+        backend = SorveteriaBackend(caminho)
+        produto_id = backend.criar_produto("Sabor disputado", 5.0, args.estoque)
+
+        inicio = time.perf_counter()
+        fila = multiprocessing.Queue()
+        processos = [multiprocessing.Process(target=_comprador, args=(caminho, produto_id, fila))
+                     for _ in range(args.processos)]
+        for processo in processos:
+            processo.start()
+        vendido_processos = sum(fila.get() for _ in processos)
+        for processo in processos:
+            processo.join()
+        duracao = time.perf_counter() - inicio
+
+        estoque_final = backend.obter_produto_por_id(produto_id)['quantidade']
+        vendido_banco = backend.conn.execute(
+            "SELECT COALESCE(SUM(quantidade), 0) FROM Venda WHERE codigo_produto = ?", (produto_id,)
+        ).fetchone()[0]
+        del backend
+
+    resultado = {
+        "estoque_inicial": args.estoque,
+        "estoque_final": estoque_final,
+        "vendido_segundo_processos": vendido_processos,
+        "vendido_segundo_banco": vendido_banco,
+        "duracao_s": round(duracao, 2),
+        "ok": estoque_final >= 0 and vendido_banco == vendido_processos == args.estoque - estoque_final,
+    }
+    print(resultado)
+    return resultado
+
+
+def bench_busca(args) -> dict:
+    """Tempo por tecla da busca incremental num catálogo sintético"""
+    sabores = ["Açaí", "Chocolate", "Morango", "Creme", "Flocos", "Limão", "Maracujá", "Coco",
+               "Doce de Leite", "Pistache", "Napolitano", "Menta", "Café", "Abacaxi", "Uva"]
+    tipos = ["Sorvete", "Picolé", "Milkshake", "Taça", "Casquinha", "Pote"]
+    tamanhos = ["P", "M", "G", "300ml", "500ml", "1L", "2L"]
+    produtos = []
+    for i in range(args.produtos):
+        nome = f"{tipos[i % len(tipos)]} de {sabores[(i // len(tipos)) % len(sabores)]} {tamanhos[i % len(tamanhos)]}"
+        produtos.append({"codigo": i + 1, "nome": f"{nome} #{i}"})
+
+    indice = IndiceBusca()
+    inicio = time.perf_counter()
+    indice.carregar(produtos)
+    construcao = time.perf_counter() - inicio
+
+    # Simula a digitação letra por letra de algumas consultas
+    consultas = ["acai", "sorvete choc", "pico mor", "milk past", "pistache 1l", "limao", "maracuja g"]
+    tempos = []
+    for consulta in consultas:
+        for fim in range(1, len(consulta) + 1):
+            inicio = time.perf_counter()
+            indice.buscar(consulta[:fim], 10)
+            tempos.append(time.perf_counter() - inicio)
+    tempos.sort()
+
+    resultado = {
+        "produtos": args.produtos,
+        "construcao_ms": round(construcao * 1000, 2),
+        "teclas": len(tempos),
+        "media_ms": round(sum(tempos) / len(tempos) * 1000, 4),
+        "p99_ms": round(tempos[int(len(tempos) * 0.99) - 1] * 1000, 4),
+        "max_ms": round(tempos[-1] * 1000, 4),
+    }
+    print(resultado)
+    return resultado
+
+
+async def _requisitar(leitor, escritor, metodo: str, caminho: str, dados=None):
+    corpo = json.dumps(dados).encode("utf-8") if dados is not None else b""
+    escritor.write(f"{metodo} {caminho} HTTP/1.1\r\nHost: localhost\r\n"
+                   f"Content-Type: application/json\r\nContent-Length: {len(corpo)}\r\n\r\n".encode() + corpo)
+    await escritor.drain()
+    status = int((await leitor.readline()).split()[1])
+    tamanho = 0
+    while True:
+        linha = await leitor.readline()
+        if linha in (b"\r\n", b""):
+            break
+        nome, _, valor = linha.decode().partition(":")
+        if nome.lower() == "content-length":
+            tamanho = int(valor)
+    return status, json.loads(await leitor.readexactly(tamanho))
+
+
+async def _cliente_carga(host: str, porta: int, vendedor: bool, produtos: int, fim: float, latencias: list, erros: list):
+    leitor, escritor = await asyncio.open_connection(host, porta)
+    i = 0
+    while time.perf_counter() < fim:
+        inicio = time.perf_counter()
+        if vendedor:
+            status, _ = await _requisitar(leitor, escritor, "POST", "/vendas",
+                                          {"produto_id": 1 + i % produtos, "quantidade": 1})
+            esperado = 201
+        else:
+            status, _ = await _requisitar(leitor, escritor, "GET", "/vendas?status=aberta&limit=50")
+            esperado = 200
+        latencias.append(time.perf_counter() - inicio)
+        if status != esperado:
+            erros.append(status)
+        i += 1
+    escritor.close()
+
+
+async def _carga(host: str, porta: int, args) -> dict:
+    fim = time.perf_counter() + args.duracao
+    vendas, leituras, erros = [], [], []
+    await asyncio.gather(
+        *(_cliente_carga(host, porta, True, args.produtos, fim, vendas, erros) for _ in range(args.terminais)),
+        *(_cliente_carga(host, porta, False, args.produtos, fim, leituras, erros) for _ in range(args.leitores)),
+    )
+    vendas.sort()
+    leituras.sort()
+
+    def percentil(tempos, p):
+        return round(tempos[max(0, int(len(tempos) * p) - 1)] * 1000, 2) if tempos else None
+
+    return {
+        "terminais": args.terminais,
+        "leitores": args.leitores,
+        "vendas_por_segundo": round(len(vendas) / args.duracao, 1),
+        "venda_p50_ms": percentil(vendas, 0.5),
+        "venda_p99_ms": percentil(vendas, 0.99),
+        "leituras_por_segundo": round(len(leituras) / args.duracao, 1),
+        "leitura_p99_ms": percentil(leituras, 0.99),
+        "erros": len(erros),
+    }
+
+
+def bench_carga(args) -> dict:
+    """Vazão e latência de vendas pela API HTTP, com vários terminais simultâneos em localhost"""
+    with tempfile.TemporaryDirectory() as pasta:
+        processo = None
+        if args.url:
+            host, _, porta = args.url.rpartition(":")
+            porta = int(porta)
+        else:
+            caminho = os.path.join(pasta, "carga.db")
+            _preparar_banco(caminho, wal=True, produtos=args.produtos)
+            with socket.socket() as livre:
+                livre.bind(("127.0.0.1", 0))
+                host, porta = livre.getsockname()
+            processo = multiprocessing.Process(target=servidor_main,
+                                               args=(["--db", caminho, "--porta", str(porta)],), daemon=True)
+            processo.start()
+            # Espera o servidor aceitar conexões
+            for _ in range(100):
+                try:
+                    socket.create_connection((host, porta), timeout=0.1).close()
+                    break
+                except OSError:
+                    time.sleep(0.05)
+
+        try:
+            resultado = asyncio.run(_carga(host, porta, args))
+        finally:
+            if processo:
+                processo.terminate()
+                processo.join()
+
+    resultado["ok"] = resultado["erros"] == 0
+    print(resultado)
+    return resultado
+
+
+def bench_analise(args) -> dict:
+    """Análises do painel sobre um período com muitas vendas sintéticas"""
+    from sorveteria_analise import (analisar, carregar_vendas, comparar_semanas, mais_vendidos, mapa_calor,
+                                    por_hora, por_promocao, resumo)
+
+    with tempfile.TemporaryDirectory() as pasta:
+        caminho = os.path.join(pasta, "analise.db")
+        backend = SorveteriaBackend(caminho)
+        for i in range(args.produtos):
+            backend.criar_produto(f"Sabor {i}", 5.0 + i % 10, 10_000_000)
+
+        # Vendas espalhadas pelos últimos 365 dias e pelo horário de funcionamento, geradas no próprio SQLite
+        inicio = time.perf_counter()
+        backend.conn.execute("""
+            WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < ?)
+            INSERT INTO Venda (codigo_produto, produto_nome, quantidade, preco_unitario, valor_total,
+                               data, hora, status, codigo_promocao)
+            SELECT 1 + i % ?, 'Sabor ' || (i % ?), 1 + i % 3, 5.0, 5.0 * (1 + i % 3),
+                   date('now', '-' || (i * 7919 % 365) || ' days'),
+                   printf('%02d:%02d:00', 10 + i * 31 % 12, i % 60), 'finalizada', NULL
+            FROM n
+        """, (args.vendas, args.produtos, args.produtos))
+        backend.conn.commit()
+        geracao = time.perf_counter() - inicio
+
+        fim = time.strftime("%Y-%m-%d")
+        inicio_ano = time.strftime("%Y-%m-%d", time.localtime(time.time() - 364 * 86400))
+
+        inicio = time.perf_counter()
+        vendas = carregar_vendas(backend, inicio_ano, fim)
+        leitura = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        rollups = {
+            "resumo": resumo(vendas),
+            "por_hora": por_hora(vendas),
+            "mapa_calor": mapa_calor(vendas),
+            "mais_vendidos": mais_vendidos(vendas),
+            "por_promocao": por_promocao(vendas),
+            "semanas": comparar_semanas(vendas),
+        }
+        agrupamento = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        analisar(backend)  # O painel: últimos 28 dias
+        painel = time.perf_counter() - inicio
+        del backend
+
+    resultado = {
+        "vendas": len(vendas),
+        "geracao_s": round(geracao, 2),
+        "leitura_s": round(leitura, 2),
+        "agrupamentos_s": round(agrupamento, 3),
+        "painel_28_dias_s": round(painel, 3),
+        "receita": rollups["resumo"]["receita"],
+    }
+    print(resultado)
+    return resultado
+
+
+def _metodos_backend(backend: SorveteriaBackend, aleatorio: random.Random) -> list:
+    """(nome, chamada) de cada método público do backend, com argumentos tirados do próprio banco.
+
+    A ordem importa: produtos criados no início são editados e excluídos depois, e as vendas
+    abertas por criar_venda são as que finalizar_venda fecha.
+    """
+    produtos = [produto["codigo"] for produto in backend.listar_produtos() if produto["quantidade"] >= 100]
+    vendas = [linha[0] for linha in backend.conn.execute("SELECT codigo FROM Venda ORDER BY random() LIMIT 200")]
+    promocoes = [linha[0] for linha in backend.conn.execute("SELECT codigo FROM Promocao LIMIT 50")]
+    despesas = [linha[0] for linha in backend.conn.execute("SELECT codigo FROM Despesa LIMIT 50")]
+    meio = backend.conn.execute("SELECT data FROM Venda ORDER BY codigo LIMIT 1 OFFSET "
+                                "(SELECT count(*) / 2 FROM Venda)").fetchone()
+    meio = meio[0] if meio else time.strftime("%Y-%m-%d")
+    hoje = time.strftime("%Y-%m-%d")
+    criados, abertas = [], []
+
+    def criar_produto():
+        criados.append(backend.criar_produto(f"Bench {len(criados)}", 9.9, 1000, "Sorvete"))
+
+    def criar_venda():
+        produto = backend.obter_produto_por_id(aleatorio.choice(produtos))
+        venda_id, _ = backend.criar_venda(produto["codigo"], produto["nome"], 1, produto["preco"])
+        abertas.append(venda_id)
+
+    return [
+        ("listar_produtos", backend.listar_produtos),
+        ("obter_produto_por_id", lambda: backend.obter_produto_por_id(aleatorio.choice(produtos))),
+        ("obter_produtos", lambda: backend.obter_produtos(aleatorio.sample(produtos, min(20, len(produtos))))),
+        ("listar_produtos_pagina", backend.listar_produtos_pagina),
+        ("criar_produto", criar_produto),
+        ("atualizar_produto", lambda: backend.atualizar_produto(aleatorio.choice(criados), "Bench editado", 10.5,
+                                                                 900, "Sorvete")),
+        ("atualizar_estoque", lambda: backend.atualizar_estoque(aleatorio.choice(produtos), 1)),
+        ("excluir_produto", lambda: criados and backend.excluir_produto(criados.pop())),
+        ("criar_venda", criar_venda),
+        ("criar_venda_lote", lambda: backend.criar_venda_lote(
+            [{"produto_id": codigo, "quantidade": 1} for codigo in aleatorio.sample(produtos, min(3, len(produtos)))])),
+        ("finalizar_venda", lambda: abertas and backend.finalizar_venda(abertas.pop())),
+        ("obter_vendas", lambda: backend.obter_vendas(aleatorio.sample(vendas, min(20, len(vendas))))),
+        ("listar_vendas", backend.listar_vendas),
+        ("listar_vendas (abertas)", lambda: backend.listar_vendas("aberta")),
+        ("listar_vendas_pagina", backend.listar_vendas_pagina),
+        ("listar_vendas_pagina (meio)", lambda: backend.listar_vendas_pagina(after_data=meio, after_hora="12:00:00",
+                                                                            after_codigo=0)),
+        ("criar_promocao", lambda: backend.criar_promocao("Bench", 10.0, hoje, hoje)),
+        ("obter_promocoes", lambda: backend.obter_promocoes(promocoes)),
+        ("listar_promocoes", backend.listar_promocoes),
+        ("listar_promocoes_pagina", backend.listar_promocoes_pagina),
+        ("criar_despesa", lambda: backend.criar_despesa("Bench", 12.5)),
+        ("obter_despesas", lambda: backend.obter_despesas(despesas)),
+        ("listar_despesas", backend.listar_despesas),
+        ("listar_despesas_pagina", backend.listar_despesas_pagina),
+        ("calcular_resumo", backend.calcular_resumo),
+        ("criar_snapshot_estoque", backend.criar_snapshot_estoque),
+        ("estoque_em", backend.estoque_em),
+        ("estoque_em (data)", lambda: backend.estoque_em(meio)),
+        ("reconciliar_estoque", backend.reconciliar_estoque),
+        ("reconstruir_resumo_diario", backend.reconstruir_resumo_diario),
+    ]
+
+
+def _cronometrar(chamada, repeticoes: int, limite: float) -> dict:
+    """Chama até `repeticoes` vezes, parando antes se o tempo acumulado passar de `limite` segundos"""
+    chamada()  # Aquecimento: caches e páginas do banco carregados antes de medir
+    tempos = []
+    inicio_total = time.perf_counter()
+    while len(tempos) < repeticoes and (not tempos or time.perf_counter() - inicio_total < limite):
+        inicio = time.perf_counter()
+        chamada()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    tempos.sort()
+    return {
+        "chamadas": len(tempos),
+        "min_ms": round(tempos[0], 3),
+        "mediana_ms": round(statistics.median(tempos), 3),
+        "p95_ms": round(tempos[min(len(tempos) - 1, int(len(tempos) * 0.95))], 3),
+    }
+
+
+def _regressoes(atual: dict, base: dict, tolerancia: float) -> list:
+    """Métodos cujo tempo mínimo piorou mais que `tolerancia` (fração) em relação à execução base"""
+    piores = []
+    for tamanho, metodos in atual.items():
+        for nome, medida in metodos.items():
+            anterior = base.get(tamanho, {}).get(nome)
+            if not anterior:
+                continue
+            # O mínimo varia menos que a mediana entre execuções; diferenças de décimos
+            # de milissegundo são ruído da máquina, não do código
+            antes, depois = anterior["min_ms"], medida["min_ms"]
+            if depois > antes * (1 + tolerancia) and depois - antes > 0.2:
+                piores.append({
+                    "vendas": tamanho,
+                    "metodo": nome,
+                    "antes_ms": antes,
+                    "depois_ms": depois,
+                    "variacao_percentual": round((depois / antes - 1) * 100, 1) if antes else None,
+                })
+    return piores
+
+
+def bench_metodos(args) -> dict:
+    """Tempo de cada método do backend sobre bancos sintéticos de vários tamanhos"""
+    tamanhos = [int(tamanho) for tamanho in args.tamanhos.split(",")]
+    medidas = {}
+    with tempfile.TemporaryDirectory() as temporaria:
+        pasta = args.pasta or temporaria
+        for tamanho in tamanhos:
+            # Bancos gerados ficam na --pasta e são reaproveitados; cada rodada mede numa cópia
+            original = os.path.join(pasta, f"sintetico_{tamanho}_{args.semente}.db")
+            if not os.path.exists(original):
+                print(f"Gerando {tamanho} vendas...", gerar_banco(original, tamanho, semente=args.semente))
+            caminho = os.path.join(temporaria, f"medicao_{tamanho}.db")
+            fonte = SorveteriaBackend(original)
+            fonte.conn.execute("VACUUM INTO ?", (caminho,))
+            fonte.conexoes.fechar()
+
+            backend = SorveteriaBackend(caminho)
+            aleatorio = random.Random(args.semente)
+            medidas[str(tamanho)] = {}
+            for nome, chamada in _metodos_backend(backend, aleatorio):
+                if args.metodos and nome.split(" ")[0] not in args.metodos.split(","):
+                    continue
+                medidas[str(tamanho)][nome] = _cronometrar(chamada, args.repeticoes, args.limite)
+            backend.conexoes.fechar()
+
+    for tamanho, metodos in medidas.items():
+        print(f"\n{tamanho} vendas")
+        for nome, medida in metodos.items():
+            print(f"  {nome:<30} mediana {medida['mediana_ms']:>10.3f} ms   p95 {medida['p95_ms']:>10.3f} ms"
+                  f"   ({medida['chamadas']}x)")
+
+    resultado = {"semente": args.semente, "vendas": medidas}
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as arquivo:
+            base = json.load(arquivo)["metodos"]["vendas"]
+        resultado["regressoes"] = _regressoes(medidas, base, args.tolerancia)
+        resultado["ok"] = not resultado["regressoes"]
+        for regressao in resultado["regressoes"]:
+            print(f"REGRESSÃO: {regressao}")
+    return resultado
+
+
+# Roda num interpretador novo, para as importações não virem do cache de módulos do bench
+_CODIGO_INICIO = r"""
+import json, sys, time
+inicio = time.perf_counter()
+import sorveteria_app
+from sorveteria_backend import SorveteriaBackend
+importacao = time.perf_counter() - inicio
+
+inicio = time.perf_counter()
+backend = SorveteriaBackend(sys.argv[1])
+backend.conexoes.fechar()
+banco = time.perf_counter() - inicio
+
+pintura = painel = None
+try:
+    inicio = time.perf_counter()
+    app = sorveteria_app.SorveteriaApp(sys.argv[1])
+    while not app.winfo_viewable():
+        app.update()
+    app.update_idletasks()
+    pintura = time.perf_counter() - inicio
+    # A fila do banco é atendida em ordem: quando este marcador volta, o resumo e a análise
+    # pedidos pelo painel já voltaram também
+    while app.tela_atual != 'painel':
+        app.update()
+    marcador = app.banco.executar(lambda backend: None)
+    while not marcador.done():
+        app.update()
+        time.sleep(0.001)
+    app.update_idletasks()
+    painel = time.perf_counter() - inicio
+    app.fechar()
+except Exception as e:  # Sem tela (servidor, CI): mede só importação e banco
+    print(f"Sem janela: {e}", file=sys.stderr)
+print(json.dumps({"importacao_s": importacao, "banco_s": banco, "primeira_pintura_s": pintura, "painel_s": painel}))
+"""
+
+
+def bench_inicio(args) -> dict:
+    """Tempo de abertura do app: importações, banco (com a conferência do esquema) e primeira pintura"""
+    with tempfile.TemporaryDirectory() as pasta:
+        caminho = os.path.join(pasta, "inicio.db")
+        gerar_banco(caminho, args.vendas)
+        diretorio = os.path.dirname(os.path.abspath(__file__))
+        medidas = []
+        for _ in range(args.repeticoes):
+            saida = subprocess.run([sys.executable, "-c", _CODIGO_INICIO, caminho], cwd=diretorio,
+                                   capture_output=True, text=True, check=True)
+            medidas.append(json.loads(saida.stdout.strip().splitlines()[-1]))
+
+    def mediana(chave):
+        valores = [medida[chave] for medida in medidas if medida[chave] is not None]
+        return round(statistics.median(valores), 4) if valores else None
+
+    resultado = {
+        "vendas": args.vendas,
+        "repeticoes": args.repeticoes,
+        "importacao_s": mediana("importacao_s"),
+        "banco_s": mediana("banco_s"),
+        "primeira_pintura_s": mediana("primeira_pintura_s"),
+        "painel_s": mediana("painel_s"),
+    }
+    print(resultado)
+    return resultado
+
+
+_CODIGO_AGRUPADA = r"""
+import json, sys, time
+from sorveteria_backend import SorveteriaBackend
+caminho, modo, vendas, intervalo_ms, max_operacoes = sys.argv[1], sys.argv[2], int(sys.argv[3]), float(sys.argv[4]), int(sys.argv[5])
+backend = SorveteriaBackend(caminho)
+produtos = [(produto['codigo'], produto['nome'], produto['preco']) for produto in backend.listar_produtos()]
+inicio = time.perf_counter()
+if modo == "agrupada":
+    grupo = backend.ativar_gravacao_agrupada(intervalo_ms, max_operacoes)
+    for i in range(vendas):
+        codigo, nome, preco = produtos[i % len(produtos)]
+        grupo.finalizar_venda(grupo.criar_venda(codigo, nome, 1, preco))
+        grupo.descarregar_se_vencida()
+    grupo.descarregar()
+    commits = grupo.commits
+else:
+    if modo == "full":
+        backend.conn.execute("PRAGMA synchronous = FULL")
+    for i in range(vendas):
+        codigo, nome, preco = produtos[i % len(produtos)]
+        venda_id, _ = backend.criar_venda(codigo, nome, 1, preco)
+        backend.finalizar_venda(venda_id)
+    commits = 2 * vendas
+duracao = time.perf_counter() - inicio
+gravadas = backend.conn.execute("SELECT COUNT(*) FROM Venda WHERE status = 'finalizada'").fetchone()[0]
+backend.conexoes.fechar()
+print(json.dumps({"duracao_s": duracao, "commits": commits, "gravadas": gravadas}))
+"""
+
+
+def _contar_sincronizacoes(arquivo: str) -> int:
+    """Soma as chamadas a fsync/fdatasync no resumo do `strace -c`"""
+    total = 0
+    with open(arquivo, encoding="utf-8") as resumo:
+        for linha in resumo:
+            partes = linha.split()
+            if partes and partes[-1] in ("fsync", "fdatasync"):
+                total += int(partes[3])
+    return total
+
+
+def bench_agrupada(args) -> dict:
+    """Vendas por segundo e sincronizações com o disco: um commit por operação contra a gravação agrupada.
+    
+    Cada venda é um criar_venda seguido de finalizar_venda. As sincronizações são contadas com
+    strace quando ele existe; sem ele, o campo fica None e vale a estimativa de uma por commit
+    em synchronous = FULL (em NORMAL, no WAL, só os checkpoints sincronizam).
+    """
+    strace = shutil.which("strace")
+    diretorio = os.path.dirname(os.path.abspath(__file__))
+    modos = {}
+    with tempfile.TemporaryDirectory() as pasta:
+        for modo in ("normal", "full", "agrupada"):
+            caminho = os.path.join(pasta, f"{modo}.db")
+            backend = SorveteriaBackend(caminho)
+            for i in range(args.produtos):
+                backend.criar_produto(f"Sabor {i}", 5.0 + i % 7, args.vendas)
+            backend.conexoes.fechar()
+            del backend
+
+            comando = [sys.executable, "-c", _CODIGO_AGRUPADA, caminho, modo, str(args.vendas),
+                       str(args.intervalo_ms), str(args.max_operacoes)]
+            resumo_strace = os.path.join(pasta, f"{modo}.strace")
+            if strace:
+                comando = [strace, "-f", "-c", "-e", "trace=fsync,fdatasync", "-o", resumo_strace] + comando
+            saida = subprocess.run(comando, cwd=diretorio, capture_output=True, text=True, check=True)
+            medida = json.loads(saida.stdout.strip().splitlines()[-1])
+            modos[modo] = {
+                "vendas_por_s": round(args.vendas / medida["duracao_s"], 1),
+                "commits": medida["commits"],
+                "sincronizacoes": _contar_sincronizacoes(resumo_strace) if strace else None,
+                "gravadas": medida["gravadas"],
+            }
+
+    resultado = {
+        "vendas": args.vendas,
+        "intervalo_ms": args.intervalo_ms,
+        "max_operacoes": args.max_operacoes,
+        "strace": bool(strace),
+        "modos": modos,
+        "ganho_sobre_full": round(modos["agrupada"]["vendas_por_s"] / modos["full"]["vendas_por_s"], 1),
+        "ok": all(medida["gravadas"] == args.vendas for medida in modos.values()),
+    }
+    print(resultado)
+    return resultado
+
+
+def _latencias(valores: list) -> dict:
+    valores = sorted(valores)
+    return {
+        "vendas": len(valores),
+        "p50_ms": round(valores[len(valores) // 2], 3),
+        "p99_ms": round(valores[min(len(valores) - 1, int(len(valores) * 0.99))], 3),
+        "max_ms": round(valores[-1], 3),
+    }
+
+
+def bench_backup(args) -> dict:
+    """Duração do backup online e o seu efeito na latência de criar_venda, vendendo sem parar"""
+    with tempfile.TemporaryDirectory() as pasta:
+        caminho = os.path.join(pasta, "backup.db")
+        gerar_banco(caminho, args.vendas)
+        backend = SorveteriaBackend(caminho)
+        produtos = [(produto['codigo'], produto['nome'], produto['preco']) for produto in backend.listar_produtos()]
+        for codigo, _, _ in produtos:
+            backend.atualizar_estoque(codigo, 1_000_000)
+
+        def vender(continuar) -> list:
+            latencias = []
+            i = 0
+            while continuar():
+                codigo, nome, preco = produtos[i % len(produtos)]
+                inicio = time.perf_counter()
+                backend.criar_venda(codigo, nome, 1, preco)
+                latencias.append((time.perf_counter() - inicio) * 1000)
+                i += 1
+            return latencias
+
+        fim = time.perf_counter() + args.duracao
+        sem_backup = vender(lambda: time.perf_counter() < fim)
+
+        resultado_backup = {}
+
+        def copiar():
+            resultado_backup.update(fazer_snapshot(caminho, os.path.join(pasta, "backups"), compactar=not args.sem_compactar,
+                                                   paginas_por_passo=args.paginas, pausa_s=args.pausa_ms / 1000))
+        thread = threading.Thread(target=copiar)
+        thread.start()
+        durante_backup = vender(thread.is_alive)
+        thread.join()
+        backend.conexoes.fechar()
+
+    resultado = {
+        "vendas_no_banco": args.vendas,
+        "paginas_por_passo": args.paginas,
+        "pausa_ms": args.pausa_ms,
+        "backup": resultado_backup,
+        "criar_venda_sem_backup": _latencias(sem_backup),
+        "criar_venda_durante_backup": _latencias(durante_backup),
+        "ok": resultado_backup.get("ok", False),
+    }
+    print(resultado)
+    return resultado
+
+
+def bench_arquivo(args) -> dict:
+    """Consultas de vendas e tamanho do banco antes e depois de arquivar as vendas antigas"""
+    with tempfile.TemporaryDirectory() as pasta:
+        caminho = os.path.join(pasta, "arquivo.db")
+        gerar_banco(caminho, args.vendas, dias=args.dias)
+        backend = SorveteriaBackend(caminho)
+        recente = (datetime.now() - timedelta(days=30)).strftime("%Y-%m-%d")
+        consultas = {
+            "listar_vendas()": lambda: backend.listar_vendas(),
+            "listar_vendas_pagina": lambda: backend.listar_vendas_pagina(limit=50),
+            "listar_vendas (30 dias)": lambda: backend.listar_vendas(data_inicio=recente),
+            "calcular_resumo": backend.calcular_resumo,
+        }
+
+        def medir() -> dict:
+            medidas = {nome: _cronometrar(chamada, args.repeticoes, args.limite) for nome, chamada in consultas.items()}
+            backend.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            medidas["bytes_banco"] = os.path.getsize(caminho)
+            return medidas
+
+        antes = medir()
+        inicio = time.perf_counter()
+        movidas = backend.arquivar_vendas(dias=args.horizonte)
+        duracao = time.perf_counter() - inicio
+        backend.conn.execute("VACUUM")  # Devolve ao disco as páginas das vendas removidas
+        depois = medir()
+        total_depois = len(backend.listar_vendas(data_inicio=""))
+        backend.conexoes.fechar()
+
+    resultado = {
+        "vendas": args.vendas,
+        "dias": args.dias,
+        "horizonte_dias": args.horizonte,
+        "arquivadas": sum(movidas.values()),
+        "arquivamento_s": round(duracao, 2),
+        "antes": antes,
+        "depois": depois,
+        "ok": total_depois == args.vendas,
+    }
+    print(resultado)
+    return resultado
+
+
+def _tempo_e_memoria(chamada) -> dict:
+    """Tempo de uma chamada e, numa segunda chamada sob tracemalloc, o pico de memória alocada"""
+    inicio = time.perf_counter()
+    chamada()
+    duracao = time.perf_counter() - inicio
+    tracemalloc.start()
+    chamada()
+    pico = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"tempo_s": round(duracao, 3), "pico_mb": round(pico / 2 ** 20, 1)}
+
+
+def bench_registros(args) -> dict:
+    """Vendas lidas como dicionários, como registros e em fluxo; e o cache de comandos preparados"""
+    with tempfile.TemporaryDirectory() as pasta:
+        caminho = os.path.join(pasta, "registros.db")
+        gerar_banco(caminho, args.vendas)
+        backend = SorveteriaBackend(caminho)
+        sql_antigo = "SELECT * FROM Venda ORDER BY data DESC, hora DESC"
+
+        leituras = {
+            "dict(row) com fetchall (antigo)": lambda: [dict(row) for row in backend.conn_leitura.execute(sql_antigo).fetchall()],
+            "listar_vendas (dicionários)": backend.listar_vendas,
+            "list(iter_vendas) (registros)": lambda: list(backend.iter_vendas()),
+            "iter_vendas em fluxo (soma)": lambda: sum(venda.valor_total for venda in backend.iter_vendas()),
+        }
+        resultado_leituras = {}
+        for nome, chamada in leituras.items():
+            resultado_leituras[nome] = _tempo_e_memoria(chamada)
+            print(nome, resultado_leituras[nome])
+
+        # Consultas IN (...) de tamanhos variados, como as de obter_vendas a cada notificação
+        aleatorio = random.Random(args.semente)
+        maximo = backend.conn.execute("SELECT MAX(codigo) FROM Venda").fetchone()[0]
+        listas = [[aleatorio.randint(1, maximo) for _ in range(aleatorio.randint(1, args.tamanho_in))]
+                  for _ in range(args.consultas)]
+        resultado_cache = {}
+        for cache in (0, 128, 256):
+            conn = sqlite3.connect(caminho, cached_statements=cache)
+            for completar in (False, True):
+                inicio = time.perf_counter()
+                for codigos in listas:
+                    if completar:
+                        lista, parametros = marcadores(codigos)
+                    else:
+                        lista, parametros = ", ".join("?" for _ in codigos), codigos
+                    conn.execute(f"SELECT * FROM Venda WHERE codigo IN ({lista})", parametros).fetchall()
+                nome = f"cache {cache}, {'completando' if completar else 'sem completar'} a lista"
+                resultado_cache[nome] = round((time.perf_counter() - inicio) / len(listas) * 1e6, 1)
+            conn.close()
+        print({"us_por_consulta": resultado_cache})
+        backend.conexoes.fechar()
+
+    resultado = {
+        "vendas": args.vendas,
+        "leituras": resultado_leituras,
+        "in_us_por_consulta": resultado_cache,
+    }
+    print(resultado)
+    return resultado
+
+
+def bench_estoque(args) -> dict:
+    """Estoque baixo filtrado em Python x índice parcial; previsão varrendo Venda x agregado diário"""
+    with tempfile.TemporaryDirectory() as pasta:
+        caminho = os.path.join(pasta, "estoque.db")
+        gerar_banco(caminho, args.vendas, produtos=args.produtos)
+        backend = SorveteriaBackend(caminho)
+        inicio_janela = (datetime.now() - timedelta(days=backend.JANELA_PREVISAO - 1)).strftime("%Y-%m-%d")
+
+        def previsao_antiga():
+            # O que a previsão custaria sem VendaProdutoDiaria: somar as vendas da janela em Venda
+            return backend.conn_leitura.execute("""
+                SELECT codigo_produto, SUM(quantidade) FROM Venda WHERE data >= ? GROUP BY codigo_produto
+            """, (inicio_janela,)).fetchall()
+
+        consultas = {
+            "estoque baixo: catálogo filtrado em Python (antigo)":
+                lambda: [p for p in backend._consultar_produtos() if p['quantidade'] < p['estoque_minimo']],
+            "estoque baixo: listar_produtos_pagina(estoque_baixo=True)":
+                lambda: backend.listar_produtos_pagina(limit=args.produtos, estoque_baixo=True),
+            "previsão: soma da janela em Venda (antigo)": previsao_antiga,
+            "previsão: prever_ruptura (agregado diário)": backend.prever_ruptura,
+        }
+        resultado_consultas = {}
+        for nome, chamada in consultas.items():
+            resultado_consultas[nome] = _cronometrar(chamada, args.repeticoes, args.limite)
+            print(nome, resultado_consultas[nome])
+
+        # Custo do trigger de VendaProdutoDiaria em cada venda: as mesmas vendas com e sem ele
+        # (o estoque é reposto antes, para nenhuma venda parar em estoque insuficiente)
+        backend.conn.execute("UPDATE Estoque SET quantidade = quantidade + ?", (2 * args.vendas_trigger,))
+        backend.conn.commit()
+        produtos = [(produto['codigo'], produto['nome'], produto['preco']) for produto in backend._consultar_produtos()]
+        ddl = backend.conn.execute(
+            "SELECT sql FROM sqlite_master WHERE name = 'trg_venda_produto_diaria'").fetchone()[0]
+        resultado_trigger = {}
+        for nome in ("sem trigger", "com trigger"):
+            if nome == "sem trigger":
+                backend.conn.execute("DROP TRIGGER trg_venda_produto_diaria")
+            else:
+                backend.conn.execute(ddl)
+            tempos = []
+            for i in range(args.vendas_trigger):
+                produto_id, produto_nome, preco = produtos[i % len(produtos)]
+                inicio = time.perf_counter()
+                backend.criar_venda(produto_id, produto_nome, 1, preco)
+                tempos.append((time.perf_counter() - inicio) * 1000)
+            resultado_trigger[nome] = _latencias(tempos)
+            print("criar_venda", nome, resultado_trigger[nome])
+        linhas = backend.conn.execute("SELECT COUNT(*) FROM VendaProdutoDiaria").fetchone()[0]
+        backend.conexoes.fechar()
+
+    resultado = {
+        "vendas": args.vendas,
+        "produtos": args.produtos,
+        "linhas_venda_produto_diaria": linhas,
+        "consultas": resultado_consultas,
+        "criar_venda": resultado_trigger,
+    }
+    print(resultado)
+    return resultado
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks do backend da Sorveteria")
+    parser.add_argument("--saida", help="grava os resultados em JSON neste arquivo")
+    subparsers = parser.add_subparsers(dest="bench", required=True)
+
+    concorrencia = subparsers.add_parser("concorrencia", help="vazão de leitores e escritores simultâneos")
+    concorrencia.add_argument("--escritores", type=int, default=2)
+    concorrencia.add_argument("--leitores", type=int, default=2)
+    concorrencia.add_argument("--duracao", type=float, default=5.0, help="segundos por modo")
+
+    estresse = subparsers.add_parser("estresse", help="processos concorrentes esgotando o mesmo estoque")
+    estresse.add_argument("--processos", type=int, default=6)
+    estresse.add_argument("--estoque", type=int, default=2000)
+
+    busca = subparsers.add_parser("busca", help="tempo por tecla da busca incremental de produtos")
+    busca.add_argument("--produtos", type=int, default=500)
+
+    carga = subparsers.add_parser("carga", help="vendas por segundo e latência p99 pela API HTTP")
+    carga.add_argument("--url", help="host:porta de um servidor já rodando (padrão: sobe um num banco temporário)")
+    carga.add_argument("--terminais", type=int, default=8, help="clientes registrando vendas")
+    carga.add_argument("--leitores", type=int, default=2, help="clientes listando vendas")
+    carga.add_argument("--produtos", type=int, default=20)
+    carga.add_argument("--duracao", type=float, default=5.0)
+
+    analise = subparsers.add_parser("analise", help="análises vetorizadas do painel sobre muitas vendas")
+    analise.add_argument("--vendas", type=int, default=1_000_000)
+    analise.add_argument("--produtos", type=int, default=50)
+
+    metodos = subparsers.add_parser("metodos", help="tempo de cada método do backend em bancos sintéticos")
+    metodos.add_argument("--tamanhos", default="1000,100000,1000000", help="quantidades de vendas, separadas por vírgula")
+    metodos.add_argument("--metodos", help="só estes métodos, separados por vírgula")
+    metodos.add_argument("--repeticoes", type=int, default=20, help="chamadas por método")
+    metodos.add_argument("--limite", type=float, default=3.0, help="segundos por método, no máximo")
+    metodos.add_argument("--semente", type=int, default=42)
+    metodos.add_argument("--pasta", help="guarda e reaproveita os bancos gerados nesta pasta")
+    metodos.add_argument("--comparar", help="JSON de uma execução anterior (--saida) para apontar regressões")
+    metodos.add_argument("--tolerancia", type=float, default=0.5, help="piora aceita no tempo mínimo (0.5 = 50%%)")
+
+    inicio = subparsers.add_parser("inicio", help="tempo de abertura do app: importações, banco e primeira pintura")
+    inicio.add_argument("--vendas", type=int, default=100_000, help="tamanho do banco sintético aberto")
+    inicio.add_argument("--repeticoes", type=int, default=5)
+
+    agrupada = subparsers.add_parser("agrupada", help="vendas por segundo e sincronizações: commit a commit x gravação agrupada")
+    agrupada.add_argument("--vendas", type=int, default=5000)
+    agrupada.add_argument("--produtos", type=int, default=20)
+    agrupada.add_argument("--intervalo-ms", type=float, default=50.0, help="idade máxima da fila antes do commit")
+    agrupada.add_argument("--max-operacoes", type=int, default=200, help="operações por commit, no máximo")
+
+    backup = subparsers.add_parser("backup", help="duração do backup online e latência de criar_venda durante ele")
+    backup.add_argument("--vendas", type=int, default=1_000_000, help="tamanho do banco sintético copiado")
+    backup.add_argument("--duracao", type=float, default=3.0, help="segundos vendendo sem backup, para comparar")
+    backup.add_argument("--paginas", type=int, default=256, help="páginas copiadas por passo")
+    backup.add_argument("--pausa-ms", type=float, default=2.0, help="pausa entre os passos")
+    backup.add_argument("--sem-compactar", action="store_true")
+
+    arquivo = subparsers.add_parser("arquivo", help="consultas de vendas e tamanho do banco antes e depois do arquivamento")
+    arquivo.add_argument("--vendas", type=int, default=1_000_000)
+    arquivo.add_argument("--dias", type=int, default=1095, help="histórico gerado, em dias")
+    arquivo.add_argument("--horizonte", type=int, default=365, help="vendas com mais dias que isso são arquivadas")
+    arquivo.add_argument("--repeticoes", type=int, default=10)
+    arquivo.add_argument("--limite", type=float, default=5.0, help="segundos por consulta, no máximo")
+
+    registros = subparsers.add_parser("registros", help="memória e tempo: dicionários x registros x fluxo; cache de comandos")
+    registros.add_argument("--vendas", type=int, default=1_000_000)
+    registros.add_argument("--consultas", type=int, default=5000, help="consultas IN (...) no teste do cache")
+    registros.add_argument("--tamanho-in", type=int, default=100, help="códigos por IN (...), no máximo")
+    registros.add_argument("--semente", type=int, default=42)
+
+    estoque = subparsers.add_parser("estoque", help="estoque baixo e previsão de ruptura: varredura x índice parcial e agregado")
+    estoque.add_argument("--vendas", type=int, default=1_000_000)
+    estoque.add_argument("--produtos", type=int, default=2000)
+    estoque.add_argument("--vendas-trigger", type=int, default=2000, help="vendas medidas com e sem o trigger")
+    estoque.add_argument("--repeticoes", type=int, default=20)
+    estoque.add_argument("--limite", type=float, default=5.0, help="segundos por consulta, no máximo")
+
+    args = parser.parse_args(argv)
+    benches = {
+        "concorrencia": bench_concorrencia,
+        "estresse": bench_estresse,
+        "busca": bench_busca,
+        "carga": bench_carga,
+        "analise": bench_analise,
+        "metodos": bench_metodos,
+        "inicio": bench_inicio,
+        "agrupada": bench_agrupada,
+        "backup": bench_backup,
+        "arquivo": bench_arquivo,
+        "registros": bench_registros,
+        "estoque": bench_estoque,
+    }
+    resultados = benches[args.bench](args)
+
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as arquivo:
+            json.dump({args.bench: resultados}, arquivo, indent=2)
+    return 0 if resultados.get("ok", True) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+import heapq
+import unicodedata
+from typing import Dict, List, Set, Tuple
+
+
+def normalizar(texto: str) -> str:
+    """Minúsculas e sem acentos, para "acai" encontrar "Açaí" """
+    decomposto = unicodedata.normalize("NFKD", texto)
+    return "".join(c for c in decomposto if not unicodedata.combining(c)).casefold()
+
+
+def _trigramas(palavra: str, bordas: bool = True) -> Set[str]:
+    if bordas:
+        palavra = f"  {palavra} "
+    return {palavra[i:i + 3] for i in range(len(palavra) - 2)}
+
+
+class IndiceBusca:
+    """Índice em memória dos nomes de produtos para busca incremental.
+
+    Cada prefixo de cada palavra do nome aponta para os produtos que o contêm, então uma
+    consulta digitada ("sorv choc") é a interseção de poucos conjuntos. Quando nenhum nome
+    começa com os termos digitados, trigramas encontram trechos no meio das palavras e
+    pequenos erros de digitação.
+    """
+
+    def __init__(self):
+        self.nomes: Dict[int, str] = {}
+        self._normalizados: Dict[int, str] = {}
+        self._prefixos: Dict[str, Set[int]] = {}
+        self._trigramas: Dict[str, Set[int]] = {}
+
+    def carregar(self, produtos: List[Dict]):
+        """Recria o índice a partir de uma lista de produtos com 'codigo' e 'nome'"""
+        self.nomes = {}
+        self._normalizados = {}
+        self._prefixos = {}
+        self._trigramas = {}
+        for produto in produtos:
+            self.adicionar(produto['codigo'], produto['nome'])
+
+    def adicionar(self, codigo: int, nome: str):
+        if codigo in self.nomes:
+            self.remover(codigo)
+        normalizado = normalizar(nome)
+        self.nomes[codigo] = nome
+        self._normalizados[codigo] = normalizado
+        for palavra in normalizado.split():
+            for fim in range(1, len(palavra) + 1):
+                self._prefixos.setdefault(palavra[:fim], set()).add(codigo)
+            for trigrama in _trigramas(palavra):
+                self._trigramas.setdefault(trigrama, set()).add(codigo)
+
+    def remover(self, codigo: int):
+        normalizado = self._normalizados.pop(codigo, None)
+        self.nomes.pop(codigo, None)
+        if normalizado is None:
+            return
+        for palavra in normalizado.split():
+            for fim in range(1, len(palavra) + 1):
+                self._descartar(self._prefixos, palavra[:fim], codigo)
+            for trigrama in _trigramas(palavra):
+                self._descartar(self._trigramas, trigrama, codigo)
+
+    def sincronizar(self, codigos: List[int], produtos: List[Dict]):
+        """Aplica uma notificação de mudança em Produto: os `codigos` que voltaram em `produtos`
+        (relidos do banco) são reindexados com o nome atual, os demais saíram do catálogo"""
+        atuais = {produto['codigo']: produto['nome'] for produto in produtos}
+        for codigo in codigos:
+            if codigo in atuais:
+                self.adicionar(codigo, atuais[codigo])
+            else:
+                self.remover(codigo)
+
+    @staticmethod
+    def _descartar(indice: Dict[str, Set[int]], chave: str, codigo: int):
+        codigos = indice.get(chave)
+        if codigos is not None:
+            codigos.discard(codigo)
+            if not codigos:
+                del indice[chave]
+
+    def buscar(self, consulta: str, limite: int = 10) -> List[Tuple[int, str]]:
+        """Retorna até `limite` pares (codigo, nome), dos mais relevantes para os menos"""
+        termos = normalizar(consulta).split()
+        if not termos:
+            return []
+
+        # Interseção dos conjuntos de prefixo, começando pelo menor
+        conjuntos = sorted((self._prefixos.get(termo, set()) for termo in termos), key=len)
+        candidatos = set(conjuntos[0])
+        for conjunto in conjuntos[1:]:
+            candidatos &= conjunto
+            if not candidatos:
+                break
+
+        if candidatos:
+            texto = " ".join(termos)
+            melhores = heapq.nsmallest(limite, candidatos, key=lambda codigo: (
+                not self._normalizados[codigo].startswith(texto),
+                len(self._normalizados[codigo]),
+                self._normalizados[codigo],
+            ))
+            return [(codigo, self.nomes[codigo]) for codigo in melhores]
+
+        return self._buscar_trigramas(termos, limite)
+
+    def _buscar_trigramas(self, termos: List[str], limite: int) -> List[Tuple[int, str]]:
+        pontos: Dict[int, int] = {}
+        total = 0
+        for termo in termos:
+            # O termo digitado pode ser um pedaço do meio da palavra: sem bordas
+            for trigrama in _trigramas(termo, bordas=False):
+                total += 1
+                for codigo in self._trigramas.get(trigrama, ()):
+                    pontos[codigo] = pontos.get(codigo, 0) + 1
+
+        # Exige pelo menos metade dos trigramas em comum para não sugerir qualquer coisa
+        minimo = max(1, (total + 1) // 2)
+        melhores = heapq.nsmallest(limite, (codigo for codigo, ponto in pontos.items() if ponto >= minimo),
+                                   key=lambda codigo: (-pontos[codigo], self._normalizados[codigo]))
+        return [(codigo, self.nomes[codigo]) for codigo in melhores]
@@ -0,0 +1,237 @@
+import csv
+import gzip
+import json
+import os
+import sqlite3
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from sorveteria_backend import SorveteriaBackend
+
+# Colunas exportadas por tabela, na ordem dos arquivos gerados
+COLUNAS = {
+    "Venda": ["codigo", "codigo_produto", "produto_nome", "quantidade", "preco_unitario",
+              "valor_total", "data", "hora", "status", "codigo_promocao"],
+    "Despesa": ["codigo", "descricao", "valor", "data"],
+}
+
+FORMATOS = ("csv", "jsonl", "colunar", "parquet")
+
+
+def iterar_lotes(backend: SorveteriaBackend, tabela: str, data_inicio: Optional[str] = None,
+                 data_fim: Optional[str] = None, desde_codigo: int = 0, status: Optional[str] = None,
+                 tamanho_lote: int = 1000, ate_primeira_aberta: bool = False) -> Iterator[List[tuple]]:
+    """Percorre a tabela em ordem de código com fetchmany: só um lote fica em memória por vez.
+
+    Vendas incluem as já arquivadas que o período alcança (sem data inicial, todas): cada arquivo
+    anual sai inteiro, por ano, e Venda por último, cada um na ordem da sua chave primária. Com
+    `ate_primeira_aberta`, só saem vendas de código menor que o da venda aberta mais antiga.
+    """
+    colunas = COLUNAS[tabela]
+    condicoes = ["codigo > ?"]
+    parametros: list = [desde_codigo]
+    if data_inicio:
+        condicoes.append("data >= ?")
+        parametros.append(data_inicio)
+    if data_fim:
+        condicoes.append("data <= ?")
+        parametros.append(data_fim)
+    if status and tabela == "Venda":
+        condicoes.append("status = ?")
+        parametros.append(status)
+    if ate_primeira_aberta and tabela == "Venda":
+        # Lido no mesmo instantâneo da exportação; sem venda aberta, não há limite
+        condicoes.append("codigo < IFNULL((SELECT MIN(codigo) FROM main.Venda WHERE status = 'aberta'), "
+                         "9223372036854775807)")
+
+    conn = backend.conn_leitura
+    iniciada = False
+    if tabela != "Venda":
+        fontes = [(tabela, "1")]
+    elif conn.in_transaction:  # banco :memory:, leitura na conexão de escrita já em transação
+        fontes = backend._fontes_vendas(data_inicio or "", conn)
+    else:
+        # Uma transação de leitura: o arquivo inteiro sai do mesmo instantâneo do banco. O ATTACH
+        # não roda dentro dela, então os arquivos são anexados antes e as datas de corte relidas
+        # depois do BEGIN; se um ano novo foi arquivado entre as duas leituras, começa de novo
+        while True:
+            backend._fontes_vendas(data_inicio or "", conn)
+            conn.execute("BEGIN")
+            try:
+                fontes = backend._fontes_vendas(data_inicio or "", conn)
+                iniciada = True
+                break
+            except sqlite3.OperationalError:
+                conn.rollback()
+
+    # Cada fonte separada, sem índice: lida pela chave primária, em ordem de código, sem ordenar
+    # um UNION ALL de tudo numa B-tree temporária
+    cursor = conn.cursor()
+    try:
+        for fonte, condicao in fontes:
+            cursor.execute(f"""
+                SELECT {', '.join(colunas)} FROM {fonte} NOT INDEXED
+                WHERE {condicao} AND {' AND '.join(condicoes)}
+                ORDER BY codigo
+            """, parametros)
+            while True:
+                lote = cursor.fetchmany(tamanho_lote)
+                if not lote:
+                    break
+                yield [tuple(linha) for linha in lote]
+    finally:
+        cursor.close()
+        if iniciada:
+            conn.rollback()
+
+
+class _EscritorCsv:
+    def __init__(self, arquivo, colunas: List[str]):
+        self.escritor = csv.writer(arquivo)
+        self.escritor.writerow(colunas)
+
+    def escrever(self, lote: List[tuple]):
+        self.escritor.writerows(lote)
+
+    def fechar(self):
+        pass
+
+
+class _EscritorJsonl:
+    def __init__(self, arquivo, colunas: List[str]):
+        self.arquivo = arquivo
+        self.colunas = colunas
+
+    def escrever(self, lote: List[tuple]):
+        self.arquivo.writelines(json.dumps(dict(zip(self.colunas, linha)), ensure_ascii=False) + "\n"
+                                for linha in lote)
+
+    def fechar(self):
+        pass
+
+
+class _EscritorColunar:
+    """Um cabeçalho com as colunas e, por lote, uma linha JSON com uma lista de valores por coluna"""
+
+    def __init__(self, arquivo, colunas: List[str]):
+        self.arquivo = arquivo
+        self.colunas = colunas
+        self.arquivo.write(json.dumps({"colunas": colunas}) + "\n")
+
+    def escrever(self, lote: List[tuple]):
+        grupo = {coluna: list(valores) for coluna, valores in zip(self.colunas, zip(*lote))}
+        self.arquivo.write(json.dumps({"linhas": len(lote), "valores": grupo}, ensure_ascii=False) + "\n")
+
+    def fechar(self):
+        pass
+
+
+class _EscritorParquet:
+    """Parquet de verdade, um row group por lote; precisa do pyarrow instalado"""
+
+    def __init__(self, arquivo, colunas: List[str]):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("O formato parquet precisa do pacote pyarrow (pip install pyarrow)")
+        self.pyarrow = pyarrow
+        self.colunas = colunas
+        self.escritor = None
+        self.arquivo = arquivo
+
+    def escrever(self, lote: List[tuple]):
+        tabela = self.pyarrow.table({coluna: list(valores) for coluna, valores in zip(self.colunas, zip(*lote))})
+        if self.escritor is None:
+            import pyarrow.parquet
+            self.escritor = pyarrow.parquet.ParquetWriter(self.arquivo, tabela.schema)
+        self.escritor.write_table(tabela)
+
+    def fechar(self):
+        if self.escritor is not None:
+            self.escritor.close()
+
+
+ESCRITORES = {
+    "csv": _EscritorCsv,
+    "jsonl": _EscritorJsonl,
+    "colunar": _EscritorColunar,
+    "parquet": _EscritorParquet,
+}
+
+
+def exportar(backend: SorveteriaBackend, tabela: str, destino: str, formato: str = "csv",
+             data_inicio: Optional[str] = None, data_fim: Optional[str] = None, desde_codigo: int = 0,
+             status: Optional[str] = None, compactar: bool = False, tamanho_lote: int = 1000,
+             ate_primeira_aberta: bool = False) -> Dict:
+    """Exporta Venda ou Despesa para `destino` e retorna quantas linhas saíram e o maior código.
+
+    O arquivo é escrito com outro nome e só renomeado no fim, então um destino existente é
+    sempre uma exportação completa.
+    """
+    if tabela not in COLUNAS:
+        raise ValueError(f"Tabela sem exportação: {tabela}")
+    if formato not in ESCRITORES:
+        raise ValueError(f"Formato desconhecido: {formato}")
+    if compactar and not destino.endswith(".gz"):
+        destino += ".gz"
+
+    temporario = destino + ".parcial"
+    binario = formato == "parquet"
+    if compactar:
+        arquivo = gzip.open(temporario, "wb" if binario else "wt", encoding=None if binario else "utf-8",
+                            newline=None if binario else "")
+    else:
+        arquivo = open(temporario, "wb" if binario else "w", encoding=None if binario else "utf-8",
+                       newline=None if binario else "")
+
+    linhas = 0
+    ultimo_codigo = desde_codigo
+    try:
+        with arquivo:
+            escritor = ESCRITORES[formato](arquivo, COLUNAS[tabela])
+            for lote in iterar_lotes(backend, tabela, data_inicio, data_fim, desde_codigo, status, tamanho_lote,
+                                     ate_primeira_aberta):
+                escritor.escrever(lote)
+                linhas += len(lote)
+                ultimo_codigo = max(ultimo_codigo, lote[-1][0])
+            escritor.fechar()
+        os.replace(temporario, destino)
+    except BaseException:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        raise
+    return {"tabela": tabela, "destino": destino, "linhas": linhas, "ultimo_codigo": ultimo_codigo}
+
+
+def ler_estado(caminho: str) -> Dict[str, int]:
+    """Último código exportado por tabela, para as exportações incrementais"""
+    if not os.path.exists(caminho):
+        return {}
+    with open(caminho, encoding="utf-8") as arquivo:
+        return json.load(arquivo)
+
+
+def gravar_estado(caminho: str, estado: Dict[str, int]):
+    temporario = caminho + ".parcial"
+    with open(temporario, "w", encoding="utf-8") as arquivo:
+        json.dump(estado, arquivo, indent=2)
+    os.replace(temporario, caminho)
+
+
+def exportar_incremental(backend: SorveteriaBackend, tabela: str, destino: str, arquivo_estado: str,
+                         **opcoes) -> Tuple[Dict, Dict[str, int]]:
+    """Exporta só o que entrou desde a última execução e avança o estado depois do arquivo pronto.
+
+    O estado guarda só o maior código exportado, então vendas saem só finalizadas e só até a venda
+    aberta mais antiga: as seguintes esperam ela ser finalizada e saem, uma vez, com o status final.
+    """
+    if tabela == "Venda":
+        if opcoes.get("status", "finalizada") not in (None, "finalizada"):
+            raise ValueError("A exportação incremental de vendas só exporta vendas finalizadas")
+        opcoes.update(status="finalizada", ate_primeira_aberta=True)
+    estado = ler_estado(arquivo_estado)
+    resultado = exportar(backend, tabela, destino, desde_codigo=estado.get(tabela, 0), **opcoes)
+    if resultado["linhas"]:
+        estado[tabela] = resultado["ultimo_codigo"]
+        gravar_estado(arquivo_estado, estado)
+    return resultado, estado
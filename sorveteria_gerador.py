@@ -0,0 +1,184 @@
+import argparse
+import math
+import random
+import sys
+import time
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+from sorveteria_backend import SorveteriaBackend
+
+SABORES = ["Açaí", "Chocolate", "Morango", "Creme", "Flocos", "Limão", "Maracujá", "Coco", "Doce de Leite",
+           "Pistache", "Napolitano", "Menta", "Café", "Abacaxi", "Uva", "Baunilha", "Cupuaçu", "Brigadeiro"]
+TIPOS = [("Sorvete", "Sorvete", 12.0), ("Picolé", "Picolé", 6.0), ("Milkshake", "Bebida", 16.0),
+         ("Taça", "Sobremesa", 22.0), ("Casquinha", "Sorvete", 7.0), ("Pote", "Sorvete", 30.0)]
+TAMANHOS = [("P", 0.8), ("M", 1.0), ("G", 1.3), ("500ml", 1.6), ("1L", 2.4)]
+DESPESAS = [("Energia elétrica", 450.0), ("Leite e creme", 300.0), ("Frutas", 180.0), ("Embalagens", 90.0),
+            ("Manutenção do freezer", 250.0), ("Aluguel", 2500.0), ("Gás", 120.0)]
+
+# Peso de cada hora de funcionamento (10h às 21h): pico no meio da tarde
+PESO_HORA = {10: 2, 11: 3, 12: 5, 13: 7, 14: 9, 15: 10, 16: 10, 17: 8, 18: 6, 19: 5, 20: 3, 21: 2}
+# Peso por dia da semana (0 = segunda): fim de semana vende mais
+PESO_DIA_SEMANA = [0.7, 0.7, 0.8, 0.8, 1.0, 1.5, 1.4]
+
+
+def peso_estacao(dia: date) -> float:
+    """Verão (janeiro) vende cerca de três vezes o inverno (julho)"""
+    return 1.0 + 0.5 * math.cos(2 * math.pi * (dia.timetuple().tm_yday - 15) / 365)
+
+
+def gerar_banco(caminho: str, vendas: int, produtos: Optional[int] = None, dias: int = 365,
+                promocoes: Optional[int] = None, semente: int = 42, tamanho_lote: int = 50_000,
+                hoje: Optional[date] = None) -> Dict:
+    """Preenche um banco de rascunho com dados sintéticos; a mesma semente gera os mesmos dados.
+
+    As vendas seguem curvas de hora do dia, dia da semana e estação; as anteriores a hoje saem
+    finalizadas, as de hoje parte abertas. Promoções vigentes no dia são aplicadas como em
+    criar_venda. O estoque final entra no livro como um único movimento de importação, então
+    a reconciliação do estoque continua batendo.
+    """
+    aleatorio = random.Random(semente)
+    hoje = hoje or date.today()
+    produtos = produtos or min(2000, max(50, vendas // 500))
+    promocoes = promocoes if promocoes is not None else max(5, dias // 12)
+    inicio = time.perf_counter()
+
+    backend = SorveteriaBackend(caminho)
+    conn = backend.conn
+
+    # Produtos
+    catalogo = []
+    for i in range(produtos):
+        tipo, categoria, preco_base = TIPOS[i % len(TIPOS)]
+        sabor = SABORES[(i // len(TIPOS)) % len(SABORES)]
+        tamanho, fator = TAMANHOS[(i // (len(TIPOS) * len(SABORES))) % len(TAMANHOS)]
+        sufixo = f" #{i // (len(TIPOS) * len(SABORES) * len(TAMANHOS))}" if i >= len(TIPOS) * len(SABORES) * len(TAMANHOS) else ""
+        catalogo.append((i + 1, f"{tipo} de {sabor} {tamanho}{sufixo}", round(preco_base * fator, 2), categoria))
+    estoques = [aleatorio.randint(0, 200) for _ in catalogo]
+    conn.execute("BEGIN")
+    conn.executemany("INSERT INTO Produto (codigo, nome, preco, categoria) VALUES (?, ?, ?, ?)", catalogo)
+    conn.executemany("INSERT INTO Estoque (codigo_produto, quantidade) VALUES (?, ?)",
+                     [(produto[0], estoque) for produto, estoque in zip(catalogo, estoques)])
+    backend._registrar_movimentos(conn.cursor(), [(produto[0], estoque, 'importacao', None)
+                                                  for produto, estoque in zip(catalogo, estoques)])
+    conn.commit()
+
+    # Promoções: gerais, por categoria e por produto, com duração de 3 a 20 dias
+    primeiro_dia = hoje - timedelta(days=dias - 1)
+    categorias = sorted({produto[3] for produto in catalogo})
+    lista_promocoes = []
+    for codigo in range(1, promocoes + 1):
+        comeco = primeiro_dia + timedelta(days=aleatorio.randrange(dias))
+        fim = comeco + timedelta(days=aleatorio.randint(3, 20))
+        alvo = aleatorio.random()
+        codigo_produto = aleatorio.randint(1, produtos) if alvo < 0.4 else None
+        categoria = aleatorio.choice(categorias) if 0.4 <= alvo < 0.8 else None
+        desconto = float(aleatorio.choice([5, 10, 15, 20, 25, 30]))
+        lista_promocoes.append((codigo, f"Promoção {codigo}", desconto, str(comeco), str(fim), codigo_produto, categoria))
+    conn.execute("BEGIN")
+    conn.executemany("""
+        INSERT INTO Promocao (codigo, descricao, desconto_percentual, data_inicio, data_fim, codigo_produto, categoria)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, lista_promocoes)
+    conn.commit()
+
+    # Quantas vendas caem em cada dia, pela curva de estação e de dia da semana
+    calendario = [primeiro_dia + timedelta(days=i) for i in range(dias)]
+    pesos = [peso_estacao(dia) * PESO_DIA_SEMANA[dia.weekday()] for dia in calendario]
+    total_pesos = sum(pesos)
+    por_dia = [int(vendas * peso / total_pesos) for peso in pesos]
+    for i in aleatorio.sample(range(dias), vendas - sum(por_dia)) if vendas > sum(por_dia) else []:
+        por_dia[i] += 1
+
+    horas = list(PESO_HORA)
+    pesos_hora = list(PESO_HORA.values())
+    # Produtos mais baratos e alguns sabores vendem mais (cauda longa)
+    pesos_produto = [1.0 / (1 + (i % 40)) for i in range(produtos)]
+    hoje_texto = str(hoje)
+    geradas = 0
+    lote: List[tuple] = []
+
+    def gravar(linhas: List[tuple]):
+        conn.execute("BEGIN")
+        conn.executemany("""
+            INSERT INTO Venda (codigo_produto, produto_nome, quantidade, preco_unitario, valor_total,
+                               data, hora, status, codigo_promocao)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, linhas)
+        conn.commit()
+
+    for dia, quantidade_dia in zip(calendario, por_dia):
+        if not quantidade_dia:
+            continue
+        data = str(dia)
+        # Melhor promoção vigente por alvo, como em MotorPromocoes.melhor
+        vigentes = [p for p in lista_promocoes if p[3] <= data <= p[4]]
+        escolhidos = aleatorio.choices(catalogo, weights=pesos_produto, k=quantidade_dia)
+        horarios = sorted(aleatorio.choices(horas, weights=pesos_hora, k=quantidade_dia))
+        for produto, hora in zip(escolhidos, horarios):
+            codigo, nome, preco, categoria = produto
+            melhor = None
+            for promocao in vigentes:
+                if (promocao[5] == codigo or promocao[6] == categoria or (promocao[5] is None and promocao[6] is None)) \
+                        and (melhor is None or promocao[2] > melhor[2]):
+                    melhor = promocao
+            quantidade = aleatorio.choice((1, 1, 1, 2, 2, 3))
+            total = quantidade * preco
+            if melhor:
+                total = round(total * (1 - melhor[2] / 100), 2)
+            status = 'aberta' if data == hoje_texto and aleatorio.random() < 0.3 else 'finalizada'
+            lote.append((codigo, nome, quantidade, preco, total, data,
+                         f"{hora:02d}:{aleatorio.randrange(60):02d}:{aleatorio.randrange(60):02d}",
+                         status, melhor[0] if melhor else None))
+            if len(lote) >= tamanho_lote:
+                gravar(lote)
+                geradas += len(lote)
+                lote = []
+    if lote:
+        gravar(lote)
+        geradas += len(lote)
+
+    # Despesas: contas fixas no dia 5 e compras de insumos algumas vezes por semana
+    despesas = []
+    for dia in calendario:
+        if dia.day == 5:
+            despesas.append(("Aluguel", 2500.0, str(dia)))
+            despesas.append(("Energia elétrica", round(450 * peso_estacao(dia), 2), str(dia)))
+        if aleatorio.random() < 0.4:
+            descricao, valor = aleatorio.choice(DESPESAS[1:5] + DESPESAS[6:])
+            despesas.append((descricao, round(valor * aleatorio.uniform(0.6, 1.4), 2), str(dia)))
+    conn.execute("BEGIN")
+    conn.executemany("INSERT INTO Despesa (descricao, valor, data) VALUES (?, ?, ?)", despesas)
+    conn.commit()
+
+    backend.catalogo.invalidar()
+    backend.promocoes.invalidar()
+    backend.conexoes.fechar()
+    return {
+        "produtos": produtos,
+        "vendas": geradas,
+        "promocoes": promocoes,
+        "despesas": len(despesas),
+        "dias": dias,
+        "semente": semente,
+        "segundos": round(time.perf_counter() - inicio, 2),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Gera um banco da Sorveteria com dados sintéticos")
+    parser.add_argument("destino", help="arquivo do banco (não deve existir)")
+    parser.add_argument("--vendas", type=int, default=100_000)
+    parser.add_argument("--produtos", type=int, help="padrão: proporcional às vendas")
+    parser.add_argument("--dias", type=int, default=365)
+    parser.add_argument("--promocoes", type=int)
+    parser.add_argument("--semente", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    resultado = gerar_banco(args.destino, args.vendas, args.produtos, args.dias, args.promocoes, args.semente)
+    print(resultado)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
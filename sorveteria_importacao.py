@@ -0,0 +1,228 @@
+import csv
+import json
+import sqlite3
+import time
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from sorveteria_backend import SorveteriaBackend
+
+
+class LinhaInvalida(Exception):
+    """Linha do arquivo que não pode ser importada; a mensagem é o motivo"""
+
+
+def ler_linhas(caminho: str, formato: Optional[str] = None, separador: str = ",") -> Iterator[Tuple[int, Dict]]:
+    """Percorre o arquivo sem carregá-lo inteiro, gerando (número da linha, campos)"""
+    formato = formato or ("jsonl" if caminho.endswith((".jsonl", ".json")) else "csv")
+    with open(caminho, encoding="utf-8-sig", newline="") as arquivo:
+        if formato == "csv":
+            leitor = csv.DictReader(arquivo, delimiter=separador)
+            for campos in leitor:
+                yield leitor.line_num, campos
+        else:
+            for numero, linha in enumerate(arquivo, start=1):
+                if not linha.strip():
+                    continue
+                try:
+                    campos = json.loads(linha)
+                except json.JSONDecodeError as e:
+                    campos = {"_erro": f"JSON inválido: {e}"}
+                yield numero, campos
+
+
+def _texto(campos: Dict, nome: str, padrao: Optional[str] = None) -> str:
+    valor = campos.get(nome)
+    valor = str(valor).strip() if valor is not None else ""
+    if not valor:
+        if padrao is None:
+            raise LinhaInvalida(f"campo '{nome}' vazio")
+        return padrao
+    return valor
+
+
+def _numero(campos: Dict, nome: str, tipo=float, padrao=None):
+    valor = campos.get(nome)
+    if valor is None or str(valor).strip() == "":
+        if padrao is None:
+            raise LinhaInvalida(f"campo '{nome}' vazio")
+        return padrao
+    if isinstance(valor, str):
+        valor = valor.strip()
+        if "," in valor and "." not in valor:
+            valor = valor.replace(",", ".")  # Aceita "10,50"
+    try:
+        numero = float(valor)
+    except ValueError:
+        raise LinhaInvalida(f"campo '{nome}' não é um número: {valor!r}")
+    if numero < 0:
+        raise LinhaInvalida(f"campo '{nome}' negativo")
+    if tipo is int:
+        if not numero.is_integer():
+            raise LinhaInvalida(f"campo '{nome}' deve ser inteiro")
+        return int(numero)
+    return numero
+
+
+def _data_hora(campos: Dict, nome: str, formato: str, padrao: Optional[str] = None) -> str:
+    valor = _texto(campos, nome, padrao)
+    try:
+        datetime.strptime(valor, formato)
+    except ValueError:
+        raise LinhaInvalida(f"campo '{nome}' fora do formato {formato}: {valor!r}")
+    return valor
+
+
+class ImportadorLote:
+    """Importa produtos e vendas históricas em transações grandes, com executemany.
+
+    As linhas são validadas e acumuladas em lotes de `tamanho_lote`; cada lote é gravado numa
+    transação só. Linhas inválidas não interrompem a importação: ficam em `rejeitadas` com o
+    número da linha e o motivo. Vendas importadas mantêm a data e a hora do arquivo e não
+    mexem no estoque (já foram baixadas na época). Com `adiar_indices`, a importação de vendas
+    remove os índices de Venda antes e os recria no fim (carga inicial, com o banco fora de uso).
+    """
+
+    def __init__(self, backend: SorveteriaBackend, tamanho_lote: int = 5000, adiar_indices: bool = False):
+        self.backend = backend
+        self.conn = backend.conn
+        self.tamanho_lote = tamanho_lote
+        self.adiar_indices = adiar_indices
+        self.rejeitadas: List[Tuple[int, str]] = []
+
+    def _resultado(self, lidas: int, importadas: int, inicio: float) -> Dict:
+        segundos = time.perf_counter() - inicio
+        return {
+            "lidas": lidas,
+            "importadas": importadas,
+            "rejeitadas": len(self.rejeitadas),
+            "segundos": round(segundos, 3),
+            "linhas_por_segundo": round(importadas / segundos, 1) if segundos else 0.0,
+        }
+
+    def _gravar_lotes(self, linhas: Iterator[Tuple[int, Dict]], validar, gravar) -> Tuple[int, int]:
+        lidas = importadas = 0
+        lote = []
+        for numero, campos in linhas:
+            lidas += 1
+            try:
+                if "_erro" in campos:
+                    raise LinhaInvalida(campos["_erro"])
+                lote.append(validar(campos))
+            except LinhaInvalida as e:
+                self.rejeitadas.append((numero, str(e)))
+                continue
+            if len(lote) >= self.tamanho_lote:
+                importadas += self._transacao(gravar, lote)
+                lote = []
+        if lote:
+            importadas += self._transacao(gravar, lote)
+        return lidas, importadas
+
+    def _transacao(self, gravar, lote: List[tuple]) -> int:
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            gravar(cursor, lote)
+            self.conn.commit()
+            return len(lote)
+        except sqlite3.Error:
+            self.conn.rollback()
+            raise
+
+    def _indices_adiaveis(self, tabela: str) -> List[Tuple[str, str]]:
+        return self.conn.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+            (tabela,)
+        ).fetchall()
+
+    # Produtos
+    def importar_produtos(self, linhas: Iterator[Tuple[int, Dict]]) -> Dict:
+        """Campos: nome, preco, quantidade e, opcionalmente, codigo e categoria"""
+        inicio = time.perf_counter()
+        existentes = {linha[0] for linha in self.conn.execute("SELECT codigo FROM Produto")}
+        proximo = [max(existentes, default=0) + 1]
+        vistos = set()
+
+        def validar(campos: Dict) -> tuple:
+            codigo = _numero(campos, "codigo", int, padrao=0) or None
+            if codigo is not None and (codigo in existentes or codigo in vistos):
+                raise LinhaInvalida(f"código {codigo} já existe")
+            nome = _texto(campos, "nome")
+            preco = _numero(campos, "preco")
+            quantidade = _numero(campos, "quantidade", int, padrao=0)
+            categoria = _texto(campos, "categoria", "") or None
+            if codigo is None:
+                # Códigos novos são reservados aqui para gravar Produto e Estoque com executemany
+                while proximo[0] in existentes or proximo[0] in vistos:
+                    proximo[0] += 1
+                codigo = proximo[0]
+            vistos.add(codigo)
+            return codigo, nome, preco, categoria, quantidade
+
+        def gravar(cursor: sqlite3.Cursor, lote: List[tuple]):
+            cursor.executemany("INSERT INTO Produto (codigo, nome, preco, categoria) VALUES (?, ?, ?, ?)",
+                               [linha[:4] for linha in lote])
+            cursor.executemany("INSERT INTO Estoque (codigo_produto, quantidade) VALUES (?, ?)",
+                               [(linha[0], linha[4]) for linha in lote])
+            self.backend._registrar_movimentos(cursor, [(linha[0], linha[4], 'importacao', None) for linha in lote])
+
+        try:
+            lidas, importadas = self._gravar_lotes(linhas, validar, gravar)
+        finally:
+            self.backend.catalogo.invalidar()
+        return self._resultado(lidas, importadas, inicio)
+
+    # Vendas históricas
+    def importar_vendas(self, linhas: Iterator[Tuple[int, Dict]]) -> Dict:
+        """Campos: codigo_produto, quantidade, preco_unitario, data (AAAA-MM-DD) e, opcionalmente,
+        hora (HH:MM:SS), produto_nome, valor_total, status e codigo_promocao"""
+        inicio = time.perf_counter()
+        produtos = dict(self.conn.execute("SELECT codigo, nome FROM Produto").fetchall())
+        promocoes = {linha[0] for linha in self.conn.execute("SELECT codigo FROM Promocao")}
+
+        def validar(campos: Dict) -> tuple:
+            codigo_produto = _numero(campos, "codigo_produto", int)
+            if codigo_produto not in produtos:
+                raise LinhaInvalida(f"produto {codigo_produto} não existe")
+            quantidade = _numero(campos, "quantidade", int)
+            if quantidade == 0:
+                raise LinhaInvalida("quantidade zero")
+            preco_unitario = _numero(campos, "preco_unitario")
+            valor_total = _numero(campos, "valor_total", padrao=quantidade * preco_unitario)
+            status = _texto(campos, "status", "finalizada")
+            if status not in ("aberta", "finalizada"):
+                raise LinhaInvalida(f"status inválido: {status!r}")
+            codigo_promocao = _numero(campos, "codigo_promocao", int, padrao=0) or None
+            if codigo_promocao is not None and codigo_promocao not in promocoes:
+                raise LinhaInvalida(f"promoção {codigo_promocao} não existe")
+            return (
+                codigo_produto, _texto(campos, "produto_nome", produtos[codigo_produto]),
+                quantidade, preco_unitario, valor_total,
+                _data_hora(campos, "data", "%Y-%m-%d"), _data_hora(campos, "hora", "%H:%M:%S", "00:00:00"),
+                status, codigo_promocao,
+            )
+
+        def gravar(cursor: sqlite3.Cursor, lote: List[tuple]):
+            cursor.executemany("""
+                INSERT INTO Venda (
+                    codigo_produto, produto_nome, quantidade, preco_unitario,
+                    valor_total, data, hora, status, codigo_promocao
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, lote)
+
+        # Sem os índices secundários cada INSERT só mexe na tabela; eles são recriados
+        # de uma vez no fim, o que é bem mais rápido que mantê-los linha a linha. Enquanto isso
+        # as consultas a Venda varrem a tabela, então só vale com o banco fora de uso; se o
+        # processo cair no meio, a próxima abertura do backend recria os que faltarem
+        indices = self._indices_adiaveis("Venda") if self.adiar_indices else []
+        for nome, _ in indices:
+            self.conn.execute(f"DROP INDEX IF EXISTS {nome}")
+        self.conn.commit()
+        try:
+            lidas, importadas = self._gravar_lotes(linhas, validar, gravar)
+        finally:
+            for _, sql in indices:
+                self.conn.execute(sql.replace("CREATE INDEX", "CREATE INDEX IF NOT EXISTS", 1))
+            self.conn.commit()
+        return self._resultado(lidas, importadas, inicio)
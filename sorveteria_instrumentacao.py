@@ -0,0 +1,352 @@
+import functools
+import inspect
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Limites superiores (ms) das faixas do histograma de latência; a última faixa é "acima de 1 s"
+FAIXAS_MS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000)
+
+# Comandos que têm plano de execução; BEGIN, COMMIT e PRAGMA não têm
+_COM_PLANO = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "REPLACE")
+
+_LISTA_MARCADORES = re.compile(r"\?(?:\s*,\s*\?)+")
+
+
+def normalizar_sql(sql: str) -> str:
+    """Uma linha só e listas IN (?, ?, ?) de qualquer tamanho juntas, para agrupar o mesmo comando"""
+    return _LISTA_MARCADORES.sub("?, ...", " ".join(sql.split()))
+
+
+class Metrica:
+    """Chamadas, erros, tempo e linhas retornadas de um método ou comando SQL"""
+
+    __slots__ = ("chamadas", "erros", "total_ms", "max_ms", "linhas", "faixas")
+
+    def __init__(self):
+        self.chamadas = 0
+        self.erros = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.linhas = 0
+        self.faixas = [0] * (len(FAIXAS_MS) + 1)
+
+    def registrar(self, ms: float, linhas: int, erro: bool):
+        self.chamadas += 1
+        self.erros += erro
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        self.linhas += linhas
+        faixa = 0
+        while faixa < len(FAIXAS_MS) and ms > FAIXAS_MS[faixa]:
+            faixa += 1
+        self.faixas[faixa] += 1
+
+    def percentil(self, p: float) -> float:
+        """Limite superior da faixa onde cai o percentil p (0 a 100), sem passar do máximo medido"""
+        alvo = self.chamadas * p / 100
+        acumulado = 0
+        for faixa, quantidade in enumerate(self.faixas):
+            acumulado += quantidade
+            if quantidade and acumulado >= alvo:
+                return round(min(FAIXAS_MS[faixa], self.max_ms) if faixa < len(FAIXAS_MS) else self.max_ms, 3)
+        return 0.0
+
+    def como_dict(self) -> Dict:
+        return {
+            "chamadas": self.chamadas,
+            "erros": self.erros,
+            "total_ms": round(self.total_ms, 3),
+            "media_ms": round(self.total_ms / self.chamadas, 3) if self.chamadas else 0.0,
+            "p95_ms": self.percentil(95),
+            "max_ms": round(self.max_ms, 3),
+            "linhas": self.linhas,
+            "histograma": {f"<={limite}": quantidade for limite, quantidade in zip(FAIXAS_MS, self.faixas)}
+                          | {f">{FAIXAS_MS[-1]}": self.faixas[-1]},
+        }
+
+
+class Instrumentacao:
+    """Coleta métricas de métodos e de comandos SQL e guarda os comandos lentos com o plano.
+
+    É ligada a um backend com SorveteriaBackend.instrumentar e desligada com desinstrumentar;
+    desligada, não fica nada no caminho das chamadas. Pode ser lida de qualquer thread.
+    Comandos acima de `limite_lento_ms` entram em `lentas` (os `max_lentas` mais recentes)
+    com o EXPLAIN QUERY PLAN e, se `arquivo_lentas` for dado, também são acrescentados nele
+    em JSON Lines.
+    """
+
+    def __init__(self, limite_lento_ms: float = 100.0, max_lentas: int = 200,
+                 arquivo_lentas: Optional[str] = None):
+        self.limite_lento_ms = limite_lento_ms
+        self.arquivo_lentas = arquivo_lentas
+        self._trava = threading.Lock()
+        self.metodos: Dict[str, Metrica] = {}
+        self.sql: Dict[str, Metrica] = {}
+        self.lentas: deque = deque(maxlen=max_lentas)
+        self.erros: deque = deque(maxlen=max_lentas)
+        self.desde = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    def zerar(self):
+        with self._trava:
+            self.metodos.clear()
+            self.sql.clear()
+            self.lentas.clear()
+            self.erros.clear()
+            self.desde = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    def registrar_metodo(self, nome: str, ms: float, linhas: int = 0, erro: Optional[BaseException] = None):
+        with self._trava:
+            metrica = self.metodos.get(nome) or self.metodos.setdefault(nome, Metrica())
+            metrica.registrar(ms, linhas, erro is not None)
+            if erro is not None:
+                self.erros.append({"momento": datetime.now().strftime("%H:%M:%S"), "metodo": nome, "erro": str(erro)})
+
+    def registrar_sql(self, conn: sqlite3.Connection, sql: str, parametros, ms: float, linhas: int = 0,
+                      erro: Optional[BaseException] = None, em_lote: bool = False):
+        chave = normalizar_sql(sql)
+        with self._trava:
+            metrica = self.sql.get(chave) or self.sql.setdefault(chave, Metrica())
+            metrica.registrar(ms, linhas, erro is not None)
+            if erro is not None:
+                self.erros.append({"momento": datetime.now().strftime("%H:%M:%S"), "sql": chave, "erro": str(erro)})
+        if ms >= self.limite_lento_ms and erro is None:
+            self._registrar_lenta(conn, chave, sql, parametros, ms, linhas, em_lote)
+
+    def _registrar_lenta(self, conn: sqlite3.Connection, chave: str, sql: str, parametros, ms: float,
+                         linhas: int, em_lote: bool):
+        plano = []
+        if not em_lote and chave.lstrip("( ").upper().startswith(_COM_PLANO):
+            try:
+                # Cursor comum: o EXPLAIN não deve entrar nas próprias métricas
+                cursor = sqlite3.Cursor(conn)
+                cursor.execute("EXPLAIN QUERY PLAN " + sql, parametros)
+                plano = [linha[3] for linha in cursor.fetchall()]
+                cursor.close()
+            except sqlite3.Error as e:
+                plano = [f"(sem plano: {e})"]
+        registro = {
+            "momento": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "ms": round(ms, 3),
+            "linhas": linhas,
+            "sql": chave,
+            "parametros": None if em_lote else [str(p) for p in parametros][:20],
+            "plano": plano,
+        }
+        with self._trava:
+            self.lentas.append(registro)
+        if self.arquivo_lentas:
+            with open(self.arquivo_lentas, "a", encoding="utf-8") as arquivo:
+                arquivo.write(json.dumps(registro, ensure_ascii=False) + "\n")
+
+    def fotografia(self) -> Dict:
+        """Cópia das métricas no momento, ordenadas do maior tempo total para o menor"""
+        with self._trava:
+            def ordenar(metricas: Dict[str, Metrica]) -> Dict[str, Dict]:
+                return {nome: metrica.como_dict()
+                        for nome, metrica in sorted(metricas.items(), key=lambda item: -item[1].total_ms)}
+            return {
+                "desde": self.desde,
+                "momento": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "limite_lento_ms": self.limite_lento_ms,
+                "metodos": ordenar(self.metodos),
+                "sql": ordenar(self.sql),
+                "lentas": list(self.lentas),
+                "erros": list(self.erros),
+            }
+
+    def salvar(self, caminho: str) -> str:
+        """Grava a fotografia em JSON; o arquivo só aparece completo"""
+        temporario = caminho + ".parcial"
+        with open(temporario, "w", encoding="utf-8") as arquivo:
+            json.dump(self.fotografia(), arquivo, ensure_ascii=False, indent=2)
+        os.replace(temporario, caminho)
+        return caminho
+
+
+class CapturaComandos(Instrumentacao):
+    """Instrumentação que não mede: guarda cada comando com plano de execução que rodou, com a
+    conexão e os parâmetros, na ordem. SorveteriaBackend.explicar_consultas a liga enquanto roda
+    os caminhos de consulta de verdade, para explicar os comandos que eles executam."""
+
+    def __init__(self):
+        super().__init__()
+        self.comandos: List[Tuple[sqlite3.Connection, str, object]] = []
+
+    def registrar_sql(self, conn: sqlite3.Connection, sql: str, parametros, ms: float, linhas: int = 0,
+                      erro: Optional[BaseException] = None, em_lote: bool = False):
+        if not em_lote and normalizar_sql(sql).lstrip("( ").upper().startswith(_COM_PLANO):
+            self.comandos.append((conn, sql, parametros))
+
+
+class CursorInstrumentado(sqlite3.Cursor):
+    """Cursor que mede cada comando, da execução até a última linha lida"""
+
+    _comando = None  # [sql, parâmetros, ms acumulados, linhas lidas, em lote]
+
+    def _concluir(self):
+        comando, self._comando = self._comando, None
+        instrumentacao = self.connection.instrumentacao
+        if comando is not None and instrumentacao is not None:
+            instrumentacao.registrar_sql(self.connection, comando[0], comando[1], comando[2], comando[3],
+                                         em_lote=comando[4])
+
+    def _executar(self, metodo, sql: str, parametros, em_lote: bool):
+        self._concluir()
+        inicio = time.perf_counter()
+        try:
+            metodo(sql, parametros)
+        except sqlite3.Error as e:
+            instrumentacao = self.connection.instrumentacao
+            if instrumentacao is not None:
+                instrumentacao.registrar_sql(self.connection, sql, parametros, (time.perf_counter() - inicio) * 1000,
+                                             erro=e, em_lote=em_lote)
+            raise
+        self._comando = [sql, parametros, (time.perf_counter() - inicio) * 1000, 0, em_lote]
+        if self.description is None:
+            self._concluir()  # INSERT, UPDATE, BEGIN...: não há linhas para ler
+        return self
+
+    def execute(self, sql: str, parametros=()):
+        return self._executar(super().execute, sql, parametros, False)
+
+    def executemany(self, sql: str, parametros):
+        return self._executar(super().executemany, sql, parametros, True)
+
+    def _ler(self, leitura, *args):
+        inicio = time.perf_counter()
+        resultado = leitura(*args)
+        if self._comando is not None:
+            self._comando[2] += (time.perf_counter() - inicio) * 1000
+        return resultado
+
+    def fetchone(self):
+        linha = self._ler(super().fetchone)
+        if linha is None:
+            self._concluir()
+        elif self._comando is not None:
+            self._comando[3] += 1
+        return linha
+
+    def fetchmany(self, size: Optional[int] = None):
+        linhas = self._ler(super().fetchmany, self.arraysize if size is None else size)
+        if not linhas:
+            self._concluir()
+        elif self._comando is not None:
+            self._comando[3] += len(linhas)
+        return linhas
+
+    def fetchall(self):
+        linhas = self._ler(super().fetchall)
+        if self._comando is not None:
+            self._comando[3] += len(linhas)
+        self._concluir()
+        return linhas
+
+    def __next__(self):
+        linha = self.fetchone()
+        if linha is None:
+            raise StopIteration
+        return linha
+
+    def close(self):
+        self._concluir()
+        super().close()
+
+    def __del__(self):
+        # Cursor abandonado depois de um fetchone: o comando termina aqui
+        if self._comando is not None:
+            self._concluir()
+
+
+class Conexao(sqlite3.Connection):
+    """Conexão do backend; sem métodos próprios, para não custar nada com a instrumentação desligada"""
+
+    instrumentacao: Optional[Instrumentacao] = None
+
+
+class ConexaoInstrumentada(Conexao):
+    """Classe que a conexão assume enquanto instrumentada: todos os comandos passam por CursorInstrumentado"""
+
+    def cursor(self, factory=CursorInstrumentado):
+        return super().cursor(factory)
+
+    # Connection.execute do sqlite3 cria o cursor e roda o comando direto em C
+    def execute(self, sql: str, parametros=()):
+        return self.cursor().execute(sql, parametros)
+
+    def executemany(self, sql: str, parametros):
+        return self.cursor().executemany(sql, parametros)
+
+
+def instrumentar_conexao(conn: Conexao, instrumentacao: Optional[Instrumentacao]):
+    """Liga (ou, com None, desliga) a instrumentação de uma conexão aberta com factory=Conexao"""
+    conn.instrumentacao = instrumentacao
+    conn.__class__ = Conexao if instrumentacao is None else ConexaoInstrumentada
+
+
+def _quantidade_linhas(resultado) -> int:
+    if isinstance(resultado, (list, dict)):
+        return len(resultado)
+    if isinstance(resultado, tuple) and resultado and isinstance(resultado[0], list):
+        return len(resultado[0])  # (lista de códigos, erro) de criar_venda_lote
+    return 0
+
+
+def _envolver_gerador(instrumentacao: Instrumentacao, nome: str, metodo: Callable) -> Callable:
+    """Como envolver_metodo, para os métodos geradores (iter_*): chamá-los só cria o gerador, então
+    a medição cobre a iteração, somando o tempo gasto dentro do gerador (não o do consumidor entre
+    um item e outro), e as linhas são os itens entregues. Registra ao esgotar, ao falhar ou quando
+    o consumidor para no meio"""
+    @functools.wraps(metodo)
+    def medido(*args, **kwargs):
+        gerador = metodo(*args, **kwargs)
+        ms, itens, erro = 0.0, 0, None
+        try:
+            while True:
+                inicio = time.perf_counter()
+                try:
+                    item = next(gerador)
+                except StopIteration:
+                    return
+                except BaseException as e:
+                    erro = e
+                    raise
+                finally:
+                    ms += (time.perf_counter() - inicio) * 1000
+                itens += 1
+                yield item
+        finally:
+            gerador.close()  # Consumidor que parou no meio: o cursor do método é liberado já
+            instrumentacao.registrar_metodo(nome, ms, itens, erro=erro)
+    return medido
+
+
+def envolver_metodo(instrumentacao: Instrumentacao, nome: str, metodo: Callable) -> Callable:
+    """Versão de `metodo` que registra tempo, linhas retornadas e exceções em `instrumentacao`"""
+    if inspect.isgeneratorfunction(metodo):
+        return _envolver_gerador(instrumentacao, nome, metodo)
+
+    @functools.wraps(metodo)
+    def medido(*args, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            resultado = metodo(*args, **kwargs)
+        except BaseException as e:
+            instrumentacao.registrar_metodo(nome, (time.perf_counter() - inicio) * 1000, erro=e)
+            raise
+        instrumentacao.registrar_metodo(nome, (time.perf_counter() - inicio) * 1000, _quantidade_linhas(resultado))
+        return resultado
+    return medido
+
+
+def metodos_publicos(classe: type, excluir: set = frozenset()) -> List[str]:
+    return [nome for nome in dir(classe)
+            if not nome.startswith("_") and nome not in excluir and callable(getattr(classe, nome))
+            and not isinstance(getattr(classe, nome), type)]
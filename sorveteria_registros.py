@@ -0,0 +1,63 @@
+from typing import List, NamedTuple, Optional, Tuple, Type
+
+
+# Linhas tipadas das tabelas: tuplas com nome por campo (sem um dicionário por linha, como
+# dict(row)), montadas direto da tupla devolvida pelo sqlite3. Os campos seguem a ordem das
+# colunas de cada tabela; _asdict() dá o dicionário dos métodos antigos.
+
+class Produto(NamedTuple):
+    codigo: int
+    nome: str
+    preco: float
+    categoria: Optional[str]
+    quantidade: int  # Em estoque
+    estoque_minimo: int  # Abaixo disso o produto entra no alerta de estoque baixo
+
+
+class Venda(NamedTuple):
+    codigo: int
+    codigo_produto: int
+    produto_nome: str
+    quantidade: int
+    preco_unitario: float
+    valor_total: float  # Já com o desconto da promoção
+    data: str
+    hora: str
+    status: str
+    codigo_promocao: Optional[int]
+
+
+class Promocao(NamedTuple):
+    codigo: int
+    descricao: str
+    desconto_percentual: float
+    data_inicio: str
+    data_fim: str
+    codigo_produto: Optional[int]
+    categoria: Optional[str]
+
+
+class Despesa(NamedTuple):
+    codigo: int
+    descricao: str
+    valor: float
+    data: str
+
+
+def colunas(registro: Type[tuple]) -> str:
+    """Lista de colunas para o SELECT, na ordem dos campos do registro"""
+    return ", ".join(registro._fields)
+
+
+def marcadores(codigos: List[int]) -> Tuple[str, list]:
+    """Marcadores de um IN (...) e os parâmetros, com a lista completada até a próxima potência de 2
+    repetindo o último código. Assim listas de 5 ou de 7 códigos viram o mesmo comando, que o cache
+    de comandos preparados do sqlite3 reaproveita, em vez de um comando novo por tamanho."""
+    parametros = [int(codigo) for codigo in codigos]
+    if not parametros:
+        return "", []  # IN () não encontra nada, como antes
+    tamanho = 1
+    while tamanho < len(parametros):
+        tamanho *= 2
+    parametros += parametros[-1:] * (tamanho - len(parametros))
+    return ", ".join("?" * tamanho), parametros
@@ -0,0 +1,419 @@
+import argparse
+import asyncio
+import json
+import re
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http import HTTPStatus
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from sorveteria_backend import SorveteriaBackend
+from sorveteria_backup import BackupPeriodico
+
+
+class ErroRequisicao(Exception):
+    """Requisição inválida; vira uma resposta HTTP com o status informado"""
+
+    def __init__(self, status: int, mensagem: str):
+        super().__init__(mensagem)
+        self.status = status
+        self.mensagem = mensagem
+
+
+class ServidorSorveteria:
+    """API HTTP/JSON local sobre o SorveteriaBackend, para vários terminais ao mesmo tempo.
+
+    As gravações entram numa fila atendida por uma única tarefa escritora, que as executa uma a
+    uma numa thread com a sua própria conexão: o SQLite só aceita um escritor por vez e assim
+    ninguém espera por "database is locked". As leituras rodam em paralelo num pool de threads,
+    cada uma com o seu backend (em WAL, leitores não bloqueiam o escritor).
+
+    Rotas:
+        GET    /produtos                 ?after_nome, after_codigo, limit, estoque_abaixo_de, estoque_baixo
+        GET    /produtos/{id}
+        POST   /produtos                 {nome, preco, quantidade, categoria?, estoque_minimo?}
+        PUT    /produtos/{id}            {nome, preco, quantidade, categoria?, estoque_minimo?}
+        DELETE /produtos/{id}
+        POST   /produtos/{id}/estoque    {quantidade, operacao? ("adicionar" ou "remover"), motivo?}
+        GET    /estoque/previsao         ?janela_dias
+        GET    /estoque/alertas          ?dias_reposicao
+        GET    /vendas                   ?status, after_data, after_hora, after_codigo, limit
+        POST   /vendas                   {produto_id, quantidade} ou {itens: [...]}, codigo_promocao?
+        POST   /vendas/{id}/finalizar
+        GET    /promocoes                ?after_data_inicio, after_codigo, limit
+        POST   /promocoes                {descricao, desconto_percentual, data_inicio, data_fim,
+                                          codigo_produto?, categoria?}
+        GET    /despesas                 ?after_data, after_codigo, limit
+        POST   /despesas                 {descricao, valor}
+        GET    /resumo                   ?data_inicio, data_fim (padrão: início da semana ou do mês até hoje)
+    """
+
+    def __init__(self, db_name: str = 'sorveteria.db', host: str = '127.0.0.1', porta: int = 8080,
+                 leitores: int = 4):
+        if db_name == ':memory:':
+            raise ValueError("O servidor precisa de um arquivo: cada conexão :memory: é um banco diferente")
+        self.db_name = db_name
+        self.host = host
+        self.porta = porta
+
+        self._local = threading.local()
+        self._escrita = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sorveteria-escrita")
+        self._leitura = ThreadPoolExecutor(max_workers=leitores, thread_name_prefix="sorveteria-leitura")
+        self._fila: Optional[asyncio.Queue] = None
+        self._escritor: Optional[asyncio.Task] = None
+        self._servidor: Optional[asyncio.AbstractServer] = None
+
+        self.rotas: List[Tuple[str, re.Pattern, Callable]] = [
+            ("GET", re.compile(r"/produtos"), self.listar_produtos),
+            ("GET", re.compile(r"/produtos/(\d+)"), self.obter_produto),
+            ("POST", re.compile(r"/produtos"), self.criar_produto),
+            ("PUT", re.compile(r"/produtos/(\d+)"), self.atualizar_produto),
+            ("DELETE", re.compile(r"/produtos/(\d+)"), self.excluir_produto),
+            ("POST", re.compile(r"/produtos/(\d+)/estoque"), self.atualizar_estoque),
+            ("GET", re.compile(r"/estoque/previsao"), self.prever_ruptura),
+            ("GET", re.compile(r"/estoque/alertas"), self.alertas_estoque),
+            ("GET", re.compile(r"/vendas"), self.listar_vendas),
+            ("POST", re.compile(r"/vendas"), self.criar_venda),
+            ("POST", re.compile(r"/vendas/(\d+)/finalizar"), self.finalizar_venda),
+            ("GET", re.compile(r"/promocoes"), self.listar_promocoes),
+            ("POST", re.compile(r"/promocoes"), self.criar_promocao),
+            ("GET", re.compile(r"/despesas"), self.listar_despesas),
+            ("POST", re.compile(r"/despesas"), self.criar_despesa),
+            ("GET", re.compile(r"/resumo"), self.resumo),
+        ]
+
+    # Acesso ao banco
+    def _backend(self, leitor: bool) -> SorveteriaBackend:
+        backend = getattr(self._local, 'backend', None)
+        if backend is None:
+            backend = self._local.backend = SorveteriaBackend(self.db_name)
+            if leitor:
+                # Quem grava é outra conexão: confere o data_version a cada leitura do catálogo
+                backend.catalogo.intervalo_verificacao = 0
+        return backend
+
+    def _rodar(self, leitor: bool, funcao: Callable[..., Any], args: tuple) -> Any:
+        return funcao(self._backend(leitor), *args)
+
+    async def ler(self, funcao: Callable[..., Any], *args) -> Any:
+        """Executa funcao(backend, *args) no pool de leitura"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._leitura, self._rodar, True, funcao, args)
+
+    async def gravar(self, funcao: Callable[..., Any], *args) -> Any:
+        """Enfileira funcao(backend, *args) para a tarefa escritora e espera o resultado"""
+        futuro = asyncio.get_running_loop().create_future()
+        await self._fila.put((funcao, args, futuro))
+        return await futuro
+
+    async def _escrever(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            funcao, args, futuro = await self._fila.get()
+            try:
+                resultado = await loop.run_in_executor(self._escrita, self._rodar, False, funcao, args)
+            except Exception as e:
+                if not futuro.done():
+                    futuro.set_exception(e)
+            else:
+                if not futuro.done():
+                    futuro.set_result(resultado)
+
+    # Ciclo de vida
+    async def iniciar(self):
+        self._fila = asyncio.Queue()
+        self._escritor = asyncio.create_task(self._escrever())
+        self._servidor = await asyncio.start_server(self._atender, self.host, self.porta)
+        self.porta = self._servidor.sockets[0].getsockname()[1]  # Porta 0 escolhe uma livre
+
+    async def encerrar(self):
+        self._servidor.close()
+        await self._servidor.wait_closed()
+        self._escritor.cancel()
+        self._escrita.shutdown(wait=True)
+        self._leitura.shutdown(wait=True)
+
+    async def servir(self):
+        await self.iniciar()
+        print(f"Servidor da Sorveteria em http://{self.host}:{self.porta} (banco: {self.db_name})")
+        async with self._servidor:
+            await self._servidor.serve_forever()
+
+    # HTTP
+    async def _atender(self, leitor: asyncio.StreamReader, escritor: asyncio.StreamWriter):
+        try:
+            while True:
+                linha = await leitor.readline()
+                if not linha:
+                    break
+                try:
+                    metodo, alvo, versao = linha.decode('latin-1').split()
+                except ValueError:
+                    break
+
+                cabecalhos = {}
+                while True:
+                    linha = await leitor.readline()
+                    if linha in (b"\r\n", b"\n", b""):
+                        break
+                    nome, _, valor = linha.decode('latin-1').partition(":")
+                    cabecalhos[nome.strip().lower()] = valor.strip()
+                try:
+                    tamanho = int(cabecalhos.get("content-length", 0) or 0)
+                    if tamanho < 0:
+                        raise ValueError(tamanho)
+                except ValueError:
+                    # Sem saber onde o corpo termina, a conexão não pode seguir para a próxima requisição
+                    await self._responder(escritor, 400, {"erro": "Content-Length inválido"}, False)
+                    break
+                corpo = await leitor.readexactly(tamanho) if tamanho else b""
+
+                status, resposta = await self._despachar(metodo, alvo, corpo)
+                manter = cabecalhos.get("connection", "").lower() != "close" and versao == "HTTP/1.1"
+                await self._responder(escritor, status, resposta, manter)
+                if not manter:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            escritor.close()
+
+    @staticmethod
+    async def _responder(escritor: asyncio.StreamWriter, status: int, resposta: Any, manter: bool):
+        dados = json.dumps(resposta, ensure_ascii=False).encode('utf-8')
+        escritor.write(
+            f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(dados)}\r\n"
+            f"Connection: {'keep-alive' if manter else 'close'}\r\n\r\n".encode('latin-1') + dados
+        )
+        await escritor.drain()
+
+    async def _despachar(self, metodo: str, alvo: str, corpo: bytes) -> Tuple[int, Any]:
+        partes = urlsplit(alvo)
+        caminho = partes.path.rstrip("/") or "/"
+        consulta = {nome: valores[-1] for nome, valores in parse_qs(partes.query).items()}
+
+        metodo_errado = False
+        for metodo_rota, padrao, tratador in self.rotas:
+            encontrado = padrao.fullmatch(caminho)
+            if not encontrado:
+                continue
+            if metodo_rota != metodo:
+                metodo_errado = True
+                continue
+            try:
+                dados = json.loads(corpo) if corpo else {}
+                return await tratador(*(int(grupo) for grupo in encontrado.groups()), consulta=consulta, dados=dados)
+            except ErroRequisicao as e:
+                return e.status, {"erro": e.mensagem}
+            except (json.JSONDecodeError, ValueError, TypeError, KeyError) as e:
+                return 400, {"erro": f"Requisição inválida: {e}"}
+            except Exception as e:
+                print(f"Erro ao atender {metodo} {caminho}: {e}")
+                return 500, {"erro": str(e)}
+
+        if metodo_errado:
+            return 405, {"erro": "Método não permitido"}
+        return 404, {"erro": "Rota não encontrada"}
+
+    # Produtos
+    async def listar_produtos(self, consulta: Dict[str, str], dados: Dict) -> Tuple[int, Any]:
+        estoque_abaixo_de = consulta.get("estoque_abaixo_de")
+        pagina = await self.ler(SorveteriaBackend.listar_produtos_pagina,
+                                consulta.get("after_nome"), _inteiro(consulta.get("after_codigo")),
+                                int(consulta.get("limit", 50)),
+                                int(estoque_abaixo_de) if estoque_abaixo_de is not None else None,
+                                consulta.get("estoque_baixo") in ("1", "true"))
+        return 200, pagina
+
+    async def obter_produto(self, codigo: int, consulta: Dict[str, str], dados: Dict) -> Tuple[int, Any]:
+        produto = await self.ler(SorveteriaBackend.obter_produto_por_id, codigo)
+        if not produto:
+            raise ErroRequisicao(404, "Produto não encontrado")
+        return 200, produto
+
+    async def criar_produto(self, consulta: Dict[str, str], dados: Dict) -> Tuple[int, Any]:
+        codigo = await self.gravar(SorveteriaBackend.criar_produto,
+                                   str(dados["nome"]), float(dados["preco"]), _nao_negativo(dados["quantidade"]),
+                                   dados.get("categoria"), _inteiro(dados.get("estoque_minimo")))
+        if not codigo:
+            raise ErroRequisicao(409, "Falha ao cadastrar produto")
+        return 201, {"codigo": codigo}
+
+    async def atualizar_produto(self, codigo: int, consulta: Dict[str, str], dados: Dict) -> Tuple[int, Any]:
+        if not await self.gravar(SorveteriaBackend.atualizar_produto, codigo,
+                                 str(dados["nome"]), float(dados["preco"]), _nao_negativo(dados["quantidade"]),
+                                 dados.get("categoria"), _inteiro(dados.get("estoque_minimo"))):
+            raise ErroRequisicao(404, "Produto não encontrado")
+        return 200, {"codigo": codigo}
+
+    async def excluir_produto(self, codigo: int, consulta: Dict[str, str], dados: Dict) -> Tuple[int, Any]:
+        erro = await self.gravar(_excluir_produto, codigo)
+        if erro:
+            raise ErroRequisicao(*erro)
+        return 200, {"codigo": codigo}
+
+    async def atualizar_estoque(self, codigo: int, consulta: Dict[str, str], dados: Dict) -> Tuple[int, Any]:
+        # Como os botões Adicionar/Remover do app: a quantidade é sempre positiva e a operação dá o sinal
+        operacao = dados.get("operacao") or "adicionar"
+        if operacao not in ("adicionar", "remover"):
+            raise ErroRequisicao(400, "operacao deve ser 'adicionar' ou 'remover'")
+        quantidade = _positivo(dados["quantidade"])
+        if not await self.gravar(SorveteriaBackend.atualizar_estoque, codigo,
+                                 -quantidade if operacao == "remover" else quantidade,
+                                 str(dados.get("motivo") or "ajuste")):
+            raise ErroRequisicao(409, "Falha ao atualizar estoque")
+        return 200, {"codigo": codigo}
+
+    async def prever_ruptura(self, consulta: Dict[str, str], dados: Dict) -> Tuple[int, Any]:
+        return 200, await self.ler(SorveteriaBackend.prever_ruptura, _inteiro(consulta.get("janela_dias")))
+
+    async def alertas_estoque(self, consulta: Dict[str, str], dados: Dict) -> Tuple[int, Any]:
+        return 200, await self.ler(SorveteriaBackend.alertas_estoque, _inteiro(consulta.get("dias_reposicao")))
+
+    # Vendas
+    async def listar_vendas(self, consulta: Dict[str, str], dados: Dict) -> Tuple[int, Any]:
+        pagina = await self.ler(SorveteriaBackend.listar_vendas_pagina,
+                                consulta.get("status"), consulta.get("after_data"), consulta.get("after_hora"),
+                                _inteiro(consulta.get("after_codigo")), int(consulta.get("limit", 50)))
+        return 200, pagina
+
+    async def criar_venda(self, consulta: Dict[str, str], dados: Dict) -> Tuple[int, Any]:
+        codigo_promocao = _inteiro(dados.get("codigo_promocao"))
+        if "itens" in dados:
+            itens = [{"produto_id": int(item["produto_id"]), "quantidade": _positivo(item["quantidade"])}
+                     for item in dados["itens"]]
+            vendas_ids, erro = await self.gravar(SorveteriaBackend.criar_venda_lote, itens, codigo_promocao)
+            if erro:
+                raise ErroRequisicao(409, erro)
+            return 201, {"vendas": vendas_ids}
+
+        venda_id, erro = await self.gravar(_vender, int(dados["produto_id"]), _positivo(dados["quantidade"]),
+                                           codigo_promocao)
+        if erro:
+            raise ErroRequisicao(409, erro)
+        return 201, {"codigo": venda_id}
+
+    async def finalizar_venda(self, codigo: int, consulta: Dict[str, str], dados: Dict) -> Tuple[int, Any]:
+        if not await self.gravar(SorveteriaBackend.finalizar_venda, codigo):
+            raise ErroRequisicao(404, "Venda não encontrada")
+        return 200, {"codigo": codigo}
+
+    # Promoções
+    async def listar_promocoes(self, consulta: Dict[str, str], dados: Dict) -> Tuple[int, Any]:
+        pagina = await self.ler(SorveteriaBackend.listar_promocoes_pagina,
+                                consulta.get("after_data_inicio"), _inteiro(consulta.get("after_codigo")),
+                                int(consulta.get("limit", 50)))
+        return 200, pagina
+
+    async def criar_promocao(self, consulta: Dict[str, str], dados: Dict) -> Tuple[int, Any]:
+        codigo = await self.gravar(SorveteriaBackend.criar_promocao, str(dados["descricao"]),
+                                   float(dados["desconto_percentual"]),
+                                   str(dados["data_inicio"]), str(dados["data_fim"]),
+                                   _inteiro(dados.get("codigo_produto")), dados.get("categoria"))
+        if not codigo:
+            raise ErroRequisicao(409, "Falha ao cadastrar promoção")
+        return 201, {"codigo": codigo}
+
+    # Despesas
+    async def listar_despesas(self, consulta: Dict[str, str], dados: Dict) -> Tuple[int, Any]:
+        pagina = await self.ler(SorveteriaBackend.listar_despesas_pagina,
+                                consulta.get("after_data"), _inteiro(consulta.get("after_codigo")),
+                                int(consulta.get("limit", 50)))
+        return 200, pagina
+
+    async def criar_despesa(self, consulta: Dict[str, str], dados: Dict) -> Tuple[int, Any]:
+        if not await self.gravar(SorveteriaBackend.criar_despesa, str(dados["descricao"]), float(dados["valor"])):
+            raise ErroRequisicao(409, "Falha ao cadastrar despesa")
+        return 201, {}
+
+    # Resumo
+    async def resumo(self, consulta: Dict[str, str], dados: Dict) -> Tuple[int, Any]:
+        data_inicio = _data(consulta.get("data_inicio"), "data_inicio")
+        data_fim = _data(consulta.get("data_fim"), "data_fim")
+        if data_inicio and data_fim and data_inicio > data_fim:
+            raise ErroRequisicao(400, "data_inicio não pode ser depois de data_fim")
+        return 200, await self.ler(SorveteriaBackend.calcular_resumo, data_inicio, data_fim)
+
+
+def _inteiro(valor) -> Optional[int]:
+    return int(valor) if valor not in (None, "") else None
+
+
+def _positivo(valor, campo: str = "quantidade") -> int:
+    """Inteiro maior que zero; senão a requisição volta com 400"""
+    numero = int(valor)
+    if numero <= 0:
+        raise ErroRequisicao(400, f"{campo} deve ser maior que zero")
+    return numero
+
+
+def _nao_negativo(valor, campo: str = "quantidade") -> int:
+    numero = int(valor)
+    if numero < 0:
+        raise ErroRequisicao(400, f"{campo} não pode ser negativa")
+    return numero
+
+
+def _excluir_produto(backend: SorveteriaBackend, codigo: int) -> Optional[Tuple[int, str]]:
+    """Exclui o produto; se não der, o status e a mensagem da resposta (roda na thread escritora)"""
+    if backend.excluir_produto(codigo):
+        return None
+    if backend.produto_tem_vendas(codigo):
+        return 409, "Produto com vendas registradas não pode ser excluído"
+    return 404, "Produto não encontrado"
+
+
+def _data(valor: Optional[str], campo: str) -> Optional[str]:
+    """Data AAAA-MM-DD válida (ou nada); senão a requisição volta com 400"""
+    if valor in (None, ""):
+        return None
+    try:
+        if not re.fullmatch(r"\d{4}-\d{2}-\d{2}", valor):
+            raise ValueError(valor)
+        datetime.strptime(valor, "%Y-%m-%d")
+    except ValueError:
+        raise ErroRequisicao(400, f"{campo} deve ser uma data AAAA-MM-DD")
+    return valor
+
+
+def _vender(backend: SorveteriaBackend, produto_id: int, quantidade: int,
+            codigo_promocao: Optional[int] = None) -> tuple:
+    """Registra uma venda com o nome e o preço atuais do produto (roda na thread escritora)"""
+    produto = backend.obter_produto_por_id(produto_id)
+    if not produto:
+        return None, "Produto não encontrado"
+    return backend.criar_venda(produto['codigo'], produto['nome'], quantidade, produto['preco'], codigo_promocao)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="API HTTP/JSON da Sorveteria para vários terminais")
+    parser.add_argument("--db", default="sorveteria.db", help="arquivo do banco de dados")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=8080)
+    parser.add_argument("--leitores", type=int, default=4, help="threads atendendo leituras em paralelo")
+    parser.add_argument("--backup", help="pasta das fotografias periódicas do banco (padrão: sem backup)")
+    parser.add_argument("--backup-intervalo", type=float, default=3600.0, help="segundos entre fotografias")
+    args = parser.parse_args(argv)
+
+    servidor = ServidorSorveteria(args.db, args.host, args.porta, args.leitores)
+    backups = None
+    if args.backup:
+        backups = BackupPeriodico(args.db, args.backup, args.backup_intervalo)
+        backups.iniciar()
+    try:
+        asyncio.run(servidor.servir())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if backups is not None:
+            backups.encerrar()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,244 @@
+import customtkinter as ctk
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from sorveteria_async import entregar_no_tk
+
+
+class ListaVirtual(ctk.CTkFrame):
+    """Lista rolável que reaproveita um número fixo de linhas em vez de criar um widget por item.
+
+    Os itens são buscados aos poucos por `carregar_pagina(ultimo_item, limite)`, que recebe o
+    último item já carregado (ou None na primeira página) e devolve a próxima página, ou um
+    Future que a entregará (enquanto isso a lista mostra "Carregando...").
+    Mudanças pontuais são aplicadas com `sincronizar`, usando `pertence` para saber se o item
+    faz parte da lista e `chave_ordem` para encontrar sua posição.
+    """
+
+    def __init__(self, master, carregar_pagina: Callable[[Optional[Dict], int], Union[List[Dict], Future]],
+                 formatar: Callable[[Dict], str], linhas: int = 8, tamanho_pagina: int = 50,
+                 texto_botao: Optional[str] = None, comando_botao: Optional[Callable[[Dict], None]] = None,
+                 cor_texto: Optional[str] = None, texto_vazio: str = "",
+                 pertence: Optional[Callable[[Dict], bool]] = None,
+                 chave_ordem: Optional[Callable[[Dict], Any]] = None, ordem_decrescente: bool = False,
+                 **kwargs):
+        super().__init__(master, **kwargs)
+        self.carregar_pagina = carregar_pagina
+        self.formatar = formatar
+        self.pertence = pertence
+        self.chave_ordem = chave_ordem
+        self.ordem_decrescente = ordem_decrescente
+        self.tamanho_pagina = tamanho_pagina
+        self.comando_botao = comando_botao
+        self.texto_vazio = texto_vazio
+
+        self.itens: List[Dict] = []
+        self.fim_dos_dados = False
+        self.inicio = 0
+        self._inicio_desejado = 0
+        self._desejado = 0
+        self._pedido: Optional[Future] = None
+        self._geracao = 0  # Muda a cada recarga, para descartar páginas pedidas antes dela
+
+        self.area = ctk.CTkFrame(self, fg_color="transparent")
+        self.area.pack(side="left", fill="both", expand=True)
+        self.area.grid_columnconfigure(0, weight=1)
+
+        self.scrollbar = ctk.CTkScrollbar(self, command=self._rolar)
+        self.scrollbar.pack(side="right", fill="y")
+
+        # Conjunto fixo de linhas; só o texto muda durante a rolagem
+        self.linhas = []
+        for i in range(linhas):
+            frame = ctk.CTkFrame(self.area)
+            frame.grid(row=i, column=0, sticky="ew", pady=2, padx=2)
+
+            lbl = ctk.CTkLabel(frame, text="", anchor="w")
+            if cor_texto:
+                lbl.configure(text_color=cor_texto)
+            lbl.pack(side="left", padx=5, fill="x", expand=True)
+
+            btn = None
+            if texto_botao:
+                btn = ctk.CTkButton(frame, text=texto_botao, width=90,
+                                    command=lambda posicao=i: self._clicar(posicao))
+                btn.pack(side="right", padx=5)
+
+            for widget in (frame, lbl):
+                self._ligar_roda(widget)
+            self.linhas.append((frame, lbl, btn))
+
+        self._ligar_roda(self.area)
+
+    def _ligar_roda(self, widget):
+        widget.bind("<MouseWheel>", self._roda_mouse, add="+")
+        widget.bind("<Button-4>", self._roda_mouse, add="+")
+        widget.bind("<Button-5>", self._roda_mouse, add="+")
+
+    def recarregar(self):
+        """Descarta os itens carregados e volta para o topo da lista"""
+        self.itens = []
+        self.fim_dos_dados = False
+        self.inicio = 0
+        self._inicio_desejado = 0
+        self._pedido = None
+        self._geracao += 1
+        self._garantir_itens(len(self.linhas) + 1)
+        self._desenhar()
+
+    def _garantir_itens(self, quantidade: int):
+        """Busca páginas até ter pelo menos `quantidade` itens ou acabar os dados"""
+        self._desejado = quantidade
+        while len(self.itens) < quantidade and not self.fim_dos_dados and self._pedido is None:
+            ultimo = self.itens[-1] if self.itens else None
+            pagina = self.carregar_pagina(ultimo, self.tamanho_pagina)
+            if isinstance(pagina, Future):
+                self._pedido = pagina
+                geracao = self._geracao
+                entregar_no_tk(self, pagina, lambda resultado: self._receber_pagina(geracao, resultado))
+                return
+            self._adicionar_pagina(pagina)
+
+    def _adicionar_pagina(self, pagina: List[Dict]):
+        self.itens.extend(pagina)
+        if len(pagina) < self.tamanho_pagina:
+            self.fim_dos_dados = True
+
+    def _receber_pagina(self, geracao: int, pagina: List[Dict]):
+        if geracao != self._geracao:
+            return
+        self._pedido = None
+        self._adicionar_pagina(pagina)
+        self.mover_para(self._inicio_desejado)
+
+    def sincronizar(self, codigo: int, item: Optional[Dict]):
+        """Insere, move ou remove um único item (identificado por `codigo`) sem recarregar a lista"""
+        for indice, atual in enumerate(self.itens):
+            if atual['codigo'] == codigo:
+                del self.itens[indice]
+                break
+
+        if item is not None and (self.pertence is None or self.pertence(item)):
+            indice = self._posicao_ordenada(item)
+            # Itens que caem depois da última página carregada chegam quando ela for buscada
+            if indice < len(self.itens) or self.fim_dos_dados:
+                self.itens.insert(indice, item)
+
+        self.inicio = max(0, min(self.inicio, len(self.itens) - len(self.linhas)))
+        self._desenhar()
+
+    def _posicao_ordenada(self, item: Dict) -> int:
+        if self.chave_ordem is None:
+            return 0
+        chave = self.chave_ordem(item)
+        for indice, atual in enumerate(self.itens):
+            chave_atual = self.chave_ordem(atual)
+            if (chave > chave_atual) if self.ordem_decrescente else (chave < chave_atual):
+                return indice
+        return len(self.itens)
+
+    def mover_para(self, inicio: int):
+        visiveis = len(self.linhas)
+        self._inicio_desejado = max(0, inicio)
+        self._garantir_itens(inicio + visiveis + 1)
+        self.inicio = max(0, min(inicio, len(self.itens) - visiveis))
+        self._desenhar()
+
+    def _rolar(self, acao, valor, unidade=None):
+        if acao == "moveto":
+            self.mover_para(int(float(valor) * self._total_virtual()))
+        elif acao == "scroll":
+            passo = len(self.linhas) if unidade == "pages" else 1
+            self.mover_para(self.inicio + int(valor) * passo)
+
+    def _roda_mouse(self, event):
+        if getattr(event, "num", None) == 4 or getattr(event, "delta", 0) > 0:
+            self.mover_para(self.inicio - 1)
+        else:
+            self.mover_para(self.inicio + 1)
+
+    def _total_virtual(self) -> int:
+        # Enquanto houver páginas por buscar, reserva espaço extra para a barra não chegar ao fim
+        extra = 0 if self.fim_dos_dados else self.tamanho_pagina
+        return max(len(self.itens) + extra, 1)
+
+    def _desenhar(self):
+        for posicao, (frame, lbl, btn) in enumerate(self.linhas):
+            indice = self.inicio + posicao
+            if indice < len(self.itens):
+                lbl.configure(text=self.formatar(self.itens[indice]))
+                if btn:
+                    btn.pack(side="right", padx=5)
+                frame.grid()
+            elif posicao == 0 and not self.itens and (self._pedido or self.texto_vazio):
+                lbl.configure(text="Carregando..." if self._pedido else self.texto_vazio)
+                if btn:
+                    btn.pack_forget()
+                frame.grid()
+            else:
+                frame.grid_remove()
+
+        total = self._total_virtual()
+        self.scrollbar.set(self.inicio / total, min(1.0, (self.inicio + len(self.linhas)) / total))
+
+    def _clicar(self, posicao: int):
+        indice = self.inicio + posicao
+        if self.comando_botao and indice < len(self.itens):
+            self.comando_botao(self.itens[indice])
+
+
+class BuscaProduto(ctk.CTkFrame):
+    """Campo de busca incremental de produtos: mostra as melhores sugestões a cada tecla
+    e guarda em `codigo_selecionado` o código do produto escolhido."""
+
+    def __init__(self, master, indice, sugestoes: int = 6, **kwargs):
+        super().__init__(master, fg_color="transparent", **kwargs)
+        self.indice = indice
+        self.codigo_selecionado: Optional[int] = None
+        self.resultados = []
+
+        self.entrada = ctk.CTkEntry(self, placeholder_text="Digite o nome do produto")
+        self.entrada.pack(fill="x")
+        self.entrada.bind("<KeyRelease>", self._ao_digitar)
+        self.entrada.bind("<Return>", lambda event: self._escolher(0))
+
+        # Botões de sugestão reaproveitados a cada tecla
+        self.botoes = []
+        for posicao in range(sugestoes):
+            btn = ctk.CTkButton(self, text="", anchor="w", fg_color="transparent", height=24,
+                                command=lambda p=posicao: self._escolher(p))
+            self.botoes.append(btn)
+
+    def _ao_digitar(self, event):
+        if event.keysym in ("Return", "Up", "Down", "Tab"):
+            return
+        texto = self.entrada.get()
+        if self.codigo_selecionado is not None and texto != self.indice.nomes.get(self.codigo_selecionado):
+            self.codigo_selecionado = None
+        self.resultados = self.indice.buscar(texto, len(self.botoes)) if self.codigo_selecionado is None else []
+        self._mostrar_resultados()
+
+    def _mostrar_resultados(self):
+        for posicao, btn in enumerate(self.botoes):
+            if posicao < len(self.resultados):
+                codigo, nome = self.resultados[posicao]
+                btn.configure(text=f"{codigo} - {nome}")
+                btn.pack(fill="x")
+            else:
+                btn.pack_forget()
+
+    def _escolher(self, posicao: int):
+        if posicao >= len(self.resultados):
+            return
+        codigo, nome = self.resultados[posicao]
+        self.codigo_selecionado = codigo
+        self.entrada.delete(0, 'end')
+        self.entrada.insert(0, nome)
+        self.resultados = []
+        self._mostrar_resultados()
+
+    def limpar(self):
+        self.codigo_selecionado = None
+        self.entrada.delete(0, 'end')
+        self.resultados = []
+        self._mostrar_resultados()
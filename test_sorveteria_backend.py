@@ -0,0 +1,470 @@
+import threading
+from datetime import datetime
+
+import pytest
+
+import sorveteria_analise as analise
+
+from sorveteria_backend import SorveteriaBackend
+from sorveteria_busca import IndiceBusca
+from sorveteria_importacao import ImportadorLote
+from sorveteria_instrumentacao import Instrumentacao
+
+
+@pytest.fixture
+def backend(tmp_path):
+    banco = SorveteriaBackend(str(tmp_path / "sorveteria.db"))
+    yield banco
+    banco.conexoes.fechar()
+
+
+def _estoque(backend: SorveteriaBackend, produto_id: int) -> int:
+    return backend.conn.execute("SELECT quantidade FROM Estoque WHERE codigo_produto = ?",
+                                (produto_id,)).fetchone()[0]
+
+
+@pytest.mark.parametrize("quantidade", [0, -3])
+def test_criar_venda_recusa_quantidade_nao_positiva(backend, quantidade):
+    produto_id = backend.criar_produto("Açaí", 10.0, 3)
+
+    venda_id, erro = backend.criar_venda(produto_id, "Açaí", quantidade, 10.0)
+
+    assert venda_id is None and erro
+    assert _estoque(backend, produto_id) == 3
+    assert backend.conn.execute("SELECT COUNT(*) FROM Venda").fetchone()[0] == 0
+
+
+def test_criar_venda_lote_recusa_quantidade_nao_positiva(backend):
+    produto_id = backend.criar_produto("Açaí", 10.0, 6)
+
+    vendas, erro = backend.criar_venda_lote([
+        {"produto_id": produto_id, "quantidade": 1},
+        {"produto_id": produto_id, "quantidade": -100},
+    ])
+
+    assert vendas == [] and erro
+    assert _estoque(backend, produto_id) == 6
+    assert backend.conn.execute("SELECT COUNT(*) FROM Venda").fetchone()[0] == 0
+
+
+def test_gravacao_agrupada_recusa_quantidade_nao_positiva(backend):
+    produto_id = backend.criar_produto("Açaí", 10.0, 3)
+    grupo = backend.ativar_gravacao_agrupada()
+
+    recusada = grupo.criar_venda(produto_id, "Açaí", -3, 10.0)
+    aceita = grupo.criar_venda(produto_id, "Açaí", 1, 10.0)
+    backend.desativar_gravacao_agrupada()
+
+    assert recusada.resultado()[0] is None
+    assert aceita.resultado()[0] is not None
+    assert _estoque(backend, produto_id) == 2
+
+
+def test_gravacao_agrupada_conclui_tickets_no_commit_e_isola_falhas(backend):
+    produto_id = backend.criar_produto("Açaí", 10.0, 5)
+    grupo = backend.ativar_gravacao_agrupada(intervalo_ms=60_000)
+    concluidos = []
+
+    venda = grupo.criar_venda(produto_id, "Açaí", 2, 10.0)
+    venda.ao_concluir(concluidos.append)
+    sem_descricao = grupo.criar_despesa(None, 5.0)  # NOT NULL: IntegrityError só nesta operação
+    despesa = grupo.criar_despesa("Gelo", 5.0)
+    finalizacao = grupo.finalizar_venda(venda)
+
+    assert not any(ticket.pronto for ticket in (venda, sem_descricao, despesa, finalizacao))
+    assert backend.conn_leitura.execute("SELECT COUNT(*) FROM Venda").fetchone()[0] == 0
+
+    assert grupo.descarregar() == 4
+    venda_id, erro = venda.valor
+    assert venda_id is not None and erro is None and concluidos == [(venda_id, None)]
+    assert (sem_descricao.valor, despesa.valor, finalizacao.valor) == (False, True, True)
+    assert grupo.commits == 1
+    assert backend.obter_vendas([venda_id])[0]["status"] == "finalizada"
+
+    # O que ainda está na fila é gravado ao desativar a gravação agrupada
+    pendente = grupo.criar_despesa("Casquinhas", 12.0)
+    backend.desativar_gravacao_agrupada()
+    assert pendente.pronto and pendente.valor is True
+    despesas = backend.conn_leitura.execute("SELECT descricao FROM Despesa ORDER BY codigo").fetchall()
+    assert [linha[0] for linha in despesas] == ["Gelo", "Casquinhas"]
+
+
+def test_gravacao_agrupada_isola_qualquer_erro_do_sqlite_na_operacao(backend):
+    def falhar():
+        raise RuntimeError("disco cheio")
+    backend.conn.create_function("falhar", 0, falhar)
+    backend.conn.execute("""
+        CREATE TEMP TRIGGER trg_falha BEFORE INSERT ON Despesa WHEN NEW.descricao = 'quebra'
+        BEGIN SELECT falhar(); END
+    """)
+    produto_id = backend.criar_produto("Açaí", 10.0, 5)
+    grupo = backend.ativar_gravacao_agrupada(intervalo_ms=60_000)
+
+    venda = grupo.criar_venda(produto_id, "Açaí", 1, 10.0)
+    quebrada = grupo.criar_despesa("quebra", 1.0)  # OperationalError, não IntegrityError
+    despesa = grupo.criar_despesa("Gelo", 5.0)
+    grupo.descarregar()
+
+    assert venda.valor[0] is not None and (quebrada.valor, despesa.valor) == (False, True)
+    assert [linha[0] for linha in backend.conn.execute("SELECT descricao FROM Despesa")] == ["Gelo"]
+    assert _estoque(backend, produto_id) == 4
+
+
+def test_notificacoes_trazem_tabela_e_codigos_alterados(backend):
+    notificacoes = []
+    backend.adicionar_ouvinte(lambda tabela, codigos: notificacoes.append((tabela, codigos)))
+
+    produto_id = backend.criar_produto("Açaí", 10.0, 5)
+    vendido = backend.criar_produto("Picolé", 5.0, 5)
+    backend.atualizar_produto(produto_id, "Açaí 500ml", 12.0, 5)
+    backend.atualizar_estoque(produto_id, 3)
+    venda_id, _ = backend.criar_venda(vendido, "Picolé", 1, 5.0)
+    backend.finalizar_venda(venda_id)
+    backend.excluir_produto(produto_id)
+    backend.excluir_produto(vendido)  # Recusada (tem venda): nada gravado, nada notificado
+
+    assert notificacoes == [
+        ("Produto", [produto_id]), ("Produto", [vendido]),
+        ("Produto", [produto_id]),
+        ("Estoque", [produto_id]),
+        ("Venda", [venda_id]), ("Estoque", [vendido]),
+        ("Venda", [venda_id]),
+        ("Produto", [produto_id]),
+    ]
+
+
+def test_prever_ruptura_ignora_produtos_sem_venda(backend):
+    vendido = backend.criar_produto("Picolé", 5.0, 20)
+    parado = backend.criar_produto("Pote", 30.0, 20)
+    parado_baixo = backend.criar_produto("Cobertura", 8.0, 2)
+    backend.criar_venda(vendido, "Picolé", 14, 5.0)
+    backend.criar_venda(parado, "Pote", -3, 30.0)  # Recusada: não entra na média
+
+    previsoes = backend.prever_ruptura(janela_dias=7)
+
+    assert [previsao['codigo'] for previsao in previsoes] == [vendido]
+    assert previsoes[0]['media_diaria'] == 2.0
+    assert previsoes[0]['dias_ate_acabar'] == 3.0
+
+    alertas = {alerta['codigo']: alerta for alerta in backend.alertas_estoque()}
+    assert set(alertas) == {vendido, parado_baixo}
+    assert alertas[parado_baixo]['dias_ate_acabar'] is None
+
+
+def test_aberturas_simultaneas_migram_uma_vez(tmp_path):
+    caminho = str(tmp_path / "sorveteria.db")
+    largada = threading.Barrier(4)
+    erros, versoes = [], []
+
+    def abrir():
+        largada.wait()
+        try:
+            banco = SorveteriaBackend(caminho)
+            versoes.append(banco.conn.execute("PRAGMA user_version").fetchone()[0])
+            banco.conexoes.fechar()
+        except Exception as e:  # Qualquer falha na abertura reprova o teste
+            erros.append(e)
+
+    threads = [threading.Thread(target=abrir) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert erros == []
+    assert versoes == [len(SorveteriaBackend.MIGRACOES)] * 4
+
+
+def test_consultas_sem_varredura_completa(backend):
+    # Uma consulta nova ou alterada que precise percorrer uma tabela inteira falha aqui;
+    # as varreduras esperadas ficam em SorveteriaBackend.VARREDURAS_ESPERADAS
+    assert backend.consultas_com_varredura() == []
+
+
+def test_varredura_aponta_o_comando_que_o_metodo_executa(backend):
+    # O plano vem do SQL que excluir_produto roda: sem o índice, a busca de vendas vira SCAN
+    backend.conn.execute("DROP INDEX idx_venda_produto")
+    backend.conn.commit()
+    assert backend.consultas_com_varredura() == ["excluir_produto (vendas do produto)"]
+
+
+def _indices(backend: SorveteriaBackend) -> set:
+    return {linha[0] for linha in backend.conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+
+
+def test_importacao_grava_cada_lote_sem_tirar_indices_de_venda(backend):
+    produto_id = backend.criar_produto("Açaí", 10.0, 3)
+    antes = _indices(backend)
+    vistos_pelo_leitor = set()
+    vendas_no_meio = []
+
+    def linhas():
+        for numero in range(1, 4):
+            yield numero, {"codigo_produto": produto_id, "quantidade": 1, "preco_unitario": 10.0,
+                           "data": "2024-01-0" + str(numero)}
+            # No meio da importação, quem lê pela outra conexão vê os índices e os lotes já gravados
+            vistos_pelo_leitor.update(linha[0] for linha in backend.conn_leitura.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index'"))
+            vendas_no_meio.append(backend.conn_leitura.execute("SELECT COUNT(*) FROM Venda").fetchone()[0])
+        raise OSError("arquivo truncado")
+
+    with pytest.raises(OSError):
+        ImportadorLote(backend, tamanho_lote=1).importar_vendas(linhas())
+
+    assert vistos_pelo_leitor == antes
+    assert vendas_no_meio == [1, 2, 3]  # Lote de uma linha: gravado antes da próxima ser lida
+    assert _indices(backend) == antes
+    assert backend.conn.execute("SELECT COUNT(*) FROM Venda").fetchone()[0] == 3
+
+
+def test_importacao_com_indices_adiados_os_recria_no_fim(backend):
+    produto_id = backend.criar_produto("Açaí", 10.0, 3)
+    antes = _indices(backend)
+
+    resultado = ImportadorLote(backend, tamanho_lote=2, adiar_indices=True).importar_vendas(iter([
+        (numero, {"codigo_produto": produto_id, "quantidade": 1, "preco_unitario": 10.0, "data": "2024-01-01"})
+        for numero in range(1, 6)
+    ]))
+
+    assert resultado["importadas"] == 5
+    assert _indices(backend) == antes
+
+
+def test_abertura_recria_indices_ausentes(tmp_path):
+    caminho = str(tmp_path / "sorveteria.db")
+    banco = SorveteriaBackend(caminho)
+    banco.conn.execute("DROP INDEX idx_venda_periodo")
+    banco.conn.execute("DROP INDEX idx_venda_produto")
+    banco.conn.commit()
+    banco.conexoes.fechar()
+
+    banco = SorveteriaBackend(caminho)
+    try:
+        assert banco.indices_recriados == ["idx_venda_periodo", "idx_venda_produto"]
+        assert set(banco.indices_esperados()) <= _indices(banco)
+    finally:
+        banco.conexoes.fechar()
+
+
+def test_caixas_simultaneos_nao_vendem_alem_do_estoque(tmp_path):
+    caminho = str(tmp_path / "sorveteria.db")
+    banco = SorveteriaBackend(caminho)
+    inicial = 300
+    produto_id = banco.criar_produto("Picolé", 5.0, inicial)
+    largada = threading.Barrier(3)
+    vendidas, erros = [], []
+
+    def caixa(quantidade):
+        # Cada caixa tem a sua conexão, como processos separados disputando o mesmo banco
+        outro = SorveteriaBackend(caminho)
+        try:
+            largada.wait()
+            unidades = 0
+            while True:
+                venda_id, erro = outro.criar_venda(produto_id, "Picolé", quantidade, 5.0)
+                if venda_id is not None:
+                    unidades += quantidade
+                elif erro == "Estoque insuficiente" and quantidade > 1:
+                    quantidade = 1  # Ainda pode sobrar uma unidade para este caixa
+                elif erro == "Estoque insuficiente":
+                    break
+                else:
+                    erros.append(erro)
+                    break
+            vendidas.append(unidades)
+        finally:
+            outro.conexoes.fechar()
+
+    threads = [threading.Thread(target=caixa, args=(quantidade,)) for quantidade in (1, 2, 3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    try:
+        final = _estoque(banco, produto_id)
+        registradas = banco.conn.execute("SELECT COALESCE(SUM(quantidade), 0) FROM Venda").fetchone()[0]
+    finally:
+        banco.conexoes.fechar()
+    assert erros == []
+    assert final >= 0
+    assert final == inicial - sum(vendidas) == inicial - registradas
+
+
+def test_instrumentacao_mede_a_iteracao_dos_geradores(backend):
+    for nome in ("Açaí", "Cascão", "Picolé"):
+        backend.criar_produto(nome, 5.0, 10)
+    instrumentacao = Instrumentacao()
+    backend.instrumentar(instrumentacao)
+
+    produtos = backend.iter_produtos(tamanho_lote=1)
+    assert "iter_produtos" not in instrumentacao.metodos  # Só criar o gerador não é uma chamada
+    assert [produto.nome for produto in produtos] == ["Açaí", "Cascão", "Picolé"]
+    interrompido = backend.iter_produtos(tamanho_lote=1)
+    next(interrompido)
+    interrompido.close()
+
+    metrica = instrumentacao.metodos["iter_produtos"]
+    assert metrica.chamadas == 2
+    assert metrica.linhas == 4
+    assert metrica.erros == 0
+
+
+def test_calcular_resumo_totais_gerais_e_do_periodo(backend):
+    produto_id = backend.criar_produto("Açaí", 10.0, 10)
+    ImportadorLote(backend).importar_vendas(iter([
+        (1, {"codigo_produto": produto_id, "quantidade": 5, "preco_unitario": 10.0, "data": "2020-03-01"}),
+    ]))
+    venda_id, _ = backend.criar_venda(produto_id, "Açaí", 2, 10.0)
+    backend.finalizar_venda(venda_id)
+    backend.criar_despesa("Gelo", 15.0)
+
+    padrao = backend.calcular_resumo()
+    so_2020 = backend.calcular_resumo("2020-01-01", "2020-12-31")
+
+    # Totais de todo o histórico, qualquer que seja o período
+    for resumo in (padrao, so_2020):
+        assert resumo["total_vendas"] == 70.0
+        assert resumo["total_despesas"] == 15.0
+        assert resumo["lucro"] == 55.0
+    assert padrao["data_fim"] == datetime.now().strftime("%Y-%m-%d")
+    assert padrao["vendas_hoje"] == padrao["vendas_periodo"] == 20.0
+    assert padrao["lucro_periodo"] == 5.0
+    assert so_2020["vendas_periodo"] == 50.0 and so_2020["vendas_hoje"] == 0.0
+
+    # A reconstrução a partir do histórico chega aos mesmos totais
+    assert backend.reconstruir_resumo_diario()
+    assert backend.calcular_resumo()["total_vendas"] == 70.0
+
+
+def test_venda_recebe_a_promocao_de_maior_desconto(backend):
+    hoje = datetime.now().strftime("%Y-%m-%d")
+    picole = backend.criar_produto("Picolé de Uva", 10.0, 10, categoria="Picolé")
+    outro_picole = backend.criar_produto("Picolé de Limão", 10.0, 10, categoria="Picolé")
+    pote = backend.criar_produto("Pote 1L", 30.0, 10, categoria="Pote")
+    geral = backend.criar_promocao("Semana do sorvete", 10, hoje, hoje)
+    backend.criar_promocao("Picolés", 20, hoje, hoje, categoria="Picolé")
+    do_produto = backend.criar_promocao("Uva", 30, hoje, hoje, codigo_produto=picole)
+    backend.criar_promocao("Encerrada", 50, "2000-01-01", "2000-01-31", codigo_produto=pote)
+    # Empata com a do produto, que ganha por ser mais específica; para o outro picolé, vale esta
+    empate = backend.criar_promocao("Picolés em dobro", 30, hoje, hoje, categoria="Picolé")
+
+    vendas = [backend.criar_venda(picole, "Picolé de Uva", 2, 10.0)[0],
+              backend.criar_venda(outro_picole, "Picolé de Limão", 1, 10.0)[0],
+              backend.criar_venda(pote, "Pote 1L", 3, 30.0)[0]]
+    gravadas = {venda["codigo"]: venda for venda in backend.obter_vendas(vendas)}
+
+    assert [(gravadas[codigo]["codigo_promocao"], gravadas[codigo]["valor_total"]) for codigo in vendas] == [
+        (do_produto, 14.0), (empate, 7.0), (geral, 81.0)]
+    venda_id, erro = backend.criar_venda(pote, "Pote 1L", 1, 30.0, codigo_promocao=empate)
+    assert venda_id is None and erro
+
+
+def test_estoque_em_parte_da_fotografia_e_reconciliacao_aponta_divergencia(backend):
+    relogio = {"agora": "2024-01-01 10:00:00"}
+    backend._agora = lambda: relogio["agora"]
+    produto_id = backend.criar_produto("Açaí", 10.0, 10)
+    relogio["agora"] = "2024-01-02 10:00:00"
+    backend.criar_venda(produto_id, "Açaí", 3, 10.0)
+    relogio["agora"] = "2024-01-03 10:00:00"
+    backend.atualizar_estoque(produto_id, 5, "reposicao")
+    relogio["agora"] = "2024-01-04 10:00:00"
+    assert backend.criar_snapshot_estoque() == 1
+    relogio["agora"] = "2024-01-05 10:00:00"
+    backend.atualizar_estoque(produto_id, -2, "perda")
+
+    assert [backend.estoque_em(dia)[produto_id] for dia in
+            ("2024-01-01", "2024-01-02", "2024-01-03", "2024-01-04", "2024-01-05")] == [10, 7, 12, 12, 10]
+    assert backend.estoque_em()[produto_id] == _estoque(backend, produto_id) == 10
+    assert backend.reconciliar_estoque() == []
+
+    # Depois da fotografia, o livro anterior a ela não é relido
+    backend.conn.execute("DELETE FROM MovimentoEstoque WHERE momento < '2024-01-04'")
+    backend.conn.commit()
+    assert backend.estoque_em()[produto_id] == 10
+
+    # Uma alteração no Estoque que não passou pelo livro aparece na reconciliação
+    backend.conn.execute("UPDATE Estoque SET quantidade = 8 WHERE codigo_produto = ?", (produto_id,))
+    backend.conn.commit()
+    assert backend.reconciliar_estoque() == [
+        {"codigo_produto": produto_id, "estoque": 8, "livro": 10, "diferenca": -2}]
+
+
+def test_busca_por_prefixo_sem_acento_trigrama_e_indice_atualizado(backend):
+    indice = IndiceBusca()
+    acai = backend.criar_produto("Açaí com Granola", 15.0, 5)
+    sorvete = backend.criar_produto("Sorvete de Chocolate", 12.0, 5)
+    picole = backend.criar_produto("Picolé de Limão", 5.0, 5)
+    indice.carregar(backend.listar_produtos())
+
+    def ao_mudar_dados(tabela, codigos):  # Como o app: relê só os produtos notificados
+        if tabela == "Produto":
+            indice.sincronizar(codigos, backend.obter_produtos(codigos))
+    backend.adicionar_ouvinte(ao_mudar_dados)
+
+    assert indice.buscar("acai") == [(acai, "Açaí com Granola")]
+    assert indice.buscar("SORV choc") == [(sorvete, "Sorvete de Chocolate")]
+    assert indice.buscar("pic lim") == [(picole, "Picolé de Limão")]
+    assert indice.buscar("colat") == [(sorvete, "Sorvete de Chocolate")]  # Meio da palavra
+    assert indice.buscar("chocolatr") == [(sorvete, "Sorvete de Chocolate")]  # Erro de digitação
+    assert indice.buscar("xyz") == []
+
+    novo = backend.criar_produto("Milk-shake de Morango", 14.0, 5)
+    backend.atualizar_produto(picole, "Picolé de Maracujá", 5.0, 5)
+
+    assert indice.buscar("milk") == [(novo, "Milk-shake de Morango")]
+    assert indice.buscar("pic marac") == [(picole, "Picolé de Maracujá")]
+    assert indice.buscar("limao") == []
+
+
+def test_analise_agrega_vendas_do_periodo_e_periodo_vazio(backend):
+    acai = backend.criar_produto("Açaí", 10.0, 0)
+    pote = backend.criar_produto("Pote", 15.0, 0)
+    promocao = backend.criar_promocao("Segunda do açaí", 50, "2024-06-10", "2024-06-10", codigo_produto=acai)
+    vendas = [  # (produto, quantidade, valor_total, data, hora, status, promoção); 2024-06-01 é um sábado
+        (acai, 2, 20.0, "2024-06-03", "10:15:00", "finalizada", None),
+        (acai, 1, 10.0, "2024-06-10", "10:40:00", "finalizada", promocao),
+        (pote, 3, 45.0, "2024-06-14", "15:05:00", "finalizada", None),
+        (pote, 5, 100.0, "2024-06-14", "16:00:00", "aberta", None),      # Não finalizada: fica de fora
+        (acai, 9, 99.0, "2024-05-31", "10:00:00", "finalizada", None),   # Antes do período
+    ]
+    resultado = ImportadorLote(backend).importar_vendas(iter(
+        (numero, {"codigo_produto": produto, "quantidade": quantidade, "preco_unitario": valor / quantidade,
+                  "valor_total": valor, "data": data, "hora": hora, "status": status,
+                  "codigo_promocao": codigo_promocao})
+        for numero, (produto, quantidade, valor, data, hora, status, codigo_promocao) in enumerate(vendas, 1)
+    ))
+    assert resultado["importadas"] == len(vendas)
+
+    periodo = analise.carregar_vendas(backend, "2024-06-01", "2024-06-14")
+
+    assert analise.resumo(periodo) == {"receita": 75.0, "vendas": 3, "unidades": 6, "ticket_medio": 25.0}
+    horas = {linha["hora"]: (linha["receita"], linha["vendas"]) for linha in analise.por_hora(periodo)}
+    assert len(horas) == 24 and horas[10] == (30.0, 2) and horas[15] == (45.0, 1)
+    assert sum(receita for receita, _ in horas.values()) == 75.0
+    dias = {linha["dia"]: (linha["receita"], linha["vendas"]) for linha in analise.por_dia_semana(periodo)}
+    assert dias == {"seg": (30.0, 2), "ter": (0.0, 0), "qua": (0.0, 0), "qui": (0.0, 0), "sex": (45.0, 1),
+                    "sáb": (0.0, 0), "dom": (0.0, 0)}
+    calor = analise.mapa_calor(periodo)["receita"]
+    assert calor[0][10] == 30.0 and calor[4][15] == 45.0 and sum(map(sum, calor)) == 75.0
+    assert [(linha["codigo_produto"], linha["nome"], linha["receita"], linha["unidades"], linha["vendas"])
+            for linha in analise.mais_vendidos(periodo)] == [(pote, "Pote", 45.0, 3, 1),
+                                                             (acai, "Açaí", 30.0, 3, 2)]
+    assert [linha["codigo_produto"] for linha in analise.mais_vendidos(periodo, por="unidades")] == [acai, pote]
+    assert analise.por_promocao(periodo) == [
+        {"codigo_promocao": None, "receita": 65.0, "unidades": 5, "vendas": 2},
+        {"codigo_promocao": promocao, "receita": 10.0, "unidades": 1, "vendas": 1}]
+    assert analise.por_semana(periodo) == [
+        {"inicio": "2024-06-01", "fim": "2024-06-07", "receita": 20.0, "vendas": 1},
+        {"inicio": "2024-06-08", "fim": "2024-06-14", "receita": 55.0, "vendas": 2}]
+    assert analise.comparar_semanas(periodo)["variacao_percentual"] == 175.0
+
+    vazio = analise.carregar_vendas(backend, "2024-07-01", "2024-07-07")
+
+    assert len(vazio) == 0
+    assert analise.resumo(vazio) == {"receita": 0.0, "vendas": 0, "unidades": 0, "ticket_medio": 0.0}
+    assert all(linha["vendas"] == 0 for linha in analise.por_hora(vazio) + analise.por_dia_semana(vazio))
+    assert analise.mais_vendidos(vazio) == [] and analise.por_promocao(vazio) == []
+    assert analise.por_semana(vazio) == [
+        {"inicio": "2024-07-01", "fim": "2024-07-07", "receita": 0.0, "vendas": 0}]
+    assert analise.comparar_semanas(vazio)["variacao_percentual"] is None
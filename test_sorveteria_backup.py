@@ -0,0 +1,81 @@
+import os
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from sorveteria_backend import SorveteriaBackend
+from sorveteria_backup import BackupPeriodico, arquivos_do_snapshot, fazer_snapshot, listar_snapshots, verificar
+from sorveteria_importacao import ImportadorLote
+
+
+@pytest.fixture
+def banco_com_arquivo(tmp_path):
+    caminho = str(tmp_path / "sorveteria.db")
+    backend = SorveteriaBackend(caminho)
+    produto_id = backend.criar_produto("Açaí", 10.0, 3)
+    ImportadorLote(backend).importar_vendas(iter([
+        (1, {"codigo_produto": produto_id, "quantidade": 2, "preco_unitario": 10.0, "data": "2023-05-01"}),
+        (2, {"codigo_produto": produto_id, "quantidade": 1, "preco_unitario": 10.0, "data": "2024-02-10"}),
+    ]))
+    assert backend.arquivar_vendas(antes_de="2025-01-01") == {2023: 1, 2024: 1}
+    yield caminho
+    backend.conexoes.fechar()
+
+
+def test_snapshot_inclui_arquivos_de_vendas(banco_com_arquivo, tmp_path):
+    pasta = str(tmp_path / "backups")
+
+    resultado = fazer_snapshot(banco_com_arquivo, pasta, pausa_s=0)
+
+    assert resultado["ok"] and resultado["arquivos_ausentes"] == []
+    copias = arquivos_do_snapshot(resultado["destino"])
+    assert [os.path.basename(copia) for copia in copias] == resultado["arquivos"]
+    assert [copia.rsplit("-", 1)[1] for copia in copias] == ["2023.db.gz", "2024.db.gz"]
+    assert all(verificar(copia) == [] for copia in copias)
+    assert [caminho for _, caminho in listar_snapshots(pasta)] == [resultado["destino"]]
+
+
+def test_rotacao_remove_arquivos_da_fotografia_expirada(banco_com_arquivo, tmp_path):
+    pasta = str(tmp_path / "backups")
+    agora = datetime(2025, 3, 1, 12)
+    antigo = fazer_snapshot(banco_com_arquivo, pasta, pausa_s=0, agora=agora - timedelta(days=2))
+
+    novo = fazer_snapshot(banco_com_arquivo, pasta, pausa_s=0, horarios=1, diarios=1, agora=agora)
+
+    assert novo["removidos"] == [os.path.basename(antigo["destino"])]
+    assert sorted(os.listdir(pasta)) == sorted([os.path.basename(novo["destino"])] + novo["arquivos"])
+
+
+def _esperar_ultimo(backups: BackupPeriodico, limite_s: float = 5.0):
+    prazo = time.monotonic() + limite_s
+    while backups.ultimo is None and time.monotonic() < prazo:
+        time.sleep(0.01)
+    return backups.ultimo
+
+
+def test_backup_periodico_fotografa_ao_iniciar(banco_com_arquivo, tmp_path):
+    pasta = str(tmp_path / "backups")
+    backups = BackupPeriodico(banco_com_arquivo, pasta, intervalo_s=3600, pausa_s=0)
+    backups.iniciar()
+    try:
+        resultado = _esperar_ultimo(backups)
+    finally:
+        backups.encerrar()
+
+    assert resultado is not None and resultado["ok"]
+    assert len(listar_snapshots(pasta)) == 1
+
+
+def test_backup_periodico_espera_se_a_ultima_fotografia_e_recente(banco_com_arquivo, tmp_path):
+    pasta = str(tmp_path / "backups")
+    fazer_snapshot(banco_com_arquivo, pasta, pausa_s=0)
+    backups = BackupPeriodico(banco_com_arquivo, pasta, intervalo_s=3600, pausa_s=0)
+    backups.iniciar()
+    try:
+        resultado = _esperar_ultimo(backups, limite_s=0.3)
+    finally:
+        backups.encerrar()
+
+    assert resultado is None
+    assert len(listar_snapshots(pasta)) == 1
@@ -0,0 +1,57 @@
+import csv
+
+import pytest
+
+from sorveteria_backend import SorveteriaBackend
+from sorveteria_exportacao import exportar_incremental, iterar_lotes
+from sorveteria_importacao import ImportadorLote
+
+
+@pytest.fixture
+def backend(tmp_path):
+    backend = SorveteriaBackend(str(tmp_path / "sorveteria.db"))
+    yield backend
+    backend.conexoes.fechar()
+
+
+def _importar(backend: SorveteriaBackend, produto_id: int, datas):
+    ImportadorLote(backend).importar_vendas(iter(
+        (numero, {"codigo_produto": produto_id, "quantidade": 1, "preco_unitario": 10.0, "data": data})
+        for numero, data in enumerate(datas, 1)
+    ))
+
+
+def test_lotes_de_vendas_saem_por_arquivo_e_sem_ordenar_o_union(backend):
+    produto_id = backend.criar_produto("Açaí", 10.0, 10)
+    _importar(backend, produto_id, ["2023-05-01", "2024-02-10", "2025-03-01"])
+    assert backend.arquivar_vendas(antes_de="2025-01-01") == {2023: 1, 2024: 1}
+
+    lotes = list(iterar_lotes(backend, "Venda", tamanho_lote=1))
+
+    assert [(linha[0], linha[6]) for lote in lotes for linha in lote] == [
+        (1, "2023-05-01"), (2, "2024-02-10"), (3, "2025-03-01")]
+    assert not backend.conn_leitura.in_transaction
+    for fonte, condicao in backend._fontes_vendas(""):
+        plano = backend.conn_leitura.execute(
+            f"EXPLAIN QUERY PLAN SELECT codigo FROM {fonte} NOT INDEXED WHERE {condicao} AND codigo > 0 "
+            f"AND data >= '2023-01-01' ORDER BY codigo").fetchall()
+        assert [linha[3] for linha in plano] == [f"SEARCH {fonte} USING INTEGER PRIMARY KEY (rowid>?)"]
+
+
+def test_incremental_espera_a_venda_aberta_e_a_exporta_finalizada(backend, tmp_path):
+    produto_id = backend.criar_produto("Açaí", 10.0, 10)
+    aberta, _ = backend.criar_venda(produto_id, "Açaí", 1, 10.0)
+    seguinte, _ = backend.criar_venda(produto_id, "Açaí", 1, 10.0)
+    backend.finalizar_venda(seguinte)
+    estado = str(tmp_path / "estado.json")
+
+    primeira, _ = exportar_incremental(backend, "Venda", str(tmp_path / "1.csv"), estado)
+    backend.finalizar_venda(aberta)
+    segunda, ultimo = exportar_incremental(backend, "Venda", str(tmp_path / "2.csv"), estado)
+
+    assert primeira["linhas"] == 0
+    assert segunda["linhas"] == 2 and ultimo == {"Venda": seguinte}
+    with open(segunda["destino"], encoding="utf-8") as arquivo:
+        linhas = list(csv.DictReader(arquivo))
+    assert [(int(linha["codigo"]), linha["status"]) for linha in linhas] == [
+        (aberta, "finalizada"), (seguinte, "finalizada")]